@@ -3,23 +3,38 @@
 
 
 from . import sshim
-from . import run_command, logger
+from . import host, logger
 from .ipmicons.command import Command_Handler
-from .ipmicons.common import msg_queue
 
-import re, shlex, threading
 from datetime import datetime
 
-class IPMI_CONSOLE(threading.Thread):
+# ssh console server settings
+CONSOLE_PORT = 9300
+CONSOLE_BACKLOG = 128
+CONSOLE_MAX_CONNECTIONS = 512
+# close sessions without input for half an hour
+CONSOLE_IDLE_TIMEOUT = 1800
+CONSOLE_WORKERS = 4
+# workers of ssh exec batches, apart from those of sessions
+CONSOLE_EXEC_WORKERS = 2
+
+
+class IPMI_CONSOLE(object):
+    """
+    One ipmi-console session. sshim hands over each input line, the
+    session has no thread of its own.
+    """
     WELCOME = 'You have connected to the test server.'
     PROMPT = "IPMI_SIM> "
+    event_driven = True
+
     def __init__(self, script):
-        threading.Thread.__init__(self)
         self.history = []
         self.script = script
         self.command_handler = Command_Handler()
         self.response = ''
-        self.start()
+        self.welcome()
+        self.prompt()
 
     def welcome(self):
         self.script.writeline(self.WELCOME)
@@ -33,47 +48,67 @@ class IPMI_CONSOLE(threading.Thread):
 
     def usingHandler(self, cmd):
         """ Using the Command_Handler from command module to handle command."""
-        self.command_handler.handle_command(cmd)
-        while msg_queue.empty() is False:
-            self.writeresponse(msg_queue.get())
-
-    def run(self):
-        self.welcome()
-        while True:
-            self.response = ""
-            self.prompt()
-            groups = {}
-            try:
-                groups = self.script.expect(re.compile('(?P<input>.*)')).groupdict()
-                cmdline = groups['input'].encode('ascii', 'ignore')
-            except:
-                continue
-
-            if not cmdline or len(cmdline) == 0:
-                continue
-
-            try:
+        response = self.command_handler.handle_command(cmd)
+        self.writeresponse(response.getvalue())
+
+    @classmethod
+    def execute(cls, command):
+        """
+        Run the commands of an ssh exec request, one per line, e.g.
+            ssh -p 9300 <host> 'run /tmp/fault_scenario'
+        :return: framed output of all commands and exit status
+        """
+        command_handler = Command_Handler()
+        cmdlines = command.encode('ascii', 'ignore').splitlines()
+        response = command_handler.handle_batch(cmdlines)
+        return response.getvalue(), 0
+
+    def handle_line(self, line):
+        """
+        Run one command line, return False to end the session.
+        """
+        self.response = ""
+        try:
+            cmdline = line.encode('ascii', 'ignore')
+        except:
+            cmdline = ''
+
+        try:
+            if cmdline and len(cmdline.split()):
                 cmd = cmdline.split()[0]
 
                 if cmd.upper() == 'EXIT' \
                         or cmd.upper() == 'QUIT':
                     self.script.writeline("Quit!")
-                    break
+                    return False
 
-                self.command_handler.handle_command(cmdline)
-                while msg_queue.empty() is False:
-                    self.writeresponse(msg_queue.get())
+                self.usingHandler(cmdline)
 
                 if len(self.response):
                     lines = self.response.split('\n')
                     for line in lines:
                         self.script.writeline(line)
-            except:
-                continue
-
 
-def start_console():
-    server = sshim.Server(IPMI_CONSOLE, port=9300)
+                # quit/exit in a pipeline, e.g. 'sensor info; quit'
+                if self.command_handler.quit_requested:
+                    self.script.writeline("Quit!")
+                    return False
+        except:
+            logger.exception('ipmi-console command failed: ' + cmdline)
+
+        self.prompt()
+        return True
+
+
+def start_console(port=CONSOLE_PORT, backlog=CONSOLE_BACKLOG,
+                  max_connections=CONSOLE_MAX_CONNECTIONS,
+                  idle_timeout=CONSOLE_IDLE_TIMEOUT,
+                  workers=CONSOLE_WORKERS,
+                  exec_workers=CONSOLE_EXEC_WORKERS):
+    server = sshim.Server(IPMI_CONSOLE, port=port, backlog=backlog,
+                          max_connections=max_connections,
+                          idle_timeout=idle_timeout, workers=workers,
+                          exec_workers=exec_workers)
     try:
         logger.info("ipmi-console start")
         server.run()
@@ -81,11 +116,10 @@ def start_console():
         server.stop()
 
 def stop_console():
-    console_stop_cmd = "pkill ipmi-console"
-    code, reason = run_command(console_stop_cmd, True, None, None)
-    if code == 0:
+    # other ipmi-console processes, this one is never among them
+    if host.pkill("ipmi-console"):
         logger.info("ipmi-console stop")
     else:
-        logger.error(reason)
+        logger.error("no ipmi-console is running")
 
 
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Host helpers run in process, in place of a shell and a command each:
+
+    which           PATH resolution, as which(1)
+    find_processes  /proc scanner, by process name and command line
+    find_task       process of a pid file, checked against its command line
+    listens_on      whether a process has a TCP port open for connections
+    pidof, pkill    on top of find_processes
+    uname           kernel name and release, as uname -sr
+    Netlink         rtnetlink link management, as ip link
+"""
+
+import errno
+import os
+import signal
+import socket
+import struct
+
+PROC = "/proc"
+SYS_CLASS_NET = "/sys/class/net"
+
+
+def which(command):
+    """
+    Locate command as the shell would
+    :param command: a name to look up in PATH, or a path
+    :return: path of the executable, or None
+    """
+    def is_executable(path):
+        return os.path.isfile(path) and os.access(path, os.X_OK)
+
+    if os.path.dirname(command):
+        return command if is_executable(command) else None
+    for directory in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        path = os.path.join(directory or os.curdir, command)
+        if is_executable(path):
+            return path
+    return None
+
+
+def read_cmdline(pid):
+    """
+    :return: arguments of process pid, None if it is gone; a kernel
+        thread or zombie has none
+    """
+    try:
+        with open(os.path.join(PROC, str(pid), "cmdline"), "r") as f:
+            cmdline = f.read()
+    except IOError:
+        return None
+    return cmdline.split("\0")[:-1]
+
+
+def read_comm(pid):
+    try:
+        with open(os.path.join(PROC, str(pid), "comm"), "r") as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def match_process(pid, name=None, match=()):
+    """
+    True if process pid runs name, with every string of match in its
+    command line. name is matched against the program run, or its first
+    15 characters, which is all the kernel keeps as comm.
+    """
+    args = read_cmdline(pid)
+    if not args:
+        return False
+    if name is not None and os.path.basename(args[0]) != name and \
+            read_comm(pid) != name[:15]:
+        return False
+    cmdline = " ".join(args)
+    for text in match:
+        if text not in cmdline:
+            return False
+    return True
+
+
+def find_processes(name=None, match=()):
+    """
+    Scan /proc for processes
+    :param name: program the process runs, any if None
+    :param match: strings its command line has to contain, e.g. the
+        config file of one node, to tell nodes apart
+    :return: pids, in ascending order
+    """
+    pids = []
+    own_pid = os.getpid()
+    for entry in os.listdir(PROC):
+        if not entry.isdigit() or int(entry) == own_pid:
+            continue
+        if match_process(entry, name, match):
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def find_task(pid_file, name=None, match=()):
+    """
+    Process of a task: the pid in its pid file if that process still
+    runs name and matches, so a reused pid is not taken for it;
+    otherwise the processes /proc has that do
+    :return: pids
+    """
+    try:
+        with open(pid_file, "r") as f:
+            pid = f.readline().strip()
+    except IOError:
+        pid = ""
+    if pid.isdigit() and match_process(pid, name, match):
+        return [int(pid)]
+    return find_processes(name, match)
+
+
+def pidof(name):
+    return find_processes(name)
+
+
+def kill(pids, signum=signal.SIGTERM):
+    """
+    Signal processes, those gone already are skipped
+    :return: pids signaled
+    """
+    killed = []
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+        else:
+            killed.append(pid)
+    return killed
+
+
+def pkill(name, match=(), signum=signal.SIGTERM):
+    return kill(find_processes(name, match), signum)
+
+
+def get_listen_inodes(port):
+    """
+    :return: inodes of the TCP sockets listening on port
+    """
+    inodes = set()
+    for table in ("tcp", "tcp6"):
+        try:
+            with open(os.path.join(PROC, "net", table), "r") as f:
+                lines = f.readlines()[1:]
+        except IOError:
+            continue
+        for line in lines:
+            fields = line.split()
+            # local address as hex ip:port, 0A is TCP_LISTEN
+            if int(fields[1].split(":")[1], 16) == port and \
+                    fields[3] == "0A":
+                inodes.add(fields[9])
+    return inodes
+
+
+def listens_on(pid, port):
+    """
+    True if process pid holds a socket listening on TCP port, so that a
+    server answering on port is known to be that process
+    """
+    inodes = get_listen_inodes(port)
+    if not inodes:
+        return False
+    fd_dir = os.path.join(PROC, str(pid), "fd")
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return False
+    for fd in fds:
+        try:
+            link = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if link.startswith("socket:[") and link[8:-1] in inodes:
+            return True
+    return False
+
+
+def uname():
+    """
+    Kernel name and release, as uname -sr prints them
+    """
+    info = os.uname()
+    return "{} {}".format(info[0], info[2])
+
+
+def get_ifindex(name):
+    """
+    :return: index of link name
+    Raise OSError if there is no such link
+    """
+    try:
+        with open(os.path.join(SYS_CLASS_NET, name, "ifindex"), "r") as f:
+            return int(f.read())
+    except IOError:
+        raise OSError(errno.ENODEV, "Cannot find device {}".format(name))
+
+
+class Netlink(object):
+    """
+    Link management over a rtnetlink socket. Each request waits for the
+    kernel to acknowledge it and raises OSError with the errno the
+    kernel returns, e.g. EEXIST for a link that exists already.
+    """
+
+    NETLINK_ROUTE = 0
+    NLMSG_ERROR = 2
+    RTM_NEWLINK = 16
+    RTM_DELLINK = 17
+    NLM_F_REQUEST = 0x1
+    NLM_F_ACK = 0x4
+    NLM_F_EXCL = 0x200
+    NLM_F_CREATE = 0x400
+    IFLA_ADDRESS = 1
+    IFLA_IFNAME = 3
+    IFLA_LINK = 5
+    IFLA_LINKINFO = 18
+    IFLA_INFO_KIND = 1
+    IFLA_INFO_DATA = 2
+    IFLA_MACVLAN_MODE = 1
+    MACVLAN_MODES = {"private": 1, "vepa": 2, "bridge": 4, "passthru": 8}
+    IFF_UP = 0x1
+    IFF_PROMISC = 0x100
+
+    # nlmsghdr, ifinfomsg, rtattr and nlmsgerr of linux/netlink.h and
+    # linux/rtnetlink.h
+    header = struct.Struct("=IHHII")
+    ifinfo = struct.Struct("=BxHiII")
+    attr_header = struct.Struct("=HH")
+    error = struct.Struct("=i")
+
+    def __init__(self):
+        self.__sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                    self.NETLINK_ROUTE)
+        self.__sock.bind((0, 0))
+        self.__seq = 0
+
+    def close(self):
+        self.__sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def attr(cls, attr_type, payload):
+        """
+        A rtattr, padded to 4 bytes
+        """
+        length = cls.attr_header.size + len(payload)
+        return cls.attr_header.pack(length, attr_type) + payload + \
+            "\0" * (-length % 4)
+
+    @classmethod
+    def pack_link(cls, index=0, flags=0, change=0, name=None, link=None,
+                  kind=None, data="", address=None):
+        """
+        ifinfomsg and attributes of a link request
+        :param address: mac address as aa:bb:cc:dd:ee:ff
+        """
+        message = cls.ifinfo.pack(socket.AF_UNSPEC, 0, index, flags, change)
+        if name is not None:
+            message += cls.attr(cls.IFLA_IFNAME, name + "\0")
+        if link is not None:
+            message += cls.attr(cls.IFLA_LINK, struct.pack("=I", link))
+        if address is not None:
+            message += cls.attr(cls.IFLA_ADDRESS,
+                                "".join([chr(int(x, 16)) for x in
+                                         address.split(":")]))
+        if kind is not None:
+            info = cls.attr(cls.IFLA_INFO_KIND, kind)
+            if data:
+                info += cls.attr(cls.IFLA_INFO_DATA, data)
+            message += cls.attr(cls.IFLA_LINKINFO, info)
+        return message
+
+    def request(self, message_type, flags, payload):
+        self.__seq += 1
+        message = self.header.pack(self.header.size + len(payload),
+                                   message_type,
+                                   flags | self.NLM_F_REQUEST | self.NLM_F_ACK,
+                                   self.__seq, 0) + payload
+        self.__sock.sendto(message, (0, 0))
+        while True:
+            data = self.__sock.recv(65536)
+            offset = 0
+            while offset + self.header.size <= len(data):
+                length, reply_type, reply_flags, seq, port = \
+                    self.header.unpack_from(data, offset)
+                if seq == self.__seq and reply_type == self.NLMSG_ERROR:
+                    code = -self.error.unpack_from(
+                        data, offset + self.header.size)[0]
+                    if code:
+                        raise OSError(code, os.strerror(code))
+                    return
+                if length < self.header.size:
+                    break
+                offset += (length + 3) & ~3
+
+    def add_link(self, name, kind, link=None, data="", address=None):
+        """
+        Create a link, as ip link add
+        :param link: parent link, for a macvtap or vlan
+        :param data: IFLA_INFO_DATA attributes of the kind
+        """
+        self.request(self.RTM_NEWLINK, self.NLM_F_CREATE | self.NLM_F_EXCL,
+                     self.pack_link(name=name, kind=kind, data=data,
+                                    address=address,
+                                    link=get_ifindex(link)
+                                    if link is not None else None))
+
+    def add_macvtap(self, name, link, mode="bridge", address=None):
+        self.add_link(name, "macvtap", link,
+                      self.attr(self.IFLA_MACVLAN_MODE,
+                                struct.pack("=I", self.MACVLAN_MODES[mode])),
+                      address)
+
+    def set_link(self, name, up=None, promisc=None, address=None):
+        """
+        Change a link, as ip link set; None leaves a setting as it is
+        """
+        flags = change = 0
+        for value, flag in ((up, self.IFF_UP),
+                            (promisc, self.IFF_PROMISC)):
+            if value is not None:
+                change |= flag
+                if value:
+                    flags |= flag
+        self.request(self.RTM_NEWLINK, 0,
+                     self.pack_link(get_ifindex(name), flags, change,
+                                    address=address))
+
+    def delete_link(self, name):
+        self.request(self.RTM_DELLINK, 0,
+                     self.pack_link(get_ifindex(name)))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Facts about the host that precheck, version and numa control need,
+probed once and kept in a cache file shared by all infrasim commands:
+
+    binaries    path of each command looked up, and its version output
+    kvm         whether /dev/kvm is there
+    numa        cpus and numa nodes numactl binds to, cpus of each node
+
+A binary is checked against its mtime and inode on every lookup, one
+stat, and probed again once it changed. Everything else holds till the
+next boot, the cache of another boot id is dropped as a whole.
+"""
+
+import json
+import os
+import subprocess
+import threading
+from . import logger, host
+
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+KVM_DEVICE = "/dev/kvm"
+# arguments that make a command print its version
+VERSION_ARGS = {"qemu-system-x86_64": ["--version"],
+                "ipmi_sim": ["-v"],
+                "socat": ["-V"]}
+
+
+def get_inventory_path():
+    return os.path.join(os.environ["HOME"], ".infrasim", "inventory.json")
+
+
+def read_boot_id():
+    try:
+        with open(BOOT_ID_FILE, "r") as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def run_output(args):
+    """
+    Output of a command, whatever its exit code, None if it can't run
+    """
+    try:
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+    except OSError:
+        return None
+    return proc.communicate()[0]
+
+
+class Inventory(object):
+    """
+    Cached facts of the host. Facts are loaded from the cache file on
+    first use and written back whenever one is probed. Thread safe.
+    """
+
+    def __init__(self, path=None):
+        self.__path = path
+        self.__facts = None
+        self.__lock = threading.RLock()
+
+    def get_path(self):
+        return self.__path or get_inventory_path()
+
+    def load(self):
+        boot_id = read_boot_id()
+        try:
+            with open(self.get_path(), "r") as f:
+                facts = json.load(f)
+        except (IOError, ValueError):
+            facts = {}
+        if not isinstance(facts, dict) or facts.get("boot_id") != boot_id:
+            facts = {"boot_id": boot_id}
+        facts.setdefault("binaries", {})
+        self.__facts = facts
+
+    def save(self):
+        """
+        Write the cache in one rename, so a reader never sees it half
+        written. A cache that can't be written is only logged.
+        """
+        path = self.get_path()
+        tmp_path = "{}.{}".format(path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(tmp_path, "w") as f:
+                json.dump(self.__facts, f, indent=2, sort_keys=True)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            logger.warning("[inventory] fail to write {}: {}".
+                           format(path, e))
+
+    def get_facts(self):
+        with self.__lock:
+            if self.__facts is None:
+                self.load()
+            return self.__facts
+
+    def invalidate(self):
+        """
+        Forget all facts, they are probed again when asked for
+        """
+        with self.__lock:
+            self.__facts = {"boot_id": read_boot_id(), "binaries": {}}
+            self.save()
+
+    def get_binary(self, command):
+        """
+        Cached facts of a binary, probed again if it changed
+        :return: {"path", "mtime", "inode", "version"}, None if there is
+            no such command
+        """
+        with self.__lock:
+            binaries = self.get_facts()["binaries"]
+            binary = binaries.get(command)
+            if binary is not None:
+                try:
+                    st = os.stat(binary["path"])
+                except OSError:
+                    st = None
+                if st is not None and st.st_mtime == binary["mtime"] and \
+                        st.st_ino == binary["inode"]:
+                    return binary
+
+            path = host.which(command)
+            if path is None:
+                if binaries.pop(command, None) is not None:
+                    self.save()
+                return None
+            st = os.stat(path)
+            binary = {"path": path,
+                      "mtime": st.st_mtime,
+                      "inode": st.st_ino,
+                      "version": None}
+            binaries[command] = binary
+            self.save()
+            return binary
+
+    def which(self, command):
+        """
+        Path of command, as host.which, from the cache while it holds
+        """
+        binary = self.get_binary(command)
+        return binary["path"] if binary is not None else None
+
+    def get_version(self, command):
+        """
+        Version output of command, run once per binary
+        :return: the output, None if there is no such command
+        """
+        with self.__lock:
+            binary = self.get_binary(command)
+            if binary is None:
+                return None
+            if binary["version"] is None:
+                args = VERSION_ARGS.get(os.path.basename(binary["path"]),
+                                        ["--version"])
+                binary["version"] = run_output([binary["path"]] + args) or ""
+                self.save()
+            return binary["version"]
+
+    def has_kvm(self):
+        with self.__lock:
+            facts = self.get_facts()
+            if "kvm" not in facts:
+                facts["kvm"] = os.path.exists(KVM_DEVICE)
+                self.save()
+            return facts["kvm"]
+
+    def get_numa(self):
+        """
+        numa topology as numactl shows it
+        :return: {"cpus": cpus it binds to, "nodes": nodes it binds to,
+            "node_cpus": [[node, cpus]]}, None without numactl
+        """
+        with self.__lock:
+            facts = self.get_facts()
+            binary = self.get_binary("numactl")
+            if binary is None:
+                return None
+            numa = facts.get("numa")
+            if numa is not None and numa.get("inode") == binary["inode"] \
+                    and numa.get("mtime") == binary["mtime"]:
+                return numa
+            numa = self.probe_numa(binary["path"])
+            numa["inode"] = binary["inode"]
+            numa["mtime"] = binary["mtime"]
+            facts["numa"] = numa
+            self.save()
+            return numa
+
+    @staticmethod
+    def probe_numa(numactl):
+        cpus = []
+        nodes = []
+        for line in (run_output([numactl, "--show"]) or "").split(os.linesep):
+            if line.startswith("physcpubind:"):
+                cpus = [int(x) for x in line.split(':')[1].strip().split()]
+
+            if line.startswith("nodebind:"):
+                nodes = [int(x) for x in line.split(':')[1].strip().split()]
+
+        node_cpus = []
+        hardware = (run_output([numactl, "--hardware"]) or "").\
+            split(os.linesep)
+        for node_index in nodes:
+            node_cpu_list = []
+            for line in hardware:
+                if line.startswith("node {} cpus:".format(node_index)):
+                    node_cpu_list = [int(x) for x in
+                                     line.split(':')[1].strip().split()]
+            node_cpus.append([node_index, node_cpu_list])
+        return {"cpus": cpus, "nodes": nodes, "node_cpus": node_cpus}
+
+
+inventory = Inventory()
@@ -3,26 +3,40 @@
 
 import os
 import yaml
-from . import run_command, logger, ArgsNotCorrect, CommandNotFound, CommandRunFailed, VM_DEFAULT_CONFIG
-from model import CBMC, CNode
+from . import logger, host, ArgsNotCorrect, CommandNotFound, CommandRunFailed, VM_DEFAULT_CONFIG
+from model import CBMC, CNode, Utility
+from inventory import inventory
 
 
 def get_ipmi():
-    try:
-        code, ipmi_cmd = run_command("which /usr/local/bin/ipmi_sim")
-        return ipmi_cmd.strip(os.linesep)
-    except CommandRunFailed as e:
+    ipmi_cmd = inventory.which("/usr/local/bin/ipmi_sim")
+    if ipmi_cmd is None:
         raise CommandNotFound("/usr/local/bin/ipmi_sim")
+    return ipmi_cmd
 
 
 def status_ipmi():
-    try:
-        run_command("pidof ipmi_sim")
+    if host.pidof("ipmi_sim"):
         print "InfraSim IPMI service is running"
-    except CommandRunFailed as e:
+    else:
         print "Infrasim IPMI service is stopped"
 
 
+def build_bmc(conf):
+    """
+    CBMC of the node of conf, as start_ipmi runs it
+    """
+    bmc = CBMC(conf.get('bmc', {}))
+    node_name = conf["name"] if "name" in conf else "node-0"
+    bmc.set_task_name("{}-bmc".format(node_name))
+    bmc.set_log_path("/var/log/infrasim/{}/openipmi.log".
+                     format(node_name))
+    bmc.set_type(conf["type"])
+    bmc.set_workspace("{}/.infrasim/{}".format(os.environ["HOME"], node_name))
+    bmc.init()
+    return bmc
+
+
 def start_ipmi(conf_file=VM_DEFAULT_CONFIG):
     try:
         with open(conf_file, 'r') as f_yml:
@@ -33,19 +47,14 @@ def start_ipmi(conf_file=VM_DEFAULT_CONFIG):
             node.set_node_name(conf["name"])
         node.init_workspace()
 
-        bmc = CBMC(conf.get('bmc', {}))
-        node_name = conf["name"] if "name" in conf else "node-0"
-        bmc.set_task_name("{}-bmc".format(node_name))
-        bmc.set_log_path("/var/log/infrasim/{}/openipmi.log".
-                         format(node_name))
-        bmc.set_type(conf["type"])
-        bmc.set_workspace(node.workspace)
-        bmc.init()
+        bmc = build_bmc(conf)
         bmc.write_bmc_config()
         bmc.precheck()
         cmd = bmc.get_commandline()
         logger.debug(cmd)
-        run_command(cmd+" &", True, None, None)
+        pid = Utility.execute_command(cmd, log_path=bmc.get_log_path(),
+                                      ready=bmc.is_ready)
+        bmc.set_task_pid(pid)
 
         logger.info("bmc start")
     except CommandRunFailed as e:
@@ -57,9 +66,23 @@ def start_ipmi(conf_file=VM_DEFAULT_CONFIG):
 
 
 def stop_ipmi(conf_file=VM_DEFAULT_CONFIG):
-    ipmi_stop_cmd = "pkill ipmi_sim"
+    """
+    Stop the ipmi_sim of the node of conf_file only, the one running its
+    config file
+    """
     try:
-        run_command(ipmi_stop_cmd, True, None, None)
+        with open(conf_file, 'r') as f_yml:
+            conf = yaml.load(f_yml)
+    except IOError as e:
+        logger.error("ipmi stop failed: {}".format(e))
+        return
+    bmc = build_bmc(conf)
+    pid_file = os.path.join(bmc.get_workspace(),
+                            ".{}".format(bmc.get_task_name()))
+    pids = host.kill(host.find_task(pid_file, "ipmi_sim",
+                                    ["-c {} ".format(bmc.get_config_file())]))
+    bmc.set_task_pid(None)
+    if pids:
         logger.info("ipmi stopped")
-    except CommandRunFailed as e:
+    else:
         logger.error("ipmi stop failed")
@@ -3,26 +3,61 @@
 Copyright @ 2015 EMC Corporation All Rights Reserved
 *********************************************************
 '''
-from .common import logger, msg_queue
-from .sdr import sensor_id_map
+from .common import logger, Response
+from .metrics import metrics, STATS_FILE
+from .registry import sensor_registry, DEFAULT_MC
 from .sel import SEL
 
 import common
+import flood
 import sel
 import re
+import collections
+import json
+import time
 
 
 # can be achievable by multiprocessing.managers
 
+# output of a batch, each command is framed as
+#   === [<n>] <command>
+#   <output of the command>
+# and the batch ends with
+#   === <count> commands
+BATCH_HEADER = "=== [{0}] {1}\n"
+BATCH_FOOTER = "=== {0} commands\n"
+
 
 class Command_Handler:
+    """
+    Command handler of one console session. Output of the command
+    being handled goes to self.response, a new one per command.
+    """
     def __init__(self):
         self.command_history = []
+        self.response = Response()
+        # 'text' or 'json', see handle_output
+        self.output_format = 'text'
+        # structured result of the command being handled, for json
+        self.result = None
+        # output of the command is framed by handle_batch already
+        self.framed = False
+        # quit/exit was among the commands of a pipeline
+        self.quit_requested = False
 
     def add_msg(self, msg):
         logger.info(msg)
 
-    def get_sensor_instance(self, str_num, mc=int("0x20", 16)):
+    def put_result(self, item):
+        """
+        Add an item to the result of the command, which is its output
+        in json format
+        """
+        if self.result is None:
+            self.result = []
+        self.result.append(item)
+
+    def get_sensor_instance(self, str_num, mc=DEFAULT_MC):
         """
         return sensor instance if the sensor exist
         otherwise return None
@@ -33,31 +68,57 @@ class Command_Handler:
             logger.error('illegal sensor id %s' % str_num)
             return None
 
-        if (sensor_id, mc) not in sensor_id_map:
+        sensor_obj = sensor_registry.get(sensor_id, mc)
+        if sensor_obj is None:
             error_info = "sensor: {0} not exist\n".format(str_num)
-            msg_queue.put(error_info)
+            self.response.put(error_info)
             return None
 
-        return sensor_id_map[(sensor_id, mc)]
+        return sensor_obj
+
+    def get_sensor_instances(self, selector):
+        """
+        return sensors selected by a sensor id, or by a query such as
+        type=fan&name=Fan1*, see registry.parse_query
+        """
+        if '=' not in selector:
+            sensor_obj = self.get_sensor_instance(selector)
+            if sensor_obj is None:
+                return []
+            return [sensor_obj]
+
+        try:
+            sensors = sensor_registry.query(selector)
+        except ValueError as e:
+            self.response.put("{0}\n".format(e))
+            return []
+        if not sensors:
+            self.response.put("no sensor matches {0}\n".format(selector))
+        return sensors
 
     # args contain the sensor id list
     def output_sensors(self, args):
-        for str_num in args:
-            sensor_obj = self.get_sensor_instance(str_num)
-            if sensor_obj is None:
+        for selector in args:
+            sensors = self.get_sensor_instances(selector)
+            if not sensors:
                 return
-            info = sensor_obj.output_info()
-            info += '\n'
-            msg_queue.put(info)
+            for sensor_obj in sensors:
+                self.output_sensor_info(sensor_obj)
+
+    def output_sensor_info(self, sensor_obj):
+        if self.output_format == 'json':
+            self.put_result(sensor_obj.get_info())
+            return
+        info = sensor_obj.output_info()
+        info += '\n'
+        self.response.put(info)
 
     def dump_all_sensor_info(self):
         """
         dump all sensor info
         """
-        for ID, sensor_obj in sensor_id_map.items():
-            info = sensor_obj.output_info()
-            info += '\n'
-            msg_queue.put(info)
+        for sensor_obj in sensor_registry.get_all():
+            self.output_sensor_info(sensor_obj)
 
     def dump_sensor_info(self, args):
         if len(args) == 0:
@@ -66,67 +127,87 @@ class Command_Handler:
 
     def set_sensor_mode(self, args):
         if len(args) < 2:
-            msg_queue.put(self.handle_sensor_mode.__doc__+'\n')
+            self.response.put(self.handle_sensor_mode.__doc__+'\n')
             return
 
-        sensor_obj = self.get_sensor_instance(args[0])
-        if sensor_obj is None:
-            return
+        for sensor_obj in self.get_sensor_instances(args[0]):
+            if self.set_mode_of(sensor_obj, args) is False:
+                return
 
+    def set_mode_of(self, sensor_obj, args):
+        """
+        set mode of one sensor, return False on illegal args
+        """
         # sensor mode check
         mode = args[1]
         if mode not in ['user', 'auto', 'fault']:
-            msg_queue.put(self.handle_sensor_mode.__doc__+'\n')
+            self.response.put(self.handle_sensor_mode.__doc__+'\n')
+            return False
+
+        # discrete sensors have no readings to make up, other sensors of
+        # a query still change
+        try:
+            sensor_obj.check_mode(mode)
+        except ValueError as e:
+            self.response.put("{0}\n".format(e))
             return
 
         # if mode is fault, we also need specify the fault level
         if mode == 'fault':
             if len(args) < 3:
-                msg_queue.put(self.handle_sensor_mode.__doc__+'\n')
-                return
+                self.response.put(self.handle_sensor_mode.__doc__+'\n')
+                return False
 
             fault_level = args[2]
             if fault_level not in ['lnr', 'lc', 'lnc', 'unc', 'uc', 'unr']:
-                msg_queue.put(self.handle_sensor_mode.__doc__+'\n')
-                return
+                self.response.put(self.handle_sensor_mode.__doc__+'\n')
+                return False
+
+            # the fault is set by the sensor scheduler, warn here
+            # since there is no session to answer by then
+            if not sensor_obj.has_threshold(fault_level):
+                self.response.put("WARN: Sensor " + str(sensor_obj.get_name())
+                                  + " did not cross " + fault_level
+                                  + " threshold since it does not exist\n")
 
             sensor_obj.set_fault_level(fault_level)
 
-        pre_mode = sensor_obj.get_mode()
+        # in auto mode, an optional update interval in seconds
+        if mode == 'auto' and len(args) > 2:
+            try:
+                sensor_obj.set_interval(float(args[2]))
+            except ValueError:
+                self.response.put(self.handle_sensor_mode.__doc__+'\n')
+                return False
+
+        # the sensor scheduler picks up the mode change
         sensor_obj.set_mode(mode)
-        if (mode == "auto" or mode == 'fault') and pre_mode == "user":
-            logger.info('set to auto mode and wakeup sensor thread')
-            # notify the sensor thread
-            sensor_obj.condition.acquire()
-            sensor_obj.condition.notify()
-            sensor_obj.condition.release()
         sensor_name = sensor_obj.get_name()
         info = "Sensor " + str(sensor_name) + " changed to " + mode + '\n'
-        msg_queue.put(info)
+        self.response.put(info)
 
     def get_sensor_mode(self, args):
         if len(args) != 1:
-            msg_queue.put(self.handle_sensor_mode.__doc__+'\n')
+            self.response.put(self.handle_sensor_mode.__doc__+'\n')
             return
 
-        sensor_obj = self.get_sensor_instance(args[0])
-        if sensor_obj is None:
-            return
-        sensor_mode = sensor_obj.get_mode()
-        sensor_name = sensor_obj.get_name()
-        info = "Sensor " + sensor_name + " mode: " + sensor_mode + '\n'
-        msg_queue.put(info)
-        self.add_msg(info)
+        for sensor_obj in self.get_sensor_instances(args[0]):
+            sensor_mode = sensor_obj.get_mode()
+            sensor_name = sensor_obj.get_name()
+            info = "Sensor " + sensor_name + " mode: " + sensor_mode + '\n'
+            self.response.put(info)
+            self.add_msg(info)
 
     # ######### SENSOR MODE MAIN FUNCTION ##########
     def handle_sensor_mode(self, args):
         """
         Available 'sensor mode' commands:
             sensor mode set <sensorID> <user|auto|fault> <lnr | lc | lnc | unc | uc | unr>
+            sensor mode set <sensorID> auto <interval in seconds>
             sensor mode get <sensorID>
         """
         if len(args) == 0:
-            msg_queue.put(self.handle_sensor_mode.__doc__+'\n')
+            self.response.put(self.handle_sensor_mode.__doc__+'\n')
             return
         if args[0] == "set":
             self.set_sensor_mode(args[1:])
@@ -135,6 +216,64 @@ class Command_Handler:
         else:
             return
 
+    # ######### SENSOR SUPPRESS FUNCTIONS ##########
+    def set_sensor_suppress(self, args):
+        if len(args) != 4:
+            self.response.put(self.handle_sensor_suppress.__doc__+'\n')
+            return
+
+        for sensor_obj in self.get_sensor_instances(args[0]):
+            if sensor_obj.get_event_type() != 'threshold':
+                self.response.put("Sensor {0} is not a threshold sensor\n".
+                                  format(sensor_obj.get_name()))
+                continue
+
+            try:
+                sensor_obj.set_suppression(int(args[1], 0), int(args[2], 0),
+                                           float(args[3]))
+            except ValueError:
+                self.response.put(self.handle_sensor_suppress.__doc__+'\n')
+                return
+            info = "Sensor {0} suppression: min delta {1}, hysteresis {2}, " \
+                "max rate {3}\n".format(sensor_obj.get_name(), args[1],
+                                        args[2], args[3])
+            self.response.put(info)
+
+    def get_sensor_suppress(self, args):
+        if len(args) == 0:
+            total = sum([sensor_obj.get_suppressed()
+                         for sensor_obj in sensor_registry])
+            self.response.put("Suppressed writes: {0}\n".format(total))
+            return
+
+        for sensor_obj in [sensor_obj for selector in args
+                           for sensor_obj in
+                           self.get_sensor_instances(selector)]:
+            min_delta, hysteresis, max_rate = sensor_obj.get_suppression()
+            info = "Sensor {0} suppression: min delta {1}, hysteresis {2}, " \
+                "max rate {3}, suppressed writes: {4}\n".\
+                format(sensor_obj.get_name(), min_delta, hysteresis,
+                       max_rate, sensor_obj.get_suppressed())
+            self.response.put(info)
+
+    def handle_sensor_suppress(self, args):
+        """
+        Available 'sensor suppress' commands:
+            sensor suppress set <sensorID> <min delta> <hysteresis> <max rate>
+                min delta and hysteresis in raw counts, max rate in writes
+                per second, 0 to turn off; applies to auto mode readings
+            sensor suppress get [<sensorID> ...]
+        """
+        if len(args) == 0:
+            self.response.put(self.handle_sensor_suppress.__doc__+'\n')
+            return
+        if args[0] == "set":
+            self.set_sensor_suppress(args[1:])
+        elif args[0] == "get":
+            self.get_sensor_suppress(args[1:])
+        else:
+            return
+
     # ######### SET SENSOR VALUE FUNCTION ##########
     def set_sensor_value(self, args):
         """
@@ -143,34 +282,60 @@ class Command_Handler:
         :param args:
             - <sensor id>, <sensor value>: set value to the id
             - <sensor id>, state, <state id>, 1|0: set state bit to 1 or 0
+            - <sensor id>, states, <state id>=1|0, ...: set several state
+              bits in one go
+            a query, e.g. type=fan, may take the place of the sensor id
         """
-        sensor_obj = self.get_sensor_instance(args[0])
-        if sensor_obj is None:
+        if len(args) == 0:
+            self.response.put(self.handle_sensor_value.__doc__+'\n')
             return
 
+        for sensor_obj in self.get_sensor_instances(args[0]):
+            if self.set_value_of(sensor_obj, args) is False:
+                return
+
+    def set_value_of(self, sensor_obj, args):
+        """
+        set value of one sensor, return False on illegal args
+        """
         # switch to "user" mode if in "auto" mode
         if sensor_obj.get_mode() == "auto":
             sensor_obj.set_mode("user")
-            sensor_obj.condition.acquire()
-            sensor_obj.condition.notify()
-            sensor_obj.condition.release()
+
+        # <sensor id>, states, <state id>=1|0, ...: set several state bits
+        if len(args) > 2 and args[1].lower() == 'states':
+            if sensor_obj.get_event_type() != 'discrete':
+                info = 'Set state bit is for discrete sensor only, sensor: {} is {}'.\
+                    format(args[0], sensor_obj.get_event_type())
+                self.response.put(info)
+                logger.info(info)
+                return
+            states = []
+            for arg in args[2:]:
+                state_id, sep, state_bit = arg.partition('=')
+                if not sep or not state_id.isdigit() \
+                        or int(state_id) not in range(0, 15) \
+                        or state_bit not in ['1', '0']:
+                    self.response.put(self.handle_sensor_value.__doc__+'\n')
+                    return False
+                states.append((int(state_id), int(state_bit)))
+            sensor_obj.set_states(states)
 
         # <sensor id>, <sensor value>: set value to the id
-        if len(args) == 2:
+        elif len(args) == 2:
 
             if sensor_obj.get_event_type() == 'threshold':
                 try:
                     analog_value = float(args[1])
                 except:
                     error_info = 'illgel sensor value: {0}\n'.format(args[1])
-                    msg_queue.put(error_info)
+                    self.response.put(error_info)
                     self.add_msg(error_info)
-                    return
+                    return False
 
-                formula = sensor_obj.get_reading_factor()[1]
-                raw_value = int(formula(analog_value))
-                info = 'sensor name: {0} formula: {1}. raw value: {2}\n'.\
-                    format(sensor_obj.get_name(), formula, raw_value)
+                raw_value = sensor_obj.get_raw_value(analog_value)
+                info = 'sensor name: {0} raw value: {1}\n'.\
+                    format(sensor_obj.get_name(), hex(raw_value))
                 logger.info(info)
 
                 sensor_obj.set_threshold_value(raw_value)
@@ -180,15 +345,15 @@ class Command_Handler:
                 try:
                     int(args[1], 16)
                 except ValueError:
-                    msg_queue.put(self.handle_sensor_value.__doc__+'\n')
-                    return
+                    self.response.put(self.handle_sensor_value.__doc__+'\n')
+                    return False
                 if args[1].lower().startswith("0x") and len(args[1]) == 6:
                     raw_value = args[1]
                 elif not args[1].lower().startswith("0x") and len(args[1]) == 4:
                     raw_value = "0x"+args[1]
                 else:
-                    msg_queue.put(self.handle_sensor_value.__doc__+'\n')
-                    return
+                    self.response.put(self.handle_sensor_value.__doc__+'\n')
+                    return False
                 info = 'sensor name: {0} raw value: {1}\n'.\
                     format(sensor_obj.get_name(), raw_value)
                 logger.info(info)
@@ -199,21 +364,21 @@ class Command_Handler:
             if sensor_obj.get_event_type() != 'discrete':
                 info = 'Set state bit is for discrete sensor only, sensor: {} is {}'.\
                     format(args[0], sensor_obj.get_event_type())
-                msg_queue.put(info)
+                self.response.put(info)
                 logger.info(info)
                 return
             if args[1].lower() != 'state' \
                     or int(args[2]) not in range(0, 15) \
                     or args[3] not in ['1', '0']:
-                msg_queue.put(self.handle_sensor_value.__doc__+'\n')
-                return
+                self.response.put(self.handle_sensor_value.__doc__+'\n')
+                return False
 
             # Set bit for discrete sensor
             sensor_obj.set_state(int(args[2]), int(args[3]))
 
         else:
-            msg_queue.put(self.handle_sensor_value.__doc__+'\n')
-            return
+            self.response.put(self.handle_sensor_value.__doc__+'\n')
+            return False
 
 
 
@@ -222,28 +387,38 @@ class Command_Handler:
         """
         Get sensor value from sensor object, NOT from openipmi data
         structure.
-        :param args: <sensor id>
+        :param args: <sensor id> or a query, e.g. name=PSU*
         """
         if len(args) != 1:
-            msg_queue.put(self.handle_sensor_value.__doc__+'\n')
+            self.response.put(self.handle_sensor_value.__doc__+'\n')
             return
 
-        sensor_obj = self.get_sensor_instance(args[0])
-        if sensor_obj is None:
+        for sensor_obj in self.get_sensor_instances(args[0]):
+            self.output_sensor_value(sensor_obj)
+
+    def output_sensor_value(self, sensor_obj):
+        if self.output_format == 'json':
+            info = sensor_obj.get_info()
+            result = dict([(key, info[key]) for key in
+                           ("name", "id", "mc", "event_type", "value",
+                            "unit")])
+            if info["event_type"] == 'discrete':
+                states = sensor_obj.get_states()
+                result["states"] = [state for state in range(0, 15)
+                                    if states & (1 << state)]
+            self.put_result(result)
             return
-
         raw_value = sensor_obj.get_value()
         if sensor_obj.get_event_type() == 'threshold':
-            formula = sensor_obj.get_reading_factor()[0]
-            value = '%.3f' % formula(raw_value)
+            value = '%.3f' % sensor_obj.get_analog_value(raw_value)
             info = "{0} : {1} {2}\n".format(sensor_obj.get_name(),
                                             value, sensor_obj.get_unit())
             self.add_msg(info)
-            msg_queue.put(info)
+            self.response.put(info)
         elif sensor_obj.get_event_type() == 'discrete':
-            info = "{} : {}".format(sensor_obj.get_name(), raw_value)
+            info = "{} : {}\n".format(sensor_obj.get_name(), raw_value)
             self.add_msg(info)
-            msg_queue.put(info)
+            self.response.put(info)
 
     # ######### SENSOR VALUE FUNCTIONS ##########
     def handle_sensor_value(self, args):
@@ -251,10 +426,11 @@ class Command_Handler:
         Available 'sensor value' commands:
             set: set <sensor id> <value>
                  set <sensor id> state <state id> 1|0
+                 set <sensor id> states <state id>=1|0 [<state id>=1|0 ...]
             get: get <sensor id>
         """
         if len(args) == 0:
-            msg_queue.put(self.handle_sensor_value.__doc__+'\n')
+            self.response.put(self.handle_sensor_value.__doc__+'\n')
             return
         if args[0] == "set":
             self.set_sensor_value(args[1:])
@@ -267,11 +443,11 @@ class Command_Handler:
     def handle_sensor_command(self, args):
         """
         Available sensor commands:
-            info mode value
+            info mode value suppress
         """
         if len(args) == 0:
             self.add_msg(self.handle_sensor_command.__doc__+'\n')
-            msg_queue.put(self.handle_sensor_command.__doc__+'\n')
+            self.response.put(self.handle_sensor_command.__doc__+'\n')
             return
         if args[0] == "info":
             self.dump_sensor_info(args[1:])
@@ -279,10 +455,25 @@ class Command_Handler:
             self.handle_sensor_mode(args[1:])
         elif args[0] == "value":
             self.handle_sensor_value(args[1:])
+        elif args[0] == "suppress":
+            self.handle_sensor_suppress(args[1:])
         else:
             return
 
     # ######### SEL FUNCTIONS ##########
+    def check_sel_bytes(self, args):
+        """
+        check every record byte of args is in 0x0-0xff, return False and
+        answer with an error if not
+        """
+        for arg in args:
+            if not 0 <= int(arg, 16) <= 0xff:
+                error_info = 'illegal sel byte: {0}\n'.format(arg)
+                self.response.put(error_info)
+                self.add_msg(error_info)
+                return False
+        return True
+
     def set_oem_sel(self, args):
         try:
             record_type = int(args[0], 16)
@@ -292,7 +483,7 @@ class Command_Handler:
 
         if record_type == 0x02:
             if len(args) != 9:
-                msg_queue.put(self.handle_sel_command.__doc__ + '\n')
+                self.response.put(self.handle_sel_command.__doc__ + '\n')
                 return
             try:
                 gid_1 = int(args[1], 16)
@@ -306,6 +497,8 @@ class Command_Handler:
             except ValueError:
                 logger.error('illegal data format\n')
                 return
+            if not self.check_sel_bytes(args[1:]):
+                return
             sel_obj = SEL()
             sel_obj.set_sensor_type(sensor_type)
             sel_obj.set_gid_1(gid_1)
@@ -319,12 +512,12 @@ class Command_Handler:
             return
         elif record_type >= 0xC0 and record_type <= 0xDF:
             if len(args) != 7:
-                msg_queue.put(self.handle_sel_command.__doc__ + '\n')
+                self.response.put(self.handle_sel_command.__doc__ + '\n')
                 return
             sel_obj = sel.OEM_SEL_C0_DF()
         elif record_type >= 0xE0 and record_type <= 0xFF:
             if len(args) != 14:
-                msg_queue.put(self.handle_sel_command.__doc__ + '\n')
+                self.response.put(self.handle_sel_command.__doc__ + '\n')
                 return
             sel_obj = sel.OEM_SEL_E0_FF()
         else:
@@ -337,8 +530,10 @@ class Command_Handler:
         except ValueError:
             logger.error('illegal data format\n')
             return
+        if not self.check_sel_bytes(args[1:]):
+            return
 
-        sel_obj.set_sensor_type(record_type)
+        sel_obj.set_record_type(record_type)
         sel_obj.set_oem_defined_bytes(elements)
         sel_obj.send_event()
 
@@ -347,7 +542,7 @@ class Command_Handler:
         add SEL entry for a particular sensor or OEM sensor
         """
         if len(args) < 3:
-            msg_queue.put(self.handle_sel_command.__doc__ + '\n')
+            self.response.put(self.handle_sel_command.__doc__ + '\n')
             self.add_msg(self.handle_sel_command.__doc__ + '\n')
             return
 
@@ -369,29 +564,154 @@ class Command_Handler:
         action = args[2]
 
         if action == 'assert':
-            sensor_obj.set_sel(event_id, 0)
+            sensor_obj.set_sel(event_id, 0, response=self.response)
         elif action == 'deassert':
-            sensor_obj.set_sel(event_id, 1)
+            sensor_obj.set_sel(event_id, 1, response=self.response)
         else:
-            msg_queue.put(self.handle_sel_command.__doc__ + '\n')
+            self.response.put(self.handle_sel_command.__doc__ + '\n')
             self.add_msg(self.handle_sel_command.__doc__ + '\n')
 
     def get_sel(self, args):
         if len(args) != 1:
-            msg_queue.put(self.handle_sel_command.__doc__+'\n')
+            self.response.put(self.handle_sel_command.__doc__+'\n')
             return
 
         sensor_obj = self.get_sensor_instance(args[0])
         if sensor_obj is None:
             return
 
-        sensor_obj.get_sel()
+        if self.output_format == 'json':
+            events = sensor_obj.get_sel_events(response=self.response)
+            if events is not None:
+                self.put_result({"name": sensor_obj.get_name(),
+                                 "id": hex(sensor_obj.get_num()),
+                                 "events": [{"id": event_id,
+                                             "description": description}
+                                            for event_id, description
+                                            in events]})
+            return
+        sensor_obj.get_sel(response=self.response)
+
+    # ######### SEL FLOOD FUNCTIONS ##########
+    def parse_sel_event(self, args):
+        """
+        Build the event of <sensorID> <event_id> [<'assert'/'deassert'>]
+        Return None and say why if it is illegal.
+        """
+        if len(args) not in (2, 3):
+            self.response.put(self.handle_sel_flood.__doc__ + '\n')
+            return None
+        sensor_obj = self.get_sensor_instance(args[0])
+        if sensor_obj is None:
+            return None
+        try:
+            event_id = int(args[1])
+        except ValueError:
+            self.response.put('illegal event id {0}\n'.format(args[1]))
+            return None
+        action = args[2] if len(args) == 3 else 'assert'
+        if action not in ('assert', 'deassert'):
+            self.response.put(self.handle_sel_flood.__doc__ + '\n')
+            return None
+        event = flood.build_event(sensor_obj, event_id,
+                                  0 if action == 'assert' else 1)
+        if event is None:
+            self.response.put('sensor {0} has no event {1}\n'.
+                              format(args[0], event_id))
+        return event
+
+    def build_flood_events(self, args):
+        """
+        Build the events of a flood from a template, sensors or a file
+        """
+        if args[0] == 'template':
+            event = self.parse_sel_event(args[1:])
+            return [event] if event is not None else []
+        elif args[0] == 'sensors' and len(args) == 2:
+            return flood.build_sensor_events(
+                self.get_sensor_instances(args[1]))
+        elif args[0] == 'file' and len(args) == 2:
+            lines = self.read_script(args[1:])
+            if isinstance(lines, str):
+                self.response.put(lines)
+                return []
+            events = []
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                event = self.parse_sel_event(line.split())
+                if event is None:
+                    return []
+                events.append(event)
+            return events
+        self.response.put(self.handle_sel_flood.__doc__ + '\n')
+        return []
+
+    def output_sel_flood(self, sel_flood):
+        status = sel_flood.get_status()
+        info = "SEL flood {state}: sent {sent}/{count}, " \
+            "rejected {rejected}, dropped {dropped}, " \
+            "rate {rate:.1f}/s of {target_rate:.1f}/s".format(**status)
+        if status["capacity"]:
+            info += ", SEL {0}/{1} entries ({2:.0f}%)".\
+                format(status["entries"], status["capacity"],
+                       100.0 * status["entries"] / status["capacity"])
+        if status["overflow"]:
+            info += ", overflow"
+        self.response.put(info + '\n')
+
+    def handle_sel_flood(self, args):
+        """
+        Available 'sel flood' commands:
+            flood <count> <rate> template <sensorID> <event_id> [<'assert'/'deassert'>]
+            flood <count> <rate> sensors <sensorID | query>
+            flood <count> <rate> file <file>
+                each line of the file: <sensorID> <event_id> [<'assert'/'deassert'>]
+            flood status
+            flood stop
+
+            <rate> in events per second, events are sent in turn till
+            count is reached
+        """
+        if len(args) == 1 and args[0] in ('status', 'stop'):
+            if args[0] == 'stop':
+                sel_flood = flood.stop_flood()
+            else:
+                sel_flood = flood.sel_flood
+            if sel_flood is None:
+                self.response.put("no SEL flood\n")
+            else:
+                self.output_sel_flood(sel_flood)
+            return
+
+        if len(args) < 4:
+            self.response.put(self.handle_sel_flood.__doc__ + '\n')
+            return
+        try:
+            count = int(args[0])
+            rate = float(args[1])
+        except ValueError:
+            self.response.put(self.handle_sel_flood.__doc__ + '\n')
+            return
+
+        events = self.build_flood_events(args[2:])
+        if not events:
+            return
+        try:
+            sel_flood = flood.start_flood(events, count, rate)
+        except (ValueError, RuntimeError) as e:
+            self.response.put("{0}\n".format(e))
+            return
+        self.output_sel_flood(sel_flood)
 
     def handle_sel_command(self, args):
         """
         Available 'sel' commands:
             set <sensorID> <event_id> <'assert'/'deassert'>
             get <sensorID>
+            flood <count> <rate> template|sensors|file ...
+            flood status|stop
 
             'record type 0x2'
             set oem <record_Type> <generate_id_1> <generate_id_2> <sensor_type>
@@ -408,7 +728,7 @@ class Command_Handler:
 
         """
         if len(args) == 0:
-            msg_queue.put(self.handle_sel_command.__doc__ + '\n')
+            self.response.put(self.handle_sel_command.__doc__ + '\n')
             self.add_msg(self.handle_sel_command.__doc__ + '\n')
             return
 
@@ -416,6 +736,8 @@ class Command_Handler:
             self.set_sel(args[1:])
         elif args[0] == "get":
             self.get_sel(args[1:])
+        elif args[0] == "flood":
+            self.handle_sel_flood(args[1:])
         else:
             return
 
@@ -423,39 +745,211 @@ class Command_Handler:
     def handle_help(self):
         """
         Available commands:
-            sensor info
+            sensor info [<sensorID> | <query> ...]
             sensor mode set <sensorID> <user>
             sensor mode set <sensorID> <auto>
             sensor mode set <sensorID> <fault> <lnr | lc | lnc | unc | uc | unr>
             sensor mode get <sensorID>
             sensor value set <sensorID> <value>
+            sensor value set <sensorID> states <state id>=1|0 ...
             sensor value get <sensorID>
+            sensor suppress set <sensorID> <min delta> <hysteresis> <max rate>
+            sensor suppress get [<sensorID>]
             sel set <sensorID> <event_id> <'assert'/'deassert'>
             sel get <sensorID>
+            sel flood <count> <rate> template|sensors|file ...
+            sel flood status|stop
+            stats [reset | dump [<file>]]
+            output [text | json]
+            run <file>
             help
             history
             quit/exit
+        In sensor commands, a query may take the place of <sensorID>, it is
+        key=value[&key=value...] with keys id mc lun name type entity
+        event, e.g. type=fan or name=PSU*
+        Commands separated by ';' run in order, the output of each is
+        framed like in a script, e.g. sensor info 0x30; sel get 0x30
         """
-        msg_queue.put(self.handle_help.__doc__ + '\n')
+        self.response.put(self.handle_help.__doc__ + '\n')
+
+    # ######### STATS FUNCTIONS ##########
+    def output_stats(self, stats):
+        info = "command                    count errors   rate/s   avg ms" \
+            "   p50 ms   p99 ms   max ms\n"
+        for kind in sorted(stats["commands"]):
+            cmd = stats["commands"][kind]
+            info += "{0:<24} {1:>7} {2:>6} {3:>8.2f} {4:>8.3f} {5:>8.3f} " \
+                "{6:>8.3f} {7:>8.3f}\n".\
+                format(kind, cmd["count"], cmd["errors"], cmd["rate"],
+                       cmd["average"] * 1000, cmd["p50"] * 1000,
+                       cmd["p99"] * 1000, cmd["max"] * 1000)
+        info += "lock wait                  count                   avg ms" \
+            "   p50 ms   p99 ms   max ms\n"
+        for name in sorted(stats["lock_wait"]):
+            wait = stats["lock_wait"][name]
+            info += "{0:<24} {1:>7}                 {2:>8.3f} {3:>8.3f} " \
+                "{4:>8.3f} {5:>8.3f}\n".\
+                format(name, wait["count"], wait["average"] * 1000,
+                       wait["p50"] * 1000, wait["p99"] * 1000,
+                       wait["max"] * 1000)
+        info += "queue                      depth    max\n"
+        for name in sorted(stats["queues"]):
+            queue = stats["queues"][name]
+            info += "{0:<24} {1:>7} {2:>6}\n".\
+                format(name, queue["depth"], queue["max"])
+        info += "over {0:.1f} s\n".format(stats["uptime"])
+        self.response.put(info)
+
+    def handle_stats(self, args):
+        """
+        Available 'stats' commands:
+            stats: latency, errors and rate of each command type, lock
+                wait time and queue depths
+            stats reset
+            stats dump [<file>]: write them as JSON, by default to
+                /var/log/ipmi_sim_stats.json
+        """
+        if len(args) == 0:
+            self.output_stats(metrics.get_stats())
+        elif args[0] == 'reset' and len(args) == 1:
+            metrics.reset()
+        elif args[0] == 'dump' and len(args) <= 2:
+            path = args[1] if len(args) == 2 else STATS_FILE
+            try:
+                metrics.dump(path)
+            except (IOError, OSError) as e:
+                self.response.put('fail to write {0}: {1}\n'.
+                                  format(path, e.strerror))
+                return
+            self.response.put('stats written to {0}\n'.format(path))
+        else:
+            self.response.put(self.handle_stats.__doc__ + '\n')
+
+    # ######### BATCH FUNCTIONS ##########
+    def read_script(self, args):
+        """
+        Return lines of the script file, or an error message string
+        """
+        if len(args) != 1:
+            return self.handle_run.__doc__ + '\n'
+        try:
+            with open(args[0], 'r') as fd:
+                return fd.readlines()
+        except IOError as e:
+            return 'fail to read script {0}: {1}\n'.format(args[0], e.strerror)
+
+    def handle_output(self, args):
+        """
+        Available 'output' commands:
+            output: show the output format of this session
+            output text|json: set it. In json format each command answers
+                one line {"result": ..., "output": ...}; result is the
+                list of what sensor info, sensor value get and sel get
+                found, or null, output is any other text.
+        """
+        if len(args) == 0:
+            self.response.put(self.output_format + '\n')
+        elif len(args) == 1 and args[0] in ('text', 'json'):
+            self.output_format = args[0]
+        else:
+            self.response.put(self.handle_output.__doc__ + '\n')
+
+    def handle_batch(self, lines):
+        """
+        Run command lines one after another and frame the output of
+        each, see BATCH_HEADER. Commands separated by ';' on a line run
+        as lines of their own. Blank lines and '#' comments are skipped,
+        quit/exit ends the batch. 'run <file>' lines are replaced by the
+        lines of the file, a script can't run another one.
+        :return: Response with output of the whole batch
+        """
+        batch_response = Response()
+        count = 0
+        # (line, whether it may be 'run <file>', i.e. is not from a script)
+        pending = collections.deque([(line, True) for line in lines])
+        while pending:
+            line, may_run = pending.popleft()
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+
+            if ';' in line:
+                pending.extendleft(reversed([(command, may_run) for command
+                                             in line.split(';')]))
+                continue
+
+            args = line.split()
+            if args[0].lower() in ('quit', 'exit'):
+                # in a script it only ends the script
+                self.quit_requested = may_run
+                break
+
+            if args[0] == 'run' and may_run:
+                script = self.read_script(args[1:])
+                if not isinstance(script, list):
+                    count += 1
+                    batch_response.put(BATCH_HEADER.format(count, line))
+                    batch_response.put(script)
+                    continue
+                pending.extendleft(reversed([(l, False) for l in script]))
+                continue
+
+            count += 1
+            batch_response.put(BATCH_HEADER.format(count, line))
+            if args[0] == 'run':
+                output = 'run is not allowed in a script\n'
+            else:
+                output = self.handle_command(line).getvalue()
+            if len(output) and not output.endswith('\n'):
+                output += '\n'
+            batch_response.put(output)
+
+        batch_response.put(BATCH_FOOTER.format(count))
+        self.response = batch_response
+        self.framed = True
+        return batch_response
+
+    def handle_run(self, args):
+        """
+        Available 'run' commands:
+            run <file>: run commands in the file, one per line
+        """
+        if len(args) != 1:
+            self.response.put(self.handle_run.__doc__ + '\n')
+            return
+        self.handle_batch(['run ' + args[0]])
 
     def handle_history(self):
         for i in range(0, 30):
             try:
                 command = str(i) + "  " + str(self.command_history[i]) + '\n'
-                msg_queue.put(command)
+                self.response.put(command)
                 self.add_msg(command)
             except IndexError:
                 return
 
     def handle_command(self, cmd):
+        """
+        Handle one command line
+        :return: Response with output of the command
+        """
+        self.response = Response()
+        self.result = None
+        self.framed = False
+        self.quit_requested = False
         cmd = cmd.strip()
         if len(cmd) == 0:
-            return
+            return self.response
+
+        if ';' in cmd:
+            return self.handle_batch([cmd])
 
         num = len(self.command_history)
+        start = time.time()
         # re split
-        # i.e. 'a,b;; c  d'
-        args = re.split(r'[\s\,\;]+', cmd)
+        # i.e. 'a,b  c  d'
+        args = re.split(r'[\s\,]+', cmd)
         if args[0] == "sensor":
             self.handle_sensor_command(args[1:])
         elif args[0] == "sel":
@@ -464,12 +958,18 @@ class Command_Handler:
             self.handle_help()
         elif args[0] == "history":
             self.handle_history()
+        elif args[0] == "run":
+            self.handle_run(args[1:])
+        elif args[0] == "stats":
+            self.handle_stats(args[1:])
+        elif args[0] == "output":
+            self.handle_output(args[1:])
         else:
             # TODO add more command here
             err_msg = 'illegal command\n'
-            msg_queue.put(err_msg)
+            self.response.put(err_msg)
             self.add_msg(err_msg)
-            return
+            return self.output_json()
 
         # Keep track of previous commands
         if cmd != "":
@@ -479,3 +979,19 @@ class Command_Handler:
                 num += 1
 
             self.command_history.append(cmd)
+
+        metrics.record_command("console " + args[0], time.time() - start)
+        return self.output_json()
+
+    def output_json(self):
+        """
+        In json format, replace the output of the command by one line
+        {"result": ..., "output": ...}, see handle_output
+        """
+        if self.output_format != 'json' or self.framed:
+            return self.response
+        output = {"result": self.result,
+                  "output": self.response.getvalue()}
+        self.response = Response()
+        self.response.put(json.dumps(output, sort_keys=True) + '\n')
+        return self.response
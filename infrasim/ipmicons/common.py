@@ -12,18 +12,66 @@ import telnetlib
 import logging
 
 import socket
-import Queue
 
-lock = threading.Lock()
+from .metrics import metrics, command_kind
 
 # logger
 logger = logging.getLogger("ipmi_sim")
 LOG_FILE = '/var/log/ipmi_sim.log'
 
-# telnet to vBMC
-tn = telnetlib.Telnet()
+# ipmi_sim console of the vBMC
+IPMI_SIM_HOST = 'localhost'
+IPMI_SIM_PORT = 9000
+IPMI_SIM_PROMPT = '> '
+IPMI_SIM_TIMEOUT = 5
+# commands written to ipmi_sim in one go by a batch, keep it small
+# enough that neither side blocks on a full socket buffer
+IPMI_SIM_BATCH_SIZE = 256
+# sessions to ipmi_sim open at most, and how many of them background
+# work, e.g. sensors in auto mode, must leave to console commands
+IPMI_SIM_POOL_SIZE = 4
+IPMI_SIM_POOL_RESERVED = 1
+# names of the pool in metrics
+IPMI_SIM_SESSION_LOCK = 'ipmi_sim session'
+IPMI_SIM_SESSION_QUEUE = 'ipmi_sim session waiters'
+IPMI_SIM_BATCH_QUEUE = 'ipmi_sim batch'
 
-msg_queue = Queue.Queue()
+
+
+class Response:
+    """
+    Output of one command execution. Each execution gets its own and
+    hands it down to the sensors and SELs it touches, so output never
+    goes to another session.
+    """
+
+    def __init__(self):
+        self.msgs = []
+
+    def put(self, msg):
+        self.msgs.append(msg)
+
+    def get(self):
+        return self.msgs.pop(0)
+
+    def empty(self):
+        return len(self.msgs) == 0
+
+    def getvalue(self):
+        return ''.join(self.msgs)
+
+
+class Null_Response(Response):
+    """
+    Response with nobody to read it, e.g. for work done by the sensor
+    scheduler. Output is dropped, it is in the log already.
+    """
+
+    def put(self, msg):
+        pass
+
+
+null_response = Null_Response()
 
 
 def init_logger():
@@ -67,58 +115,451 @@ def str_hex_to_int(str_num):
     return int_num
 
 
+class IPMI_SIM_Connection:
+    """
+    Long-lived telnet session to the ipmi_sim console.
+
+    The session is opened on first use and kept open between commands.
+    The end of each response is detected by the console prompt, so no
+    fixed sleep is needed. A broken session is re-opened and the command
+    is sent again; a command that times out is not repeated, the session
+    is dropped instead so that the next command starts clean.
+    """
+
+    def __init__(self, host=IPMI_SIM_HOST, port=IPMI_SIM_PORT,
+                 timeout=IPMI_SIM_TIMEOUT, retries=1):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.tn = None
+        self.open_count = 0
+        self.command_count = 0
+        self.error_count = 0
+        self.reconnect_count = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def is_open(self):
+        return self.tn is not None
+
+    def open(self):
+        if self.tn is not None:
+            return
+        tn = telnetlib.Telnet(self.host, self.port, self.timeout)
+        # drop the banner, if any, up to the first prompt
+        banner = tn.read_until(IPMI_SIM_PROMPT, self.timeout)
+        if not banner.endswith(IPMI_SIM_PROMPT):
+            tn.close()
+            raise socket.timeout("no prompt from ipmi_sim console")
+        self.tn = tn
+        if self.open_count > 0:
+            self.reconnect_count += 1
+        self.open_count += 1
+        logger.info("ipmi_sim console session opened at {0}:{1}".
+                    format(self.host, self.port))
+
+    def close(self):
+        if self.tn is None:
+            return
+        try:
+            self.tn.close()
+        finally:
+            self.tn = None
+
+    def read_response(self):
+        """
+        Read up to the next prompt and return the text in front of it.
+        Raise socket.timeout if the prompt does not show up in time.
+        """
+        data = self.tn.read_until(IPMI_SIM_PROMPT, self.timeout)
+        if not data.endswith(IPMI_SIM_PROMPT):
+            raise socket.timeout("partial response: {0!r}".format(data))
+        return data[:-len(IPMI_SIM_PROMPT)]
+
+    def record_latency(self, latency):
+        self.command_count += 1
+        self.last_latency = latency
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def get_latency(self):
+        """
+        Return command latency statistics in seconds.
+        """
+        average = 0.0
+        if self.command_count:
+            average = self.total_latency / self.command_count
+        return {"count": self.command_count,
+                "errors": self.error_count,
+                "reconnects": self.reconnect_count,
+                "last": self.last_latency,
+                "average": average,
+                "max": self.max_latency}
+
+    def send(self, command):
+        """
+        Send one command line and return the console response.
+        Return None if ipmi_sim can't be reached or does not respond.
+        """
+        if not command.endswith('\n'):
+            command += '\n'
+
+        for attempt in range(0, self.retries + 1):
+            try:
+                self.open()
+                start = time.time()
+                self.tn.write(command)
+                result = self.read_response()
+                self.record_latency(time.time() - start)
+                return result
+            except socket.timeout as st:
+                self.error_count += 1
+                logger.error("ipmi_sim command timed out: {0}: {1}".
+                             format(command.strip(), st))
+                self.close()
+                return None
+            except (socket.error, EOFError) as se:
+                self.error_count += 1
+                logger.warning("ipmi_sim session at {0}:{1} broken: {2}".
+                               format(self.host, self.port, se))
+                self.close()
+
+        logger.error("Unable to connect lanserv at {0}: {1}".
+                     format(self.port, command.strip()))
+        return None
+
+    def send_batch(self, commands):
+        """
+        Pipeline several command lines and return one response per
+        command. The lines are written in chunks of IPMI_SIM_BATCH_SIZE
+        and the responses are split on the console prompt. Commands that
+        got no response because the session broke get None; the batch is
+        not re-sent since ipmi_sim may have run part of it already.
+        """
+        lines = [c if c.endswith('\n') else c + '\n' for c in commands]
+        results = []
+        try:
+            self.open()
+        except socket.error as se:
+            self.error_count += 1
+            logger.error("Unable to connect lanserv at {0}: {1}".
+                         format(self.port, se))
+            self.close()
+            return [None] * len(lines)
+
+        for index in range(0, len(lines), IPMI_SIM_BATCH_SIZE):
+            chunk = lines[index:index + IPMI_SIM_BATCH_SIZE]
+            try:
+                start = time.time()
+                self.tn.write(''.join(chunk))
+                for line in chunk:
+                    results.append(self.read_response())
+                latency = time.time() - start
+                for line in chunk:
+                    self.record_latency(latency / len(chunk))
+            except (socket.error, EOFError) as se:
+                self.error_count += 1
+                logger.error("ipmi_sim batch broken after {0} of {1} "
+                             "commands: {2}".
+                             format(len(results), len(lines), se))
+                self.close()
+                break
+
+        results.extend([None] * (len(lines) - len(results)))
+        return results
+
+
+class IPMI_SIM_Pool:
+    """
+    Bounded pool of sessions to the ipmi_sim console.
+
+    A command takes an idle session, or opens a new one while there are
+    less than size, otherwise it waits for one to be given back. Each
+    session runs one command at a time, commands on different sessions
+    run in parallel. Background callers can hold at most
+    size - reserved sessions, so console commands never queue behind
+    sensor updates.
+    """
+
+    def __init__(self, size=IPMI_SIM_POOL_SIZE,
+                 reserved=IPMI_SIM_POOL_RESERVED, **kwargs):
+        self.size = size
+        self.reserved = min(reserved, size - 1)
+        self.kwargs = kwargs
+        self.condition = threading.Condition()
+        self.connections = []
+        self.idle = []
+        self.background = 0
+        self.waiting = 0
+
+    def acquire(self, background=False):
+        start = time.time()
+        waiting = False
+        self.condition.acquire()
+        try:
+            while True:
+                if background and \
+                        self.background >= self.size - self.reserved:
+                    pass
+                elif self.idle:
+                    # the last returned one is most likely still open
+                    conn = self.idle.pop()
+                    break
+                elif len(self.connections) < self.size:
+                    conn = IPMI_SIM_Connection(**self.kwargs)
+                    self.connections.append(conn)
+                    break
+                if not waiting:
+                    waiting = True
+                    self.waiting += 1
+                    metrics.set_queue_depth(IPMI_SIM_SESSION_QUEUE,
+                                            self.waiting)
+                self.condition.wait()
+            if waiting:
+                self.waiting -= 1
+                metrics.set_queue_depth(IPMI_SIM_SESSION_QUEUE, self.waiting)
+            if background:
+                self.background += 1
+        finally:
+            self.condition.release()
+        metrics.record_lock_wait(IPMI_SIM_SESSION_LOCK, time.time() - start)
+        return conn
+
+    def release(self, conn, background=False):
+        self.condition.acquire()
+        try:
+            if background:
+                self.background -= 1
+            self.idle.append(conn)
+            # waiters differ in what they may take, wake them all
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def send(self, command, background=False):
+        """
+        Return the response and its latency, both None if the command
+        got no response
+        """
+        conn = self.acquire(background)
+        try:
+            result = conn.send(command)
+            if result is None:
+                return None, None
+            return result, conn.last_latency
+        finally:
+            self.release(conn, background)
+
+    def send_batch(self, commands, background=False):
+        conn = self.acquire(background)
+        try:
+            return conn.send_batch(commands)
+        finally:
+            self.release(conn, background)
+
+    def get_epoch(self):
+        """
+        Count of sessions re-opened so far. ipmi_sim may have been
+        restarted when it changes, so values it acknowledged before can't
+        be trusted any more.
+        """
+        self.condition.acquire()
+        try:
+            return sum([conn.reconnect_count for conn in self.connections])
+        finally:
+            self.condition.release()
+
+    def close(self):
+        """
+        Close idle sessions, a session in use is re-opened on its next
+        command anyway
+        """
+        self.condition.acquire()
+        try:
+            for conn in self.idle:
+                conn.close()
+        finally:
+            self.condition.release()
+
+    def get_latency(self):
+        """
+        Return command latency statistics of all sessions in seconds.
+        """
+        self.condition.acquire()
+        try:
+            connections = list(self.connections)
+        finally:
+            self.condition.release()
+
+        stats = {"sessions": len(connections), "count": 0, "errors": 0,
+                 "reconnects": 0, "average": 0.0, "max": 0.0}
+        total = 0.0
+        for conn in connections:
+            stats["count"] += conn.command_count
+            stats["errors"] += conn.error_count
+            stats["reconnects"] += conn.reconnect_count
+            stats["max"] = max(stats["max"], conn.max_latency)
+            total += conn.total_latency
+        if stats["count"]:
+            stats["average"] = total / stats["count"]
+        return stats
+
+
+ipmi_sim_pool = IPMI_SIM_Pool()
+
+
 # telnet to vBMC console
 def open_telnet_session():
-    pass
+    conn = ipmi_sim_pool.acquire()
+    try:
+        conn.open()
+    except socket.error as se:
+        logger.error("Unable to connect lanserv at {0}: {1}".
+                     format(conn.port, se))
+    finally:
+        ipmi_sim_pool.release(conn)
 
 
 # send IPMI SIM command to the vBMC
-def send_ipmi_sim_command(command):
-    lock.acquire()
+def send_ipmi_sim_command(command, background=False):
+    """
+    :param background: True for work nobody waits on, e.g. sensor
+        updates in auto mode, it leaves sessions to console commands
+    """
     logger.info("send IPMI SIM command: " + command.strip())
-    result = ""
+    start = time.time()
+    result, latency = ipmi_sim_pool.send(command, background)
+    metrics.record_command(command_kind(command), time.time() - start,
+                           is_acknowledged(result))
+    if latency is None:
+        logger.info("IPMI SIM command got no result after {0:.3f} ms".
+                    format((time.time() - start) * 1000))
+    else:
+        logger.info("IPMI SIM command result ({0:.3f} ms): {1}".
+                    format(latency * 1000, result))
+    return result
+
+
+def is_acknowledged(result):
+    """
+    Check if ipmi_sim took a command, by the response to it
+    """
+    return result is not None and "**" not in result
+
+
+# send several IPMI SIM commands to the vBMC in one write
+def send_ipmi_sim_commands(commands, background=False):
+    logger.info("send {0} IPMI SIM commands in batch".format(len(commands)))
+    # commands of all batches on their way
+    metrics.add_queue_depth(IPMI_SIM_BATCH_QUEUE, len(commands))
+    start = time.time()
     try:
-        tn.open('localhost', '9000')
-        tn.write(command)
-        time.sleep(0.1)
-        result = tn.read_some()
-        tn.close()
-        logger.info("IPMI SIM command result: " + result)
-    except socket.error as se:
-        logger.error("Unable to connect lanserv at 9000: {0}".format(se))
+        results = ipmi_sim_pool.send_batch(commands, background)
     finally:
-        lock.release()
+        metrics.add_queue_depth(IPMI_SIM_BATCH_QUEUE, -len(commands))
+    if commands:
+        metrics.record_commands([(command_kind(command),
+                                  is_acknowledged(result))
+                                 for command, result in
+                                 zip(commands, results)],
+                                (time.time() - start) / len(commands))
+    logger.info("IPMI SIM batch results: {0}".format(results))
+    return results
 
-    return result
+
+class IPMI_SIM_Batch:
+    """
+    Collect ipmi_sim command lines and submit them in one pipelined
+    write, e.g.
+
+        batch = IPMI_SIM_Batch()
+        for sensor_obj in sensors:
+            sensor_obj.set_threshold_value(raw_value, batch=batch)
+        results = batch.submit()
+
+    submit() returns one response per command, in the order added.
+    A command may come with a callback, it is called with the response
+    once the batch is submitted.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.callbacks = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, command, callback=None):
+        self.commands.append(command.strip() + '\n')
+        self.callbacks.append(callback)
+
+    def sensor_set_value(self, mc, lun, num, value, gen_event=1,
+                         callback=None):
+        self.add("sensor_set_value {0} {1} {2} {3} {4}".
+                 format(hex(mc), hex(lun), hex(num), hex(value),
+                        hex(gen_event)), callback)
+
+    def sensor_set_bit(self, mc, lun, num, bit, value, gen_event=1,
+                       callback=None):
+        self.add("sensor_set_bit {0} {1} {2} {3} {4} {5}".
+                 format(hex(mc), hex(lun), hex(num), bit, value,
+                        hex(gen_event)), callback)
+
+    def sel_add(self, mc, record_type, data, callback=None):
+        """
+        :param data: the 13 record bytes following the record type
+        """
+        self.add("sel_add {0} {1} {2}".
+                 format(hex(mc), hex(record_type),
+                        ' '.join([hex(x) for x in data])), callback)
+
+    def submit(self, background=False):
+        if len(self.commands) == 0:
+            return []
+        commands, self.commands = self.commands, []
+        callbacks, self.callbacks = self.callbacks, []
+        results = send_ipmi_sim_commands(commands, background)
+        for callback, result in zip(callbacks, results):
+            if callback is not None:
+                callback(result)
+        return results
 
 
 # close telnet session
 def close_telnet_session():
-    pass
+    ipmi_sim_pool.close()
 
 
-# send ipmitool command to vBMC
+# send ipmitool command to vBMC, every call is a session of its own
+# so calls are not serialized
 def send_ipmitool_command(*cmds):
-    lock.acquire()
     dst_cmd = ["ipmitool",
                "-I", "lan", "-H", 'localhost', "-U", 'admin', "-P", 'admin']
     for cmd in cmds:
         dst_cmd.append(cmd)
 
-    child = subprocess.Popen(dst_cmd,
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-            stderr=subprocess.PIPE
-            )
+    kind = ' '.join(["ipmitool"] + list(cmds[:1]))
+    start = time.time()
+    try:
+        child = subprocess.Popen(dst_cmd,
+                stdout=subprocess.PIPE,
+                stdin=subprocess.PIPE,
+                stderr=subprocess.PIPE
+                )
+    except OSError:
+        metrics.record_command(kind, time.time() - start, False)
+        raise
     (stdout, stderr) = child.communicate()
     child.wait()
+    metrics.record_command(kind, time.time() - start, stderr == '')
     logger.info("ipmitool command: " + ' '.join(dst_cmd))
     logger.info("ipmitool command stdout: " + stdout.strip())
 
     if stderr != '':
         err_message = "failed to send ipmitool command: {0}".format(dst_cmd)
         logger.error(err_message)
-        lock.release()
         return -1
-    lock.release()
     return stdout
@@ -0,0 +1,194 @@
+'''
+*********************************************************
+Copyright @ 2015 EMC Corporation All Rights Reserved
+*********************************************************
+'''
+# Readings of all threshold sensors in auto mode are made here, one tick
+# for all of them instead of one update per sensor.
+#
+# The engine keeps a slot per sensor in parallel arrays: the range a
+# reading is drawn from (from the sensor's readable thresholds), the
+# update interval, the time the next reading is due and the last value
+# sent. A tick draws readings for every slot due in one step, and only
+# the readings that differ from the last value are written to ipmi_sim,
+# in a single batch. The arrays are NumPy arrays when NumPy is installed,
+# otherwise plain lists walked in Python.
+#
+# The engine is driven by the sensor scheduler like a sensor: update()
+# runs a tick and returns the seconds until the next slot is due.
+
+import random
+import threading
+import time
+
+from .common import logger, IPMI_SIM_Batch
+from .scheduler import sensor_scheduler
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Auto_Engine(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sensors = []
+        self.slots = {}
+        self.low = self.new_array('l')
+        self.high = self.new_array('l')
+        self.interval = self.new_array('d')
+        self.due = self.new_array('d')
+        self.value = self.new_array('l')
+        if numpy is not None:
+            self.random = numpy.random.RandomState()
+        else:
+            self.random = random.Random()
+
+    def new_array(self, dtype):
+        if numpy is not None:
+            return numpy.zeros(0, dtype=dtype)
+        return []
+
+    def get_name(self):
+        return 'auto engine'
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def __contains__(self, sensor_obj):
+        return sensor_obj in self.slots
+
+    def add(self, sensor_obj):
+        """
+        Take a threshold sensor into the engine, its first reading is
+        due right away
+        """
+        self.lock.acquire()
+        try:
+            if sensor_obj in self.slots:
+                self.set_slot(self.slots[sensor_obj], sensor_obj)
+            else:
+                low, high = sensor_obj.get_auto_range()
+                value = sensor_obj.get_value()
+                self.slots[sensor_obj] = len(self.sensors)
+                self.sensors.append(sensor_obj)
+                self.low = self.append(self.low, low)
+                self.high = self.append(self.high, high)
+                self.interval = self.append(self.interval,
+                                            sensor_obj.get_interval())
+                self.due = self.append(self.due, time.time())
+                self.value = self.append(self.value,
+                                         value if value is not None else -1)
+        finally:
+            self.lock.release()
+        sensor_scheduler.schedule(self)
+
+    def append(self, array, item):
+        if numpy is not None:
+            return numpy.append(array, item).astype(array.dtype)
+        array.append(item)
+        return array
+
+    def remove(self, sensor_obj):
+        self.lock.acquire()
+        try:
+            slot = self.slots.pop(sensor_obj, None)
+            if slot is None:
+                return
+            # move the last slot into the hole
+            last = len(self.sensors) - 1
+            if slot != last:
+                moved = self.sensors[last]
+                self.sensors[slot] = moved
+                self.slots[moved] = slot
+                for array in (self.low, self.high, self.interval,
+                              self.due, self.value):
+                    array[slot] = array[last]
+            self.sensors.pop()
+            self.low = self.low[:last]
+            self.high = self.high[:last]
+            self.interval = self.interval[:last]
+            self.due = self.due[:last]
+            self.value = self.value[:last]
+        finally:
+            self.lock.release()
+
+    def refresh(self, sensor_obj):
+        """
+        Reload range and interval after thresholds or interval of the
+        sensor are changed, sensors not in the engine are ignored
+        """
+        self.lock.acquire()
+        try:
+            if sensor_obj in self.slots:
+                self.set_slot(self.slots[sensor_obj], sensor_obj)
+        finally:
+            self.lock.release()
+
+    def set_slot(self, slot, sensor_obj):
+        self.low[slot], self.high[slot] = sensor_obj.get_auto_range()
+        self.interval[slot] = sensor_obj.get_interval()
+
+    def tick(self, now, batch):
+        """
+        Draw readings for all sensors due at now, and queue the changed
+        ones in batch. Must be called with lock held.
+        :return: seconds till the next sensor is due, None if empty
+        """
+        if not self.sensors:
+            return None
+        if numpy is not None:
+            return self.tick_numpy(now, batch)
+
+        for slot, sensor_obj in enumerate(self.sensors):
+            if self.due[slot] > now:
+                continue
+            value = self.random.randint(self.low[slot], self.high[slot])
+            if value != self.value[slot]:
+                self.value[slot] = value
+                sensor_obj.set_threshold_value(value, batch=batch,
+                                               throttle=True)
+            self.due[slot] = max(self.due[slot] + self.interval[slot], now)
+        return max(min(self.due) - now, 0)
+
+    def tick_numpy(self, now, batch):
+        due = numpy.flatnonzero(self.due <= now)
+        if due.size:
+            low = self.low[due]
+            span = self.high[due] - low + 1
+            values = low + (self.random.random_sample(due.size) *
+                            span).astype(self.low.dtype)
+            changed = values != self.value[due]
+            self.value[due] = values
+            self.due[due] = numpy.maximum(self.due[due] +
+                                          self.interval[due], now)
+            for slot, value in zip(due[changed], values[changed]):
+                self.sensors[slot].set_threshold_value(int(value),
+                                                       batch=batch,
+                                                       throttle=True)
+        return max(float(self.due.min()) - now, 0)
+
+    def update(self):
+        """
+        Run one tick, called by the sensor scheduler
+        :return: seconds till next tick, None if no sensor left
+        """
+        batch = IPMI_SIM_Batch()
+        self.lock.acquire()
+        try:
+            delay = self.tick(time.time(), batch)
+            sensor_count = len(self.sensors)
+        finally:
+            self.lock.release()
+        # sensors are added and removed while the batch is on its way
+        count = len(batch)
+        if count:
+            batch.submit(background=True)
+            logger.debug('auto engine wrote {0} of {1} sensors'.
+                         format(count, sensor_count))
+        return delay
+
+
+auto_engine = Auto_Engine()
@@ -0,0 +1,299 @@
+'''
+*********************************************************
+Copyright @ 2015 EMC Corporation All Rights Reserved
+*********************************************************
+'''
+# Flood the SEL with events at a target rate, to load test whatever
+# collects the SEL of the vBMC.
+#
+# Events are paced against absolute deadlines, event n is due at
+# start + n / rate, so the rate does not drift with the time a write
+# takes. All events due at a wake up go to ipmi_sim in one batch.
+#
+# The SEL of an mc holds as many entries as sel_enable in the emulation
+# file allows. When it fills up the flood does what BMCs do: an Event
+# Logging Disabled "SEL Almost Full" event is logged at 75%, the last
+# entry is taken by "SEL Full", and any event after that is dropped.
+#
+# Events are encoded to sel_add lines once, when the flood starts; the
+# flood then cycles through the lines.
+
+import copy
+import re
+import threading
+import time
+
+from .common import logger, IPMI_SIM_Batch, is_acknowledged, \
+    send_ipmitool_command
+from .registry import sensor_registry
+from . import sel
+
+# events sent in one batch at most, however many are due
+FLOOD_BATCH_SIZE = 64
+# waits up to this long are slept through; Event.wait of python 2 sleeps
+# in steps of up to 50 ms, too coarse to pace short gaps
+FLOOD_SLEEP_MAX = 0.05
+# fill level of the SEL that gets the "SEL Almost Full" event
+SEL_ALMOST_FULL = 0.75
+# Event Logging Disabled sensor type, and its SEL Full and SEL Almost
+# Full offsets
+SENSOR_TYPE_EVENT_LOGGING = 0x10
+EVENT_SEL_FULL = 0x04
+EVENT_SEL_ALMOST_FULL = 0x05
+
+
+def build_event(sensor_obj, event_id, event_dir=0):
+    """
+    Build an event of a sensor
+    :param event_dir: 0 for assertion, 1 for deassertion
+    :return: (SEL template, event dir, event data), as encode_events
+        takes, or None if the sensor has no such event
+    """
+    sel_obj = copy.copy(sensor_obj.sel)
+    if sel_obj.check_event_type() is False or \
+            sel_obj.check_sensor_type() is False or \
+            sel_obj.set_event_data(event_id) is False:
+        return None
+    return sensor_obj.get_sel_template(), event_dir, \
+        sel_obj.get_event_data()
+
+
+def get_event_ids(sensor_obj):
+    """
+    Event ids a sensor supports, in order
+    """
+    if sensor_obj.sel.event_type == 0x6F:
+        events = sel.sensor_specific_event_map.get(sensor_obj.get_type(), {})
+    else:
+        events = sel.events_map.get(sensor_obj.sel.event_type, {})
+    return sorted(events.keys())
+
+
+def build_sensor_events(sensors):
+    """
+    One assertion of every event each sensor supports, sensor by sensor
+    """
+    events = []
+    for sensor_obj in sensors:
+        for event_id in get_event_ids(sensor_obj):
+            event = build_event(sensor_obj, event_id)
+            if event is not None:
+                events.append(event)
+    return events
+
+
+def build_log_event(mc, event_id):
+    """
+    sel_add line of an Event Logging Disabled event of mc, from the
+    sensor of that type if there is one
+    """
+    sensors = sensor_registry.query("type={0}&mc={1}".
+                                    format(SENSOR_TYPE_EVENT_LOGGING, mc))
+    if sensors:
+        event = build_event(sensors[0], event_id)
+        if event is not None:
+            template, event_dir, event_data = event
+            return template.encode(event_dir, event_data)
+    sel_obj = sel.SEL()
+    sel_obj.set_mc(mc)
+    sel_obj.set_gid_1(mc)
+    sel_obj.set_sensor_type(SENSOR_TYPE_EVENT_LOGGING)
+    sel_obj.set_sensor_num(0xff)
+    sel_obj.set_event_type(0x6F)
+    sel_obj.set_event_data(event_id)
+    return sel.encode_record(mc, sel_obj.pack())
+
+
+def read_sel_entries():
+    """
+    Count of entries in the SEL now, None if ipmitool can't tell
+    """
+    try:
+        result = send_ipmitool_command("sel", "info")
+    except OSError as e:
+        logger.error("fail to run ipmitool: {0}".format(e))
+        return None
+    if result == -1:
+        return None
+    match = re.search(r'^Entries\s*:\s*(\d+)', result, re.M)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+class SEL_Flood(threading.Thread):
+    """
+    Send count events at rate per second, cycling through events.
+    Progress is read with get_status(), stop() ends the flood early.
+    """
+
+    def __init__(self, events, count, rate, capacity=None, entries=0,
+                 batch_size=FLOOD_BATCH_SIZE):
+        threading.Thread.__init__(self, name='ipmicons.SEL_Flood')
+        self.daemon = True
+        if not events:
+            raise ValueError('No event to flood the SEL with')
+        if count <= 0 or rate <= 0:
+            raise ValueError('Event count and rate must be positive')
+        self.lines = sel.encode_events(events)
+        self.count = count
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.entries = entries
+        self.batch_size = batch_size
+        self.mc = events[0][0].mc
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.sent = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.overflow = False
+        self.almost_full_logged = False
+        self.start_time = None
+        self.end_time = None
+
+    def stop(self):
+        self.stopped.set()
+
+    def next_events(self, due):
+        """
+        Take up to due events off the flood, in place of some of them
+        the SEL almost full and full events. Events that find the SEL
+        full are dropped.
+        :return: sel_add lines
+        """
+        lines = []
+        while due > 0 and self.generated < self.count:
+            self.generated += 1
+            due -= 1
+            if self.capacity is None:
+                lines.append(self.lines[(self.generated - 1) %
+                                        len(self.lines)])
+                continue
+            if self.entries >= self.capacity:
+                self.dropped += 1
+                self.overflow = True
+                continue
+            if not self.almost_full_logged and \
+                    self.entries + 1 >= self.capacity * SEL_ALMOST_FULL:
+                self.almost_full_logged = True
+                line = build_log_event(self.mc, EVENT_SEL_ALMOST_FULL)
+            elif self.entries + 1 == self.capacity:
+                line = build_log_event(self.mc, EVENT_SEL_FULL)
+            else:
+                line = self.lines[(self.generated - 1) % len(self.lines)]
+            self.entries += 1
+            lines.append(line)
+        return lines
+
+    def acknowledge(self, result):
+        self.lock.acquire()
+        try:
+            if is_acknowledged(result):
+                self.accepted += 1
+            else:
+                self.rejected += 1
+        finally:
+            self.lock.release()
+
+    def run(self):
+        self.start_time = time.time()
+        try:
+            while self.generated < self.count and not self.stopped.is_set():
+                now = time.time()
+                due = int((now - self.start_time) * self.rate) + 1 \
+                    - self.generated
+                due = min(due, self.batch_size)
+                if due > 0:
+                    batch = IPMI_SIM_Batch()
+                    for line in self.next_events(due):
+                        batch.add(line, callback=self.acknowledge)
+                    sent = len(batch)
+                    batch.submit(background=True)
+                    self.sent += sent
+                    continue
+                # sleep till the next event is due
+                delay = self.start_time + self.generated / self.rate - now
+                if delay <= FLOOD_SLEEP_MAX:
+                    time.sleep(delay)
+                else:
+                    self.stopped.wait(delay)
+        except Exception:
+            logger.exception('SEL flood failed')
+        finally:
+            self.end_time = time.time()
+
+    def get_status(self):
+        """
+        Return progress of the flood, rate is the achieved one in
+        events per second
+        """
+        if self.start_time is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.end_time or time.time()) - self.start_time
+        if self.is_alive():
+            state = "running"
+        elif self.generated < self.count:
+            state = "stopped"
+        else:
+            state = "done"
+        return {"state": state,
+                "count": self.count,
+                "sent": self.sent,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "dropped": self.dropped,
+                "target_rate": self.rate,
+                "rate": self.sent / elapsed if elapsed > 0 else 0.0,
+                "entries": self.entries if self.capacity else None,
+                "capacity": self.capacity,
+                "overflow": self.overflow}
+
+
+# the flood running or last run, one at a time
+sel_flood = None
+sel_flood_lock = threading.Lock()
+
+
+def start_flood(events, count, rate):
+    """
+    Start a flood of the SEL of the mc of the first event, unless one is
+    running already
+    :return: the SEL_Flood
+    """
+    global sel_flood
+    sel_flood_lock.acquire()
+    try:
+        if sel_flood is not None and sel_flood.is_alive():
+            raise RuntimeError('A SEL flood is running already')
+        mc = events[0][0].mc if events else None
+        capacity = sel.sel_capacity.get(mc)
+        entries = 0
+        if capacity is not None:
+            entries = read_sel_entries()
+            if entries is None:
+                # carry on from where the last flood left
+                entries = 0
+                if sel_flood is not None and sel_flood.mc == mc and \
+                        sel_flood.capacity is not None:
+                    entries = sel_flood.entries
+        flood = SEL_Flood(events, count, rate, capacity, entries)
+        flood.start()
+        sel_flood = flood
+        return flood
+    finally:
+        sel_flood_lock.release()
+
+
+def stop_flood():
+    """
+    Stop the running flood, return it, or None if there is none
+    """
+    flood = sel_flood
+    if flood is not None:
+        flood.stop()
+        flood.join()
+    return flood
@@ -0,0 +1,225 @@
+'''
+*********************************************************
+Copyright @ 2015 EMC Corporation All Rights Reserved
+*********************************************************
+'''
+# Where time goes in the console, kept in process:
+#     commands    count, errors and a latency histogram per command
+#                 type, the first word of an ipmi_sim command line
+#                 (sensor_set_value, sel_add, ...), "ipmitool <cmd>"
+#                 for ipmitool and "console <cmd>" for console commands
+#     lock wait   time spent waiting for a shared lock, e.g. for an
+#                 ipmi_sim session from the pool
+#     queues      depth of queues now and at most, e.g. callers waiting
+#                 for a session, sensors in the scheduler
+#
+# Latency is end to end as the caller sees it, waiting for a session
+# included. A command sent in a batch is accounted its share of the
+# batch time.
+#
+# The "stats" console command shows them, "stats dump" writes them to a
+# JSON file.
+
+import bisect
+import json
+import os
+import threading
+import time
+
+# upper bounds of latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005,
+                   0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+STATS_FILE = '/var/log/ipmi_sim_stats.json'
+
+
+def command_kind(command):
+    """
+    Type of an ipmi_sim command line, its first word
+    """
+    words = command.split(None, 1)
+    if not words:
+        return 'empty'
+    return words[0]
+
+
+class Histogram:
+    """
+    Latencies counted in LATENCY_BUCKETS, the last bucket holds all
+    above the last bound
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def get_percentile(self, fraction):
+        """
+        Upper bound of the bucket the fraction of values falls in, so
+        at most one bucket off. Values above the last bound report max.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                break
+        return self.max
+
+    def get_stats(self):
+        return {"count": self.count,
+                "average": self.total / self.count if self.count else 0.0,
+                "max": self.max,
+                "p50": self.get_percentile(0.5),
+                "p90": self.get_percentile(0.9),
+                "p99": self.get_percentile(0.99),
+                "buckets": [[bound, count] for bound, count in
+                            zip(list(self.bounds) + [None], self.buckets)]}
+
+
+class Command_Stats:
+    def __init__(self):
+        self.errors = 0
+        self.latency = Histogram()
+
+    def record(self, latency, ok):
+        self.latency.record(latency)
+        if not ok:
+            self.errors += 1
+
+
+class Metrics:
+    """
+    Counters of the console, one set per process. All methods are
+    thread safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.start_time = time.time()
+            self.commands = {}
+            self.lock_waits = {}
+            self.queues = {}
+        finally:
+            self.lock.release()
+
+    def record_command(self, kind, latency, ok=True):
+        """
+        :param kind: command type, see command_kind
+        :param ok: False if the command failed
+        """
+        self.lock.acquire()
+        try:
+            stats = self.commands.get(kind)
+            if stats is None:
+                stats = self.commands[kind] = Command_Stats()
+            stats.record(latency, ok)
+        finally:
+            self.lock.release()
+
+    def record_commands(self, commands, latency):
+        """
+        Record commands of the same latency at once, e.g. a batch
+        :param commands: (kind, ok) of each command
+        """
+        self.lock.acquire()
+        try:
+            for kind, ok in commands:
+                stats = self.commands.get(kind)
+                if stats is None:
+                    stats = self.commands[kind] = Command_Stats()
+                stats.record(latency, ok)
+        finally:
+            self.lock.release()
+
+    def record_lock_wait(self, name, wait):
+        self.lock.acquire()
+        try:
+            histogram = self.lock_waits.get(name)
+            if histogram is None:
+                histogram = self.lock_waits[name] = Histogram()
+            histogram.record(wait)
+        finally:
+            self.lock.release()
+
+    def set_queue_depth(self, name, depth):
+        self.lock.acquire()
+        try:
+            old = self.queues.get(name, (0, 0))
+            self.queues[name] = (depth, max(depth, old[1]))
+        finally:
+            self.lock.release()
+
+    def add_queue_depth(self, name, count):
+        """
+        Add count, or take it off if negative, to the depth of a queue
+        several threads fill at once
+        """
+        self.lock.acquire()
+        try:
+            old = self.queues.get(name, (0, 0))
+            depth = old[0] + count
+            self.queues[name] = (depth, max(depth, old[1]))
+        finally:
+            self.lock.release()
+
+    def get_stats(self):
+        """
+        Return all metrics as a dict of plain types, latencies in
+        seconds and rates in commands per second since start or reset
+        """
+        self.lock.acquire()
+        try:
+            uptime = time.time() - self.start_time
+            commands = {}
+            for kind, stats in self.commands.items():
+                info = stats.latency.get_stats()
+                info["errors"] = stats.errors
+                info["error_rate"] = float(stats.errors) / info["count"]
+                info["rate"] = info["count"] / uptime if uptime > 0 \
+                    else 0.0
+                commands[kind] = info
+            lock_waits = dict([(name, histogram.get_stats()) for
+                               name, histogram in self.lock_waits.items()])
+            queues = dict([(name, {"depth": depth, "max": max_depth})
+                           for name, (depth, max_depth) in
+                           self.queues.items()])
+        finally:
+            self.lock.release()
+        return {"time": time.time(),
+                "uptime": uptime,
+                "commands": commands,
+                "lock_wait": lock_waits,
+                "queues": queues}
+
+    def dump(self, path=STATS_FILE):
+        """
+        Write metrics to path as JSON. The file is replaced in one
+        rename, so a reader never sees it half written.
+        Raise IOError/OSError if it can't be written.
+        """
+        tmp_path = '{0}.{1}'.format(path, os.getpid())
+        with open(tmp_path, 'w') as fd:
+            json.dump(self.get_stats(), fd, indent=2, sort_keys=True)
+        os.rename(tmp_path, path)
+
+
+metrics = Metrics()
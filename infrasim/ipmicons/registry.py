@@ -0,0 +1,270 @@
+'''
+*********************************************************
+Copyright @ 2015 EMC Corporation All Rights Reserved
+*********************************************************
+'''
+# All sensors of the vBMC, indexed by every key a console command can
+# select them by:
+#     id       sensor number, with mc and lun
+#     name     sensor id string
+#     type     sensor type, by code or name, e.g. 0x04 or fan
+#     entity   entity id, optionally with instance, e.g. 7 or 7.1
+#     event    event reading type: threshold, discrete or NA
+#
+# A query is a list of key=value joined by &, all of which must
+# match, e.g. "type=fan&name=Fan1*". Values may hold shell style
+# wildcards.
+#
+# Indexes are never changed in place. Adding a sensor or rebuilding the
+# whole registry makes a new Sensor_Index and swaps it in, so a query
+# running meanwhile sees either the old sensors or the new ones.
+
+import fnmatch
+import threading
+
+# IPMI 2.0 table 42-3, names as used in queries
+sensor_type_name = {
+    0x01: 'temperature', 0x02: 'voltage', 0x03: 'current', 0x04: 'fan',
+    0x05: 'physical_security', 0x06: 'platform_security',
+    0x07: 'processor', 0x08: 'power_supply', 0x09: 'power_unit',
+    0x0a: 'cooling_device', 0x0b: 'other_units', 0x0c: 'memory',
+    0x0d: 'drive_slot', 0x0e: 'post_memory_resize',
+    0x0f: 'system_firmware_progress', 0x10: 'event_logging_disabled',
+    0x11: 'watchdog1', 0x12: 'system_event', 0x13: 'critical_interrupt',
+    0x14: 'button', 0x15: 'module_board', 0x16: 'microcontroller',
+    0x17: 'add_in_card', 0x18: 'chassis', 0x19: 'chip_set',
+    0x1a: 'other_fru', 0x1b: 'cable_interconnect', 0x1c: 'terminator',
+    0x1d: 'system_boot', 0x1e: 'boot_error', 0x1f: 'os_boot',
+    0x20: 'os_critical_stop', 0x21: 'slot_connector',
+    0x22: 'acpi_power_state', 0x23: 'watchdog2', 0x24: 'platform_alert',
+    0x25: 'entity_presence', 0x26: 'monitor_asic', 0x27: 'lan',
+    0x28: 'management_subsystem_health', 0x29: 'battery',
+    0x2a: 'session_audit', 0x2b: 'version_change', 0x2c: 'fru_state',
+}
+
+# mc of sensors selected by number only
+DEFAULT_MC = 0x20
+
+QUERY_KEYS = ('id', 'mc', 'lun', 'name', 'type', 'entity', 'event')
+
+
+def sort_key(sensor_obj):
+    # bit 7:4 of owner lun is the channel
+    return sensor_obj.get_mc(), sensor_obj.get_lun() & 0x3, \
+        sensor_obj.get_num()
+
+
+def parse_query(query):
+    """
+    Split a query into a dict of key to value
+    :param query: e.g. "type=fan&name=Fan1*"
+    :return: dict, raise ValueError if the query is illegal
+    """
+    terms = {}
+    for term in query.split("&"):
+        key, sep, value = term.partition('=')
+        key = key.strip().lower()
+        if not sep or key not in QUERY_KEYS or not value:
+            raise ValueError("illegal sensor query: {0}".format(term))
+        terms[key] = value.strip()
+    return terms
+
+
+class Sensor_Index(object):
+    """
+    One generation of the indexes, see Sensor_Registry
+    """
+
+    def __init__(self, sensors=()):
+        self.sensors = []
+        self.by_id = {}
+        self.by_num = {}
+        self.by_name = {}
+        self.by_type = {}
+        self.by_entity = {}
+        self.by_event = {}
+        for sensor_obj in sensors:
+            self.add(sensor_obj)
+
+    def copy(self):
+        index = Sensor_Index()
+        index.sensors = list(self.sensors)
+        index.by_id = dict(self.by_id)
+        for attr in ('by_num', 'by_name', 'by_type', 'by_entity',
+                     'by_event'):
+            setattr(index, attr, dict([(key, list(value)) for key, value
+                                       in getattr(self, attr).items()]))
+        return index
+
+    def add(self, sensor_obj):
+        key = sort_key(sensor_obj)
+        old = self.by_id.get(key)
+        if old is not None:
+            self.remove(old)
+        self.sensors.append(sensor_obj)
+        self.by_id[key] = sensor_obj
+        self.by_num.setdefault(sensor_obj.get_num(), []).append(sensor_obj)
+        self.by_name.setdefault(sensor_obj.get_name(), []).append(sensor_obj)
+        self.by_type.setdefault(sensor_obj.get_type(), []).\
+            append(sensor_obj)
+        self.by_entity.setdefault(sensor_obj.get_entity(), []).\
+            append(sensor_obj)
+        self.by_event.setdefault(sensor_obj.get_event_type(), []).\
+            append(sensor_obj)
+
+    def remove(self, sensor_obj):
+        self.sensors.remove(sensor_obj)
+        del self.by_id[sort_key(sensor_obj)]
+        for index, key in ((self.by_num, sensor_obj.get_num()),
+                           (self.by_name, sensor_obj.get_name()),
+                           (self.by_type, sensor_obj.get_type()),
+                           (self.by_entity, sensor_obj.get_entity()),
+                           (self.by_event, sensor_obj.get_event_type())):
+            index[key].remove(sensor_obj)
+            if not index[key]:
+                del index[key]
+
+    def match_keys(self, index, pattern, to_str):
+        """
+        Sensors under the keys of index matching pattern
+        """
+        matched = []
+        for key, sensors in index.items():
+            if fnmatch.fnmatchcase(to_str(key).lower(), pattern.lower()):
+                matched.extend(sensors)
+        return matched
+
+    def select(self, key, value):
+        if key == 'id':
+            return self.by_num.get(int(value, 16), [])
+        elif key == 'name':
+            if value in self.by_name:
+                return self.by_name[value]
+            return self.match_keys(self.by_name, value, str)
+        elif key == 'type':
+            try:
+                return self.by_type.get(int(value, 0), [])
+            except ValueError:
+                return self.match_keys(self.by_type, value,
+                                       lambda tp: sensor_type_name.get(tp,
+                                                                       ''))
+        elif key == 'entity':
+            entity, sep, instance = value.partition('.')
+            if sep:
+                return self.by_entity.get((int(entity, 0),
+                                           int(instance, 0)), [])
+            entity = int(entity, 0)
+            matched = []
+            for key, sensors in self.by_entity.items():
+                if key[0] == entity:
+                    matched.extend(sensors)
+            return matched
+        else:
+            return self.match_keys(self.by_event, value, str)
+
+    def query(self, terms):
+        """
+        Sensors matching all terms, sorted by mc, lun and number
+        :param terms: dict of key to value, see parse_query
+        """
+        candidates = None
+        for key, value in terms.items():
+            if key in ('mc', 'lun'):
+                continue
+            selected = self.select(key, value)
+            if candidates is None:
+                candidates = set(selected)
+            else:
+                candidates &= set(selected)
+            if not candidates:
+                return []
+        if candidates is None:
+            candidates = self.sensors
+
+        # mc and lun narrow down what the indexes gave
+        mc = terms.get('mc')
+        if mc is not None:
+            mc = int(mc, 0)
+            candidates = [sensor_obj for sensor_obj in candidates
+                          if sensor_obj.get_mc() == mc]
+        lun = terms.get('lun')
+        if lun is not None:
+            lun = int(lun, 0)
+            candidates = [sensor_obj for sensor_obj in candidates
+                          if sort_key(sensor_obj)[1] == lun]
+        return sorted(candidates, key=sort_key)
+
+
+class Sensor_Registry(object):
+    """
+    All sensors, with indexes for console queries. Readers take the
+    current index and keep using it; writers build a new one and swap it
+    in under lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = Sensor_Index()
+
+    def __len__(self):
+        return len(self.index.sensors)
+
+    def __iter__(self):
+        return iter(self.get_all())
+
+    def add(self, sensor_obj):
+        self.lock.acquire()
+        try:
+            index = self.index.copy()
+            index.add(sensor_obj)
+            self.index = index
+        finally:
+            self.lock.release()
+
+    def rebuild(self, sensors):
+        """
+        Replace all sensors at once
+        :return: sensors that were in the registry before
+        """
+        index = Sensor_Index(sensors)
+        self.lock.acquire()
+        try:
+            old, self.index = self.index, index
+        finally:
+            self.lock.release()
+        return old.sensors
+
+    def clear(self):
+        return self.rebuild([])
+
+    def get_all(self):
+        return sorted(self.index.sensors, key=sort_key)
+
+    def get(self, num, mc=DEFAULT_MC, lun=None):
+        """
+        Sensor by number, None if no such sensor. With lun None, the
+        sensor of the lowest lun is taken.
+        """
+        index = self.index
+        if lun is not None:
+            return index.by_id.get((mc, lun & 0x3, num))
+        for lun in range(0, 4):
+            if (mc, lun, num) in index.by_id:
+                return index.by_id[(mc, lun, num)]
+        return None
+
+    def get_by_name(self, name):
+        sensors = self.index.by_name.get(name)
+        if sensors:
+            return sensors[0]
+        return None
+
+    def query(self, query):
+        """
+        Sensors matching query, see parse_query. Raise ValueError if
+        the query is illegal.
+        """
+        return self.index.query(parse_query(query))
+
+
+sensor_registry = Sensor_Registry()
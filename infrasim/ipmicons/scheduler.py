@@ -0,0 +1,144 @@
+'''
+*********************************************************
+Copyright @ 2015 EMC Corporation All Rights Reserved
+*********************************************************
+'''
+import heapq
+import threading
+import time
+
+from .common import logger
+from .metrics import metrics
+
+# name of the queue in metrics
+SCHEDULER_QUEUE = 'sensor scheduler'
+
+
+class Sensor_Scheduler(threading.Thread):
+    """
+    One thread driving every sensor in auto or fault mode.
+
+    Sensors wait in a priority queue ordered by the time of their next
+    update. A mode change is an event: schedule() queues the sensor to
+    run now, cancel() drops it. Each call bumps the sensor's generation,
+    so entries queued before the change are skipped when they come up.
+
+    A sensor provides update(), which runs one step and returns the
+    seconds until its next update, or None to leave the queue.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='ipmicons.Sensor_Scheduler')
+        self.daemon = True
+        self.condition = threading.Condition()
+        self.queue = []
+        self.generation = {}
+        self.seq = 0
+        self.quit = False
+
+    def push(self, due, sensor_obj):
+        # seq keeps the order stable for sensors due at the same time
+        heapq.heappush(self.queue, (due, self.seq,
+                                    self.generation[sensor_obj],
+                                    sensor_obj))
+        self.seq += 1
+        metrics.set_queue_depth(SCHEDULER_QUEUE, len(self.queue))
+
+    def schedule(self, sensor_obj, delay=0):
+        """
+        Queue sensor to update after delay seconds, replacing any
+        update queued before.
+        """
+        self.condition.acquire()
+        try:
+            self.generation[sensor_obj] = \
+                self.generation.get(sensor_obj, 0) + 1
+            self.push(time.time() + delay, sensor_obj)
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def cancel(self, sensor_obj):
+        self.condition.acquire()
+        try:
+            if sensor_obj in self.generation:
+                self.generation[sensor_obj] += 1
+        finally:
+            self.condition.release()
+
+    def is_scheduled(self, sensor_obj):
+        self.condition.acquire()
+        try:
+            gen = self.generation.get(sensor_obj)
+            for entry in self.queue:
+                if entry[3] is sensor_obj and entry[2] == gen:
+                    return True
+            return False
+        finally:
+            self.condition.release()
+
+    def stop(self, timeout=None):
+        self.condition.acquire()
+        try:
+            self.quit = True
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        if self.is_alive():
+            self.join(timeout)
+
+    def next_due(self):
+        """
+        Wait until the head of the queue is due and pop it.
+        Return None when the scheduler is stopped.
+        Must be called with condition held.
+        """
+        while not self.quit:
+            # drop entries replaced or cancelled since queued
+            while self.queue and \
+                    self.queue[0][2] != self.generation.get(self.queue[0][3]):
+                heapq.heappop(self.queue)
+
+            if not self.queue:
+                self.condition.wait()
+                continue
+
+            delay = self.queue[0][0] - time.time()
+            if delay <= 0:
+                entry = heapq.heappop(self.queue)
+                metrics.set_queue_depth(SCHEDULER_QUEUE, len(self.queue))
+                return entry
+            self.condition.wait(delay)
+        return None
+
+    def run(self):
+        while True:
+            self.condition.acquire()
+            try:
+                entry = self.next_due()
+            finally:
+                self.condition.release()
+            if entry is None:
+                return
+
+            due, seq, gen, sensor_obj = entry
+            try:
+                interval = sensor_obj.update()
+            except Exception:
+                logger.exception('sensor {0} update failed'.
+                                 format(sensor_obj.get_name()))
+                interval = None
+
+            if interval is None:
+                continue
+
+            self.condition.acquire()
+            try:
+                # not re-queued if the mode was changed meanwhile
+                if self.generation.get(sensor_obj) == gen:
+                    self.push(max(due + interval, time.time()), sensor_obj)
+            finally:
+                self.condition.release()
+
+
+sensor_scheduler = Sensor_Scheduler()
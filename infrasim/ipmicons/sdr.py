@@ -5,30 +5,38 @@ Copyright @ 2015 EMC Corporation All Rights Reserved
 '''
 
 from .sensor import Sensor
-from .common import logger, msg_queue, send_ipmitool_command
+from .common import logger, send_ipmitool_command
+from .registry import sensor_registry
+from . import sel
+from .sdr_decoder import decode_records, load_sdr_file, \
+    Full_Sensor_Record, Compact_Sensor_Record
 import os
 import sys
-import struct
+import tempfile
 
-sensor_list = []
-sensor_name_list = []
-sensor_id_list = []
-sensor_name_map = {}
-sensor_id_map = {}
 
-SDR_NAME = "sdr.bin"
-
-
-def build_sensors(name, ID, mc, value, tp):
+def build_sensors(name, ID, mc, value, tp, event_type=0x0, lun=0x0):
+    """
+    Build a sensor and add it to the sensor registry
+    """
     sensor = Sensor(name, ID, value, tp)
-    sensor_list.append(sensor)
-    sensor_name_list.append(name)
-    sensor_id_list.append(ID)
-    sensor_name_map[name] = sensor
-    sensor_id_map[(ID, mc)] = sensor
+    sensor.set_mc(mc)
+    sensor.set_lun(lun)
+    sensor.set_event_type(event_type)
+    sensor_registry.add(sensor)
     return sensor
 
 
+def install_sensors(sensors):
+    """
+    Replace all sensors in the registry, sensors replaced are taken off
+    the sensor scheduler
+    """
+    for sensor_obj in sensor_registry.rebuild(sensors):
+        if sensor_obj.get_mode() != "user":
+            sensor_obj.set_mode("user")
+
+
 # dump sdrs into file
 def dump_all_sdrs(file_name):
     send_ipmitool_command("sdr", "dump", file_name)
@@ -60,237 +68,225 @@ def read_sensor_raw_value(sensor_num, event_type="threshold"):
         logger.info(info)
         return value
 
-def parse_sdrs():
-    dump_all_sdrs(SDR_NAME)
-    if os.path.isfile(SDR_NAME) == False:
-        print "The file don't exist, Please double check!"
-        sys.exit(1)
-
-    fd = open(SDR_NAME, 'rb')
-    file_size = os.path.getsize(SDR_NAME)
-    offset = 0
-    record_header_size = 5
-    while offset < file_size:
-        # get record type
-        fd.seek(offset+3)
-        record_type = ord(fd.read(1))
-
-        # get record length
-        fd.seek(offset+4)
-        record_length = ord(fd.read(1))
-
-        # we just care record type 0x1 and 0x2 right now
-        if record_type != 0x1 and record_type != 0x2:
-            offset += record_header_size + record_length
-            continue
-
-        # get mc address
-        fd.seek(offset+5)
-        mc = ord(fd.read(1))
-
-        # get LUN
-        fd.seek(offset+6)
-        lun = ord(fd.read(1))
-
-        # get sensor num
-        fd.seek(offset+7)
-        sensor_num = ord(fd.read(1))
-
-        # get sensor capability
-        fd.seek(offset+11)
-        sensor_cap = ord(fd.read(1))
-
-        # get sensor type
-        fd.seek(offset+12)
-        sensor_type = ord(fd.read(1))
-
-        # get event type
-        fd.seek(offset+13)
-        event_type = ord(fd.read(1))
-
-        if event_type == 0x0:
-            sensor_value = None
-        elif event_type == 0x1:
-            sensor_value = read_sensor_raw_value(sensor_num, 'threshold')
-        else:
-            sensor_value = read_sensor_raw_value(sensor_num, "discrete")
-
-        # get lower threshold mask(lower byte)
-        fd.seek(offset+14)
-        sensor_ltm_lb = ord(fd.read(1))
-
-        # get lower threshold mask(upper byte)
-        fd.seek(offset+15)
-        sensor_ltm_ub = ord(fd.read(1))
-
-        # get upper threshold mask(lower byte)
-        fd.seek(offset+16)
-        sensor_utm_lb = ord(fd.read(1))
-
-        # get upper threshold mask(upper byte)
-        fd.seek(offset+17)
-        sensor_utm_ub = ord(fd.read(1))
-
-        # settable threshold mask
-        fd.seek(offset+18)
-        sensor_rtm = ord(fd.read(1))
-
-        # readable threshold mask
-        fd.seek(offset+19)
-        sensor_stm = ord(fd.read(1))
-
-        # get sensor units 1 byte
-        fd.seek(offset+20)
-        sensor_su1 = ord(fd.read(1))
 
-        # get sensor units 2 byte
-        fd.seek(offset+21)
-        sensor_su2 = ord(fd.read(1))
-
-        sensor_name = ''
-        sensor_obj = None
-        # Full sensor record
-        if record_type == 0x1:
-            # get sensor name
-            sensor_name_length = record_header_size + record_length - 48
-            fd.seek(offset+48)
-            for index in range(0, sensor_name_length):
-                sensor_name += chr(ord(fd.read(1)))
-
-            # build sensor
-            sensor_obj = build_sensors(sensor_name,
-                                       sensor_num,
-                                       mc,
-                                       sensor_value,
-                                       sensor_type)
-
-            # get sensor "M" value lower byte
-            fd.seek(offset+24)
-            sensor_m_lb = ord(fd.read(1))
-
-            # get sensor "M" value upper byte
-            fd.seek(offset+25)
-            sensor_m_ub = ord(fd.read(1))
+def build_sensor_from_sdr(record, sensor_value):
+    """
+    Build a sensor from one decoded full or compact sensor record, it is
+    not in the sensor registry yet
+    :param record: Full_Sensor_Record or Compact_Sensor_Record
+    :param sensor_value: initial reading of the sensor
+    :return: the sensor object
+    """
+    mc = record.owner_id
+    sensor_obj = Sensor(record.name,
+                        record.sensor_num,
+                        sensor_value,
+                        record.sensor_type)
+    sensor_obj.set_entity(record.entity_id, record.entity_instance)
 
-            # get sensor "B" value lower byte
-            fd.seek(offset+26)
-            sensor_b_lb = ord(fd.read(1))
+    # Full sensor record carries the reading factors and thresholds
+    if isinstance(record, Full_Sensor_Record):
+        sensor_obj.set_m_lb(record.m_lb)
+        sensor_obj.set_m_ub(record.m_ub)
+        sensor_obj.set_b_lb(record.b_lb)
+        sensor_obj.set_b_ub(record.b_ub)
+        sensor_obj.set_accuracy(record.accuracy)
+        sensor_obj.set_exp(record.exp)
 
-            # get sensor "B" value upper byte
-            fd.seek(offset+27)
-            sensor_b_ub = ord(fd.read(1))
+        sensor_obj.set_unr(record.unr)
+        sensor_obj.set_uc(record.uc)
+        sensor_obj.set_unc(record.unc)
+        sensor_obj.set_lnr(record.lnr)
+        sensor_obj.set_lc(record.lc)
+        sensor_obj.set_lnc(record.lnc)
 
-            # get Accuracy
-            fd.seek(offset+28)
-            sensor_acc = ord(fd.read(1))
+    sensor_obj.set_mc(mc)
+    sensor_obj.set_lun(record.owner_lun)
 
-            # get exp value
-            fd.seek(offset+29)
-            sensor_exp = ord(fd.read(1))
+    # lower and upper threshold masks
+    sensor_obj.set_ltm_lb(record.ltm_lb)
+    sensor_obj.set_ltm_ub(record.ltm_ub)
+    sensor_obj.set_utm_lb(record.utm_lb)
+    sensor_obj.set_utm_ub(record.utm_ub)
 
-            #  set sensor "M" value lower byte
-            sensor_obj.set_m_lb(sensor_m_lb)
+    # settable and readable threshold masks
+    sensor_obj.set_stm(record.stm)
+    sensor_obj.set_rtm(record.rtm)
 
-            # set sensor "M" value upper byte
-            sensor_obj.set_m_ub(sensor_m_ub)
+    # sensor units 1 byte
+    sensor_obj.set_su1(record.su1)
 
-            # set sensor "B" value lower byte
-            sensor_obj.set_b_lb(sensor_b_lb)
+    # Forrest comment this raw value out since we have
+    # no clue how this sensor unit bit [7:6] impacts sensor
+    # reading.
 
-            # set sensor "B" value upper byte
-            sensor_obj.set_b_ub(sensor_b_ub)
+    # if sensor_su1 >> 6 != 0:
+    #     raw_value = struct.unpack('b', chr(sensor_value))[0]
+    #     sensor_obj.set_raw_value(raw_value)
 
-            sensor_obj.set_accuracy(sensor_acc)
+    # sensor units 2 byte
+    sensor_obj.set_su2(record.su2)
 
-            # set exp value
-            sensor_obj.set_exp(sensor_exp)
+    sensor_obj.set_cap(record.sensor_cap)
+    sensor_obj.set_event_type(record.event_type)
 
-            # set threshold
-            fd.seek(offset+36)
-            sensor_obj.set_unr(ord(fd.read(1)))
+    # initialize SEL for the sensor
+    sensor_obj.initialize_sel()
 
-            fd.seek(offset+37)
-            sensor_obj.set_uc(ord(fd.read(1)))
+    return sensor_obj
 
-            fd.seek(offset+38)
-            sensor_obj.set_unc(ord(fd.read(1)))
 
-            fd.seek(offset+39)
-            sensor_obj.set_lnr(ord(fd.read(1)))
+# convert a number token of emu file, e.g. "0x1f" or "6"
+def emu_int(token):
+    if token.lower().startswith('0x'):
+        return int(token, 16)
+    return int(token)
 
-            fd.seek(offset+40)
-            sensor_obj.set_lc(ord(fd.read(1)))
 
-            fd.seek(offset+41)
-            sensor_obj.set_lnc(ord(fd.read(1)))
+def read_emu_file(emu_file):
+    """
+    Read an ipmi_sim emulation file and return its commands as token
+    lists, comments dropped and continued lines joined.
+    """
+    commands = []
+    tokens = []
+    with open(emu_file, 'r') as fd:
+        for line in fd:
+            line = line.strip()
+            if line.startswith('#'):
+                continue
+            continued = line.endswith('\\')
+            if continued:
+                line = line[:-1]
+            tokens.extend(line.split())
+            if not continued and tokens:
+                commands.append(tokens)
+                tokens = []
+    if tokens:
+        commands.append(tokens)
+    return commands
+
+
+def parse_emu_file(emu_file):
+    """
+    Build all sensors from the emulation file ipmi_sim was started
+    with, and take SEL capacity from sel_enable. SDRs come from
+    main_sdr_add, initial readings from
+    sensor_set_value (threshold) and sensor_set_bit (discrete), and
+    live threshold levels from sensor_set_threshold.
+    """
+    records = []
+    values = {}
+    states = {}
+    thresholds = {}
+    sensors = []
+
+    for tokens in read_emu_file(emu_file):
+        try:
+            if tokens[0] == "main_sdr_add":
+                records.append(bytearray([emu_int(x) for x in tokens[2:]]))
+                continue
+            if tokens[0] == "sel_enable":
+                # sel_enable <mc> <max entries> <flags>
+                sel.sel_capacity[emu_int(tokens[1])] = emu_int(tokens[2])
+                continue
+            if tokens[0] not in ("sensor_set_value",
+                                 "sensor_set_bit",
+                                 "sensor_set_threshold"):
+                continue
+            key = (emu_int(tokens[1]), emu_int(tokens[2]),
+                   emu_int(tokens[3]))
+            if tokens[0] == "sensor_set_value":
+                values[key] = emu_int(tokens[4])
+            elif tokens[0] == "sensor_set_bit":
+                mask = 1 << emu_int(tokens[4])
+                if emu_int(tokens[5]):
+                    states[key] = states.get(key, 0) | mask
+                else:
+                    states[key] = states.get(key, 0) & ~mask
+            else:
+                # <support> <enabled> <unr> <uc> <unc> <lnr> <lc> <lnc>
+                thresholds[key] = (tokens[5],
+                                   [emu_int(x) for x in tokens[6:12]])
+        except (IndexError, ValueError):
+            logger.error("illegal emu command: {0}".format(' '.join(tokens)))
+
+    # decode all records in one pass over a single buffer
+    for record in decode_records(bytearray().join(records)):
+        # we just care sensor records with a reading right now
+        if not isinstance(record, (Full_Sensor_Record,
+                                   Compact_Sensor_Record)):
+            continue
 
-            # output the sensor reading factor
-            sensor_obj.get_reading_factor()
-        # compact sensor record
+        key = (record.owner_id, record.get_lun(), record.sensor_num)
+        event_type = record.event_type
+        if event_type == 0x0:
+            sensor_value = None
+        elif event_type == 0x1:
+            sensor_value = values.get(key, 0)
         else:
-            # get sensor name
-            sensor_name_length = record_header_size + record_length - 32
-            fd.seek(offset+32)
-            for index in range(0, sensor_name_length):
-                sensor_name += chr(ord(fd.read(1)))
-
-            # build sensor
-            sensor_obj = build_sensors(sensor_name,
-                                       sensor_num,
-                                       mc,
-                                       sensor_value,
-                                       sensor_type)
+            # same layout as 'Get Sensor Reading' byte 3 and 4
+            mask = states.get(key, 0)
+            sensor_value = "0x{0:02x}{1:02x}".format(mask & 0xff,
+                                                     (mask >> 8) & 0x7f)
 
-        # set mc address
-        sensor_obj.set_mc(mc)
+        sensor_obj = build_sensor_from_sdr(record, sensor_value)
+        sensors.append(sensor_obj)
 
-        # set lun
-        sensor_obj.set_lun(lun)
+        if isinstance(record, Full_Sensor_Record) and \
+                event_type == 0x1 and key in thresholds:
+            enabled, levels = thresholds[key]
+            setters = [sensor_obj.set_unr, sensor_obj.set_uc,
+                       sensor_obj.set_unc, sensor_obj.set_lnr,
+                       sensor_obj.set_lc, sensor_obj.set_lnc]
+            for flag, level, setter in zip(enabled, levels, setters):
+                if flag == '1':
+                    setter(level)
 
-        # set lower threshold (lower byte)
-        sensor_obj.set_ltm_lb(sensor_ltm_lb)
+    install_sensors(sensors)
 
-        # set lower threshold (upper byte)
-        sensor_obj.set_ltm_ub(sensor_ltm_ub)
 
-        # set upper threshold (lower byte)
-        sensor_obj.set_utm_lb(sensor_utm_lb)
-
-        # set upper threshold (upper byte)
-        sensor_obj.set_utm_ub(sensor_utm_ub)
-
-        # set settable threshold mask
-        sensor_obj.set_stm(sensor_stm)
-
-        # set readable threshold mask
-        sensor_obj.set_rtm(sensor_rtm)
-
-        # set sensor units 1 byte
-        sensor_obj.set_su1(sensor_su1)
-
-        # Forrest comment this raw value out since we have
-        # no clue how this sensor unit bit [7:6] impacts sensor
-        # reading.
-
-        # if sensor_su1 >> 6 != 0:
-        #     raw_value = struct.unpack('b', chr(sensor_value))[0]
-        #     sensor_obj.set_raw_value(raw_value)
-
-        # set sensor units 2 byte
-        sensor_obj.set_su2(sensor_su2)
-
-        # set capability
-        sensor_obj.set_cap(sensor_cap)
+def parse_sdrs(emu_file=None):
+    """
+    Build all sensors. Use the emulation file if there is one, otherwise
+    dump the SDR repository and read every sensor with ipmitool. The
+    sensors replace those in the registry at once, so it is safe to call
+    again while sessions are running.
+    """
+    if emu_file and os.path.isfile(emu_file):
+        logger.info("build sensors from {0}".format(emu_file))
+        parse_emu_file(emu_file)
+        return
+
+    # ipmitool only dumps to a file, keep it out of the working directory
+    fd, sdr_file = tempfile.mkstemp(prefix="ipmicons-", suffix=".sdr")
+    os.close(fd)
+    try:
+        dump_all_sdrs(sdr_file)
+        records = load_sdr_file(sdr_file)
+    finally:
+        os.remove(sdr_file)
+
+    if not records:
+        print "Fail to dump SDR repository, Please double check!"
+        sys.exit(1)
 
-        # set event type
-        sensor_obj.set_event_type(event_type)
+    sensors = []
+    for record in records:
+        # we just care sensor records with a reading right now
+        if not isinstance(record, (Full_Sensor_Record,
+                                   Compact_Sensor_Record)):
+            continue
 
-        # initialize SEL for the sensor
-        sensor_obj.initialize_sel()
+        if record.event_type == 0x0:
+            sensor_value = None
+        elif record.event_type == 0x1:
+            sensor_value = read_sensor_raw_value(record.sensor_num,
+                                                 'threshold')
+        else:
+            sensor_value = read_sensor_raw_value(record.sensor_num,
+                                                 "discrete")
 
-        # move to next sensor
-        offset = offset + record_length + record_header_size
+        sensors.append(build_sensor_from_sdr(record, sensor_value))
 
-    # delete temp file
-    fd.close()
-    os.remove(SDR_NAME)
+    install_sensors(sensors)
@@ -0,0 +1,185 @@
+'''
+*********************************************************
+Copyright @ 2015 EMC Corporation All Rights Reserved
+*********************************************************
+'''
+# Decode an SDR repository, as dumped by 'ipmitool sdr dump' or added by
+# main_sdr_add in an emulation file, in one pass over a single buffer.
+#
+# Every record is decoded with struct.unpack_from against the buffer,
+# and yielded as a typed object:
+#     0x01  Full_Sensor_Record
+#     0x02  Compact_Sensor_Record
+#     0x03  Event_Only_Record
+#     0x11  FRU_Locator_Record
+#     0x12  MC_Locator_Record
+# Other record types come as plain SDR_Record with header fields only.
+# Field layouts follow IPMI 2.0 section 43.
+
+import mmap
+import os
+import struct
+
+SDR_HEADER = struct.Struct('<HBBB')
+SDR_HEADER_SIZE = SDR_HEADER.size
+
+
+class SDR_Record(object):
+    """
+    Base of all records, fields of the record body are decoded with
+    body_format into body_fields, starting right after the header.
+    """
+    record_type = None
+    body_format = None
+    body_fields = ()
+    # offset of the id string type/length byte, relative to record start
+    id_offset = None
+
+    def __init__(self, record_id, version, record_type, length):
+        self.record_id = record_id
+        self.version = version
+        self.record_type = record_type
+        self.length = length
+        self.name = ''
+
+    def decode(self, data, offset):
+        """
+        Decode record body from data, offset is where the record starts
+        """
+        if self.body_format is None:
+            return
+        end = offset + SDR_HEADER_SIZE + self.length
+        if offset + SDR_HEADER_SIZE + self.body_format.size > end:
+            raise ValueError('SDR record 0x{0:04x} type 0x{1:02x} is too '
+                             'short'.format(self.record_id, self.record_type))
+        values = self.body_format.unpack_from(data, offset + SDR_HEADER_SIZE)
+        for field, value in zip(self.body_fields, values):
+            setattr(self, field, value)
+
+        if self.id_offset is not None and offset + self.id_offset < end:
+            # bit 4:0 is the length of the id string
+            id_length = struct.unpack_from('B', data,
+                                           offset + self.id_offset)[0] & 0x1f
+            start = offset + self.id_offset + 1
+            self.name = str(data[start:min(start + id_length, end)])
+
+
+class Sensor_Record(SDR_Record):
+    """
+    Fields shared by full and compact sensor records
+    """
+
+    def get_mc(self):
+        return self.owner_id
+
+    def get_lun(self):
+        return self.owner_lun & 0x3
+
+    def get_num(self):
+        return self.sensor_num
+
+
+class Full_Sensor_Record(Sensor_Record):
+    record_type = 0x01
+    body_format = struct.Struct('<43B')
+    body_fields = ('owner_id', 'owner_lun', 'sensor_num',
+                   'entity_id', 'entity_instance',
+                   'sensor_init', 'sensor_cap', 'sensor_type', 'event_type',
+                   'ltm_lb', 'ltm_ub', 'utm_lb', 'utm_ub', 'rtm', 'stm',
+                   'su1', 'su2', 'su3', 'linearization',
+                   'm_lb', 'm_ub', 'b_lb', 'b_ub', 'accuracy', 'exp',
+                   'analog_flags', 'nominal_reading',
+                   'normal_max', 'normal_min', 'sensor_max', 'sensor_min',
+                   'unr', 'uc', 'unc', 'lnr', 'lc', 'lnc',
+                   'positive_hysteresis', 'negative_hysteresis',
+                   'reserved_1', 'reserved_2', 'oem', 'id_type_length')
+    id_offset = 47
+
+
+class Compact_Sensor_Record(Sensor_Record):
+    record_type = 0x02
+    body_format = struct.Struct('<27B')
+    body_fields = ('owner_id', 'owner_lun', 'sensor_num',
+                   'entity_id', 'entity_instance',
+                   'sensor_init', 'sensor_cap', 'sensor_type', 'event_type',
+                   'ltm_lb', 'ltm_ub', 'utm_lb', 'utm_ub', 'rtm', 'stm',
+                   'su1', 'su2', 'su3', 'record_sharing_1', 'record_sharing_2',
+                   'positive_hysteresis', 'negative_hysteresis',
+                   'reserved_1', 'reserved_2', 'reserved_3',
+                   'oem', 'id_type_length')
+    id_offset = 31
+
+
+class Event_Only_Record(Sensor_Record):
+    record_type = 0x03
+    body_format = struct.Struct('<12B')
+    body_fields = ('owner_id', 'owner_lun', 'sensor_num',
+                   'entity_id', 'entity_instance',
+                   'sensor_type', 'event_type',
+                   'record_sharing_1', 'record_sharing_2',
+                   'reserved', 'oem', 'id_type_length')
+    id_offset = 16
+
+
+class FRU_Locator_Record(SDR_Record):
+    record_type = 0x11
+    body_format = struct.Struct('<11B')
+    body_fields = ('access_address', 'fru_device_id', 'access_lun',
+                   'channel', 'reserved', 'device_type',
+                   'device_type_modifier', 'entity_id', 'entity_instance',
+                   'oem', 'id_type_length')
+    id_offset = 15
+
+
+class MC_Locator_Record(SDR_Record):
+    record_type = 0x12
+    body_format = struct.Struct('<11B')
+    body_fields = ('slave_address', 'channel', 'power_state',
+                   'device_cap', 'reserved_1', 'reserved_2', 'reserved_3',
+                   'entity_id', 'entity_instance',
+                   'oem', 'id_type_length')
+    id_offset = 15
+
+
+record_classes = {}
+for cls in (Full_Sensor_Record, Compact_Sensor_Record, Event_Only_Record,
+            FRU_Locator_Record, MC_Locator_Record):
+    record_classes[cls.record_type] = cls
+
+
+def decode_records(data):
+    """
+    Yield typed records from an SDR repository buffer, e.g. a str,
+    bytearray or mmap. A truncated tail record ends the iteration.
+    """
+    offset = 0
+    size = len(data)
+    while offset + SDR_HEADER_SIZE <= size:
+        record_id, version, record_type, length = \
+            SDR_HEADER.unpack_from(data, offset)
+        if offset + SDR_HEADER_SIZE + length > size:
+            return
+        record = record_classes.get(record_type, SDR_Record)(
+            record_id, version, record_type, length)
+        try:
+            record.decode(data, offset)
+        except ValueError:
+            # too short for its type, keep the header only
+            record = SDR_Record(record_id, version, record_type, length)
+        yield record
+        offset += SDR_HEADER_SIZE + length
+
+
+def load_sdr_file(file_name):
+    """
+    Decode all records in an SDR dump file, the file is mapped into
+    memory rather than read.
+    """
+    with open(file_name, 'rb') as fd:
+        if os.fstat(fd.fileno()).st_size == 0:
+            return []
+        data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return list(decode_records(data))
+        finally:
+            data.close()
@@ -3,7 +3,9 @@
 Copyright @ 2015 EMC Corporation All Rights Reserved
 *********************************************************
 '''
-from .common import logger, msg_queue, send_ipmi_sim_command
+import struct
+
+from .common import logger, null_response, send_ipmi_sim_command
 
 # sensor number --> Event Type( 01, 02-0C, 6F ) --> sensor Type
 #                    Event Type
@@ -409,6 +411,95 @@ sensor_specific_event_map = {
 }
 
 
+# max SEL entries of each mc, from sel_enable in the emulation file
+sel_capacity = {}
+
+# SEL record layout, IPMI 2.0 section 32. sel_add takes the record type
+# and the 13 bytes from the timestamp on, ipmi_sim assigns the record id.
+SEL_RECORD_LENGTH = 16
+SEL_RECORD_TYPE = 2
+SEL_TIMESTAMP = 3
+SEL_EVENT_DIR_TYPE = 12
+SEL_EVENT_DATA = 13
+# record type and the 13 bytes after it, record id left 0
+sel_record = struct.Struct('<2x14B')
+
+# hex() of every byte value, so encoding a record does no formatting
+hex_byte = [hex(b) for b in range(256)]
+
+
+def encode_record(mc, record):
+    """
+    sel_add line of a 16 byte SEL record
+    """
+    return 'sel_add ' + hex(mc) + ' ' + \
+        ' '.join([hex_byte[b] for b in record[SEL_RECORD_TYPE:]])
+
+
+class SEL_Template:
+    """
+    A SEL record packed once for an event source, e.g. a sensor. Only
+    timestamp, event direction and event data change from event to
+    event; the sel_add line up to the sensor number is kept ready, so
+    an event is encoded with four table lookups.
+    """
+    def __init__(self, mc, record):
+        self.mc = mc
+        self.record = bytearray(record)
+        self.head = encode_record(mc, self.record[:SEL_EVENT_DIR_TYPE])
+        self.event_type = self.record[SEL_EVENT_DIR_TYPE] & 0x7f
+
+    def pack(self, event_dir=None, event_data=None, timestamp=None):
+        """
+        The record with the given fields patched in
+        :return: 16 byte bytearray
+        """
+        record = bytearray(self.record)
+        if timestamp is not None:
+            record[SEL_TIMESTAMP:SEL_TIMESTAMP + 4] = \
+                struct.pack('<I', timestamp)
+        if event_dir is not None:
+            record[SEL_EVENT_DIR_TYPE] = (event_dir << 7) | self.event_type
+        if event_data is not None:
+            record[SEL_EVENT_DATA:SEL_RECORD_LENGTH] = bytearray(event_data)
+        return record
+
+    def encode(self, event_dir=None, event_data=None, timestamp=None):
+        """
+        sel_add line of the record with the given fields patched in
+        :param event_data: the 3 event data bytes
+        :param timestamp: seconds, left 0 ipmi_sim stamps the event
+        """
+        if timestamp is not None or event_dir is None or \
+                event_data is None:
+            return encode_record(self.mc, self.pack(event_dir, event_data,
+                                                    timestamp))
+        return self.head + ' ' + \
+            hex_byte[(event_dir << 7) | self.event_type] + ' ' + \
+            hex_byte[event_data[0]] + ' ' + hex_byte[event_data[1]] + \
+            ' ' + hex_byte[event_data[2]]
+
+
+def send_sel_add(command, batch=None):
+    """
+    Send a sel_add line to ipmi_sim, or queue it in batch if given
+    """
+    logger.info(command)
+    if batch is not None:
+        batch.add(command)
+        return
+    send_ipmi_sim_command(command)
+
+
+def encode_events(events):
+    """
+    sel_add lines of a batch of events
+    :param events: (template, event_dir, event_data) of each event
+    """
+    return [template.encode(event_dir, event_data)
+            for template, event_dir, event_data in events]
+
+
 # standard SEL
 class SEL:
     def __init__(self):
@@ -463,7 +554,7 @@ class SEL:
     def set_event_data_3(self, event_data_3):
         self.event_data_3 = event_data_3
 
-    def check_event_type(self):
+    def check_event_type(self, response=null_response):
         if self.event_type == 0x6F:
             return True
         elif self.event_type >= 0x1 and self.event_type <= 0x0C:
@@ -473,11 +564,11 @@ class SEL:
             error_info += 'event type {0} not in the sensor events.\
                     perhaps OEM defined'.format(hex(self.event_type))
             logger.error(error_info)
-            msg_queue.put(error_info)
+            response.put(error_info)
             return False
 
     # Standard sensor type range 0x1 - 0x2C.
-    def check_sensor_type(self):
+    def check_sensor_type(self, response=null_response):
         if self.sensor_type >= 0x1 and self.sensor_type <= 0x2C:
             return True
         else:
@@ -485,31 +576,38 @@ class SEL:
             error_info += 'sensor type {0} not exist in the stardard \
                     system\n'.format(hex(self.sensor_type))
             logger.error(error_info)
-            msg_queue.put(error_info)
+            response.put(error_info)
             return False
 
-    # return the supported event list
-    def get_event(self):
+    def get_events(self):
+        """
+        Return [(event id, description)] of the supported events, None
+        if the event type has no events defined
+        """
         if self.event_type >= 0x1 and self.event_type <= 0x0C:
-            events = events_map[self.event_type]
-            for event_id, description in events.items():
-                info = '\tID: {0}\t{1}\n'.format(event_id, description)
-                logger.info(info)
-                msg_queue.put(info)
+            return sorted(events_map[self.event_type].items())
         elif self.event_type == 0x6F:
-            events = sensor_specific_event_map[self.sensor_type]
-            for event_id, event in events.items():
-                info = '\tID: {0}\t{1}\n'.format(event_id, event[3])
+            events = sensor_specific_event_map.get(self.sensor_type, {})
+            return sorted([(event_id, event[3])
+                           for event_id, event in events.items()])
+        return None
+
+    # return the supported event list
+    def get_event(self, response=null_response):
+        events = self.get_events()
+        if events is not None:
+            for event_id, description in events:
+                info = '\tID: {0}\t{1}\n'.format(event_id, description)
                 logger.info(info)
-                msg_queue.put(info)
+                response.put(info)
         else:
             error_info = 'sensor num: {0} event type {1} not exist\n'.format(
                         hex(self.sensor_num), hex(self.event_type))
             logger.error(error_info)
-            msg_queue.put(error_info)
+            response.put(error_info)
         return True
 
-    def set_event_data(self, event_id):
+    def set_event_data(self, event_id, response=null_response):
         # check if sensor specific event
         if self.event_type >= 0x1 and self.event_type <= 0x0C:
             events = events_map[self.event_type]
@@ -518,7 +616,7 @@ class SEL:
                 error_info += 'sensor num: {0} sensor type: {1} event type: {2}\n'.format( \
                             hex(self.sensor_num), hex(self.sensor_type), hex(self.event_type))
                 logger.info(error_info)
-                msg_queue.put(error_info)
+                response.put(error_info)
                 return False
             self.event_data_1 = event_id
             self.event_data_2 = 0
@@ -530,7 +628,7 @@ class SEL:
                 error_info += 'sensor num: {0} sensor type: {1} event type: {2}\n'.format( \
                             hex(self.sensor_num), hex(self.sensor_type), hex(self.event_type))
                 logger.info(error_info)
-                msg_queue.put(error_info)
+                response.put(error_info)
                 return False
             self.event_data_1 = events[event_id][0]
             self.event_data_2 = events[event_id][1]
@@ -538,20 +636,31 @@ class SEL:
         else:
             error_info = 'event type {0} not exist\n'.format(self.event_type)
             error_info += 'sensor num: {0}\n'.format(self.sensor_num)
-            msg_queue.put(error_info)
+            response.put(error_info)
             logger.error(error_info)
             return False
         return True
 
-    # send SEL to IPMI simulator
-    def send_event(self):
-        command = 'sel_add ' + hex(self.mc) + ' ' + hex(self.record_type) + ' ' \
-              + hex(self.ts_1) + ' ' + hex(self.ts_2) + ' ' + hex(self.ts_3) + ' ' + hex(self.ts_4) + ' ' \
-              + hex(self.gid_1) + ' ' + hex(self.gid_2) + ' ' + hex(self.evm_rev) + ' ' \
-              + hex(self.sensor_type) + ' ' + hex(self.sensor_num) + ' ' + hex((self.event_dir << 7)| self.event_type) + ' ' \
-              + hex(self.event_data_1) + ' ' + hex(self.event_data_2) + ' ' + hex(self.event_data_3) + '\n'
-        logger.info(command)
-        send_ipmi_sim_command(command)
+    def get_event_data(self):
+        return self.event_data_1, self.event_data_2, self.event_data_3
+
+    def pack(self):
+        """
+        The 16 byte SEL record, record id left to ipmi_sim
+        """
+        return bytearray(sel_record.pack(
+            self.record_type, self.ts_1, self.ts_2, self.ts_3, self.ts_4,
+            self.gid_1, self.gid_2, self.evm_rev,
+            self.sensor_type, self.sensor_num,
+            (self.event_dir << 7) | self.event_type,
+            self.event_data_1, self.event_data_2, self.event_data_3))
+
+    def get_template(self):
+        return SEL_Template(self.mc, self.pack())
+
+    # send SEL to IPMI simulator, or queue it in batch if given
+    def send_event(self, batch=None):
+        send_sel_add(encode_record(self.mc, self.pack()), batch)
 
 
 # OEM SEL Record - Type C0h-DFh
@@ -559,29 +668,44 @@ class OEM_SEL_C0_DF:
     def __init__(self):
         self.mc = 0x20
         self.record_id = 0
-        self.record_type = 0
+        self.record_type = 0xC0
         self.ts_1 = 0
         self.ts_2 = 0
         self.ts_3 = 0
         self.ts_4 = 0
         self.mfg_id_1 = 0
         self.mfg_id_2 = 0
+        self.mfg_id_3 = 0
 
         # byte 11 - byte 16
         self.oem_defined = []
 
+    def set_mc(self, mc):
+        self.mc = mc
+
+    def set_record_type(self, record_type):
+        self.record_type = record_type
+
+    def set_mfg_id(self, mfg_id):
+        self.mfg_id_1 = mfg_id & 0xff
+        self.mfg_id_2 = (mfg_id >> 8) & 0xff
+        self.mfg_id_3 = (mfg_id >> 16) & 0xff
+
     def set_oem_defined_bytes(self, elements):
         for element in elements:
             self.oem_defined.append(element)
 
-    def send_event(self, sel):
-        command = 'sel_add ' + hex(self.mc) + ' ' + hex(self.record_type) + ' ' \
-                + hex(self.ts_1) + ' ' + hex(self.ts_2) + ' ' + hex(self.ts_3) + ' ' + hex(self.ts_4) + ' ' \
-                + hex(self.mfg_id_1) + ' ' + hex(self.mfg_id_2) + ' ' + hex(self.mfg_id_3) + ' ' \
-                + ' '.join([hex(x) for x in self.oem_defined]) + '\n'
+    def pack(self):
+        """
+        The 16 byte SEL record, OEM bytes missing are 0
+        """
+        oem_defined = (self.oem_defined + [0] * 6)[:6]
+        return bytearray(sel_record.pack(
+            self.record_type, self.ts_1, self.ts_2, self.ts_3, self.ts_4,
+            self.mfg_id_1, self.mfg_id_2, self.mfg_id_3, *oem_defined))
 
-        logger.info(command)
-        send_ipmi_sim_command(command)
+    def send_event(self, batch=None):
+        send_sel_add(encode_record(self.mc, self.pack()), batch)
 
 
 # OEM SEL Record - Type E0h-FFh
@@ -591,16 +715,26 @@ class OEM_SEL_E0_FF:
         # two bytes record ID
         self.record_id = 0
 
-        self.record_type = 0
+        self.record_type = 0xE0
         # byte 4 - byte 16
         self.oem_defined = []
 
+    def set_mc(self, mc):
+        self.mc = mc
+
+    def set_record_type(self, record_type):
+        self.record_type = record_type
+
     def set_oem_defined_bytes(self, elements):
         for element in elements:
             self.oem_defined.append(element)
 
-    def send_event(self, sel):
-        command = 'sel_add ' + hex(self.mc) + ' ' + hex(self.record_type) + ' ' \
-                + ' '.join([hex(x) for x in self.oem_defined]) + '\n'
-        logger.info(command)
-        send_ipmi_sim_command(command)
+    def pack(self):
+        """
+        The 16 byte SEL record, OEM bytes missing are 0
+        """
+        oem_defined = (self.oem_defined + [0] * 13)[:13]
+        return bytearray(sel_record.pack(self.record_type, *oem_defined))
+
+    def send_event(self, batch=None):
+        send_sel_add(encode_record(self.mc, self.pack()), batch)
@@ -5,10 +5,15 @@ Copyright @ 2015 EMC Corporation All Rights Reserved
 *********************************************************
 '''
 
-from .common import msg_queue, send_ipmi_sim_command
+from .common import logger, null_response, send_ipmi_sim_command, \
+    IPMI_SIM_Batch, ipmi_sim_pool, is_acknowledged
+import bisect
 import random
 import threading
-from .sel import SEL
+import time
+from .sel import SEL, send_sel_add
+from .scheduler import sensor_scheduler
+from .engine import auto_engine
 from functools import wraps
 
 sensor_unit = {
@@ -48,6 +53,53 @@ sensor_unit = {
     33: 'cm',        67: 'kilobit',
 }
 
+# bit of each threshold level in readable and settable threshold mask
+threshold_mask = {
+    'lnc': 0x01, 'lc': 0x02, 'lnr': 0x04,
+    'unc': 0x08, 'uc': 0x10, 'unr': 0x20,
+}
+
+# discrete sensor states are held as a bitmask, bit n is state n;
+# state 15 is reserved and never written
+DISCRETE_STATES_MASK = 0x7fff
+
+# thresholds in the order sensor info shows them, and their bit in the
+# readable threshold mask
+READABLE_THRESHOLDS = (('lnr', 0x04), ('lc', 0x02), ('lnc', 0x01),
+                       ('unc', 0x08), ('uc', 0x10), ('unr', 0x20))
+
+
+def parse_discrete_value(value):
+    """
+    Convert discrete sensor value in format of 2 byte little endian to
+    states bitmask, e.g. 0xca10 to 0x10ca
+    """
+    if len(value) != 6 or not value.startswith('0x'):
+        raise ValueError('Discrete sensor value should be in format '
+                         'of 2 bytes in little endian, e.g. 0x1ac0')
+    return int(value[4:6] + value[2:4], 16)
+
+
+def format_discrete_value(states):
+    """
+    Convert states bitmask back to 2 byte little endian, e.g. 0x10ca to
+    0xca10
+    """
+    return "0x{0:02x}{1:02x}".format(states & 0xff, (states >> 8) & 0xff)
+
+
+def changed_states(old, new):
+    """
+    Yield (state id, bit) of each state that differs between two
+    bitmasks, lowest state first
+    """
+    changed = (old ^ new) & DISCRETE_STATES_MASK
+    while changed:
+        lowest = changed & -changed
+        state_id = lowest.bit_length() - 1
+        yield state_id, (new >> state_id) & 1
+        changed ^= lowest
+
 
 class with_type(object):
     """
@@ -79,23 +131,44 @@ class Sensor:
         self.name = name
         self.ID = ID
         self.tp = tp
+        self.mc = 0x20
+        self.lun = 0x0
+        self.event_type = 0x0
+        # entity id and instance
+        self.entity = (0, 0)
         self.lock = threading.Lock()
         self.lock_sensor_write = threading.Lock()
-        self.condition = threading.Condition()
-        self.time_cond = threading.Condition()
         self.mode = "user"
+        # seconds between two updates in auto mode
+        self.interval = 5
         self.value = value
-        self.quit = False
+        # states bitmask of a discrete sensor
+        self.states = 0
+        if isinstance(value, str):
+            self.states = parse_discrete_value(value)
         self.lnr = 0
         self.lnc = 0
         self.lc = 0
         self.unc = 0
         self.uc = 0
         self.unr = 0
+        self.analog_table = None
         self.sel = SEL()
-
-    def set_quit(self, flag):
-        self.quit = flag
+        # record of the events of this sensor, built on first event
+        self.sel_template = None
+        # change suppression of auto mode readings, in raw counts and
+        # writes per second, 0 to turn off
+        self.min_delta = 0
+        self.hysteresis = 0
+        self.max_rate = 0
+        # last value ipmi_sim acknowledged, with the pool epoch it was
+        # acknowledged in, see IPMI_SIM_Pool.get_epoch
+        self.sent_value = None
+        self.sent_epoch = None
+        self.sent_time = 0
+        self.write_seq = 0
+        self.ack_seq = 0
+        self.suppressed = 0
 
     def set_fault_level(self, fl):
         self.fault_level = fl
@@ -115,8 +188,46 @@ class Sensor:
     def get_mode(self):
         return self.mode
 
+    def check_mode(self, mode):
+        """
+        Raise ValueError if the sensor can't run in mode; only threshold
+        sensors have readings to make up in auto and fault mode
+        """
+        if mode != "user" and self.get_event_type() != "threshold":
+            raise ValueError("Sensor {0} is {1}, it only supports user mode".
+                             format(self.name, self.get_event_type()))
+
     def set_mode(self, mode):
-        self.mode = mode
+        """
+        Set sensor mode, auto and fault mode sensors are handed to the
+        sensor scheduler, user mode sensors are taken off it
+        Raise ValueError if the sensor does not support mode
+        """
+        self.check_mode(mode)
+        self.lock.acquire()
+        try:
+            self.mode = mode
+            # threshold sensors in auto mode are ticked by the auto engine
+            if mode == "auto" and self.get_event_type() == "threshold":
+                sensor_scheduler.cancel(self)
+                auto_engine.add(self)
+                return
+            auto_engine.remove(self)
+            if mode == "user":
+                sensor_scheduler.cancel(self)
+            else:
+                sensor_scheduler.schedule(self)
+        finally:
+            self.lock.release()
+
+    def get_interval(self):
+        return self.interval
+
+    def set_interval(self, interval):
+        if interval <= 0:
+            raise ValueError('Sensor update interval must be positive')
+        self.interval = interval
+        auto_engine.refresh(self)
 
     def get_name(self):
         return self.name
@@ -130,6 +241,13 @@ class Sensor:
     def set_type(self, tp):
         self.tp = tp
 
+    def get_entity(self):
+        return self.entity
+
+    def set_entity(self, entity_id, entity_instance):
+        # bit 7 of the instance tells logical from physical
+        self.entity = (entity_id, entity_instance & 0x7f)
+
     def set_event_type(self, event):
         self.event_type = event
 
@@ -148,110 +266,280 @@ class Sensor:
         self.sel.set_sensor_type(self.tp)
         self.sel.set_sensor_num(self.ID)
         self.sel.set_event_type(self.event_type)
+        self.sel_template = None
 
-    def get_sel(self):
-        if self.sel.check_event_type() is False:
+    def get_sel_template(self):
+        if self.sel_template is None:
+            self.sel_template = self.sel.get_template()
+        return self.sel_template
+
+    def get_sel(self, response=null_response):
+        if self.sel.check_event_type(response) is False:
             return False
 
-        if self.sel.check_sensor_type() is False:
+        if self.sel.check_sensor_type(response) is False:
             return False
 
-        self.sel.get_event()
+        self.sel.get_event(response)
+
+    def get_sel_events(self, response=null_response):
+        """
+        Return [(event id, description)] of the SEL events of the
+        sensor, None if it has none
+        """
+        if self.sel.check_event_type(response) is False:
+            return None
 
-    def set_sel(self, event_id, event_dir):
-        if self.sel.check_event_type() is False:
+        if self.sel.check_sensor_type(response) is False:
+            return None
+
+        return self.sel.get_events()
+
+    def set_sel(self, event_id, event_dir, batch=None,
+                response=null_response):
+        if self.sel.check_event_type(response) is False:
             return False
 
-        if self.sel.check_sensor_type() is False:
+        if self.sel.check_sensor_type(response) is False:
             return False
 
-        if self.sel.set_event_data(event_id) is False:
+        if self.sel.set_event_data(event_id, response) is False:
             return False
 
         self.sel.set_event_dir(event_dir)
-        self.sel.send_event()
+        send_sel_add(self.get_sel_template().encode(
+            event_dir, self.sel.get_event_data()), batch)
+
+    def set_suppression(self, min_delta=0, hysteresis=0, max_rate=0):
+        """
+        Set change suppression of auto mode readings
+        :param min_delta: smallest raw change worth a write
+        :param hysteresis: raw counts a reading must be past a threshold
+            before the crossing is written
+        :param max_rate: most writes per second, 0 for no limit
+        """
+        if min_delta < 0 or hysteresis < 0 or max_rate < 0:
+            raise ValueError('Sensor suppression settings must not be '
+                             'negative')
+        self.min_delta = min_delta
+        self.hysteresis = hysteresis
+        self.max_rate = max_rate
+
+    def get_suppression(self):
+        return self.min_delta, self.hysteresis, self.max_rate
+
+    def get_suppressed(self):
+        return self.suppressed
+
+    def get_zone(self, value):
+        """
+        Which side of the readable thresholds value is on, e.g. -2 if
+        it is at or below lnc and lc, 0 if between lnc and unc
+        """
+        zone = 0
+        for level in ('lnc', 'lc', 'lnr'):
+            if self.rtm & threshold_mask[level] and \
+                    value <= getattr(self, level):
+                zone -= 1
+        for level in ('unc', 'uc', 'unr'):
+            if self.rtm & threshold_mask[level] and \
+                    value >= getattr(self, level):
+                zone += 1
+        return zone
+
+    def is_suppressed(self, value, throttle, now):
+        """
+        Check if a write of value can be skipped. It can if ipmi_sim has
+        the value already; if throttle is True it also can if the change
+        is below min_delta without crossing a threshold by hysteresis,
+        or comes faster than max_rate.
+        Must be called with lock_sensor_write held.
+        """
+        if self.sent_value is None or \
+                self.sent_epoch != ipmi_sim_pool.get_epoch():
+            return False
+        if value == self.sent_value:
+            return True
+        if not throttle:
+            return False
+
+        if self.max_rate and now - self.sent_time < 1.0 / self.max_rate:
+            return True
+
+        zone = self.get_zone(value)
+        if zone != self.get_zone(self.sent_value):
+            # written once the reading is hysteresis deep past it
+            if value > self.sent_value:
+                back = value - self.hysteresis
+            else:
+                back = value + self.hysteresis
+            return self.get_zone(back) != zone
+        return abs(value - self.sent_value) < self.min_delta
+
+    def acknowledge(self, seq, value, epoch, result, previous=None):
+        """
+        Record the response of ipmi_sim to write seq of value, a value
+        ipmi_sim did not take is rolled back to previous
+        """
+        self.lock_sensor_write.acquire()
+        try:
+            # a later write was answered already
+            if seq < self.ack_seq:
+                return
+            self.ack_seq = seq
+            if is_acknowledged(result):
+                self.sent_value = value
+                self.sent_epoch = epoch
+            else:
+                self.sent_value = None
+                # unless a later write is on its way
+                if seq == self.write_seq:
+                    self.value = previous
+        finally:
+            self.lock_sensor_write.release()
 
     @with_type('threshold')
-    def set_threshold_value(self, value):
-        self.value = value
-        command = "sensor_set_value " + hex(self.mc) + " " \
-              + hex(self.lun) + " " + hex(self.ID) + " " + hex(value) + " 0x01\n"
-        send_ipmi_sim_command(command)
+    def set_threshold_value(self, value, batch=None, background=False,
+                            throttle=False):
+        """
+        Set threshold sensor raw value, the write is skipped if ipmi_sim
+        has the value already
+        :param batch: an IPMI_SIM_Batch to queue the write in, if None
+            the write is sent right away
+        :param background: True if nobody waits on the write, see
+            send_ipmi_sim_command
+        :param throttle: True to apply the suppression settings, for
+            readings made up in auto mode
+        """
+        # writes of one sensor reach ipmi_sim in the order they are made
+        self.lock_sensor_write.acquire()
+        try:
+            now = time.time()
+            if self.is_suppressed(value, throttle, now):
+                # the console shows what ipmi_sim has
+                self.suppressed += 1
+                return
+            previous, self.value = self.value, value
+            self.sent_time = now
+            self.write_seq += 1
+            seq = self.write_seq
+            epoch = ipmi_sim_pool.get_epoch()
+            if batch is not None:
+                batch.sensor_set_value(
+                    self.mc, self.lun, self.ID, value,
+                    callback=lambda result:
+                    self.acknowledge(seq, value, epoch, result, previous))
+                return
+            command = "sensor_set_value " + hex(self.mc) + " " \
+                + hex(self.lun) + " " + hex(self.ID) + " " + hex(value) \
+                + " 0x01\n"
+            result = send_ipmi_sim_command(command, background)
+        finally:
+            self.lock_sensor_write.release()
+        self.acknowledge(seq, value, epoch, result, previous)
 
     @with_type('discrete')
-    def set_discrete_value(self, value):
+    def set_discrete_value(self, value, batch=None):
         """
-        Set discrete sensor value
+        Set discrete sensor value, all changed state bits are sent in
+        one batch
         :param value: in format of 2 byte little endian, e.g. 0xca10
+        :param batch: an IPMI_SIM_Batch to queue the writes in, if None
+            the writes are submitted right away
         """
-        if len(value) != 6 or not value.startswith('0x'):
-            raise ValueError('Discrete sensor value should be in format '
-                             'of 2 bytes in little endian, e.g. 0x1ac0')
-
-        # Sensor reading in big endian binary
-        # e.g.
-        # Original reading is 0xca10 in little endian
-        # This value in bin is
-        # 0001 0000 1100 1010
-        #  1    0    c    a
-        # bit 0 > 15
-        # bit 0 is reserved, bit 1 is state 14 ... bit 15 is state 0
-        value_in_bin = "{0:b}".format(int(self.value[4:6]+self.value[2:4], 16)).zfill(16)
-        value_to_set = "{0:b}".format(int(value[4:6]+value[2:4], 16)).zfill(16)
-        list_diff = []
-
-        for i in range(0, 15):
-            state_id = i
-            bit_orig = value_in_bin[15-state_id]
-            bit_targ = value_to_set[15-state_id]
-            if bit_orig != bit_targ:
-                list_diff.append((state_id, int(bit_targ)))
-
+        states = parse_discrete_value(value)
         self.lock_sensor_write.acquire()
-        self.value = value
-        for diff in list_diff:
-            command = "sensor_set_bit " + hex(self.mc) + " " + hex(self.lun) \
-                      + " " + hex(self.ID) + " " + str(diff[0]) + " " \
-                      + str(diff[1]) + " 0x01\n"
-            send_ipmi_sim_command(command)
-        self.lock_sensor_write.release()
+        try:
+            self.write_states(states, batch)
+        finally:
+            self.lock_sensor_write.release()
 
     @with_type('discrete')
-    def set_state(self, state_id, state_bit):
+    def set_states(self, states, batch=None):
+        """
+        Set several states of a discrete sensor, the changed ones are
+        sent in one batch
+        :param states: list of (state id, bit), state id 0-14 according
+            to IPMI spec 2.0, bit 1 or 0
+        :param batch: an IPMI_SIM_Batch to queue the writes in, if None
+            the writes are submitted right away
+        """
+        set_mask = 0
+        clear_mask = 0
+        for state_id, state_bit in states:
+            if state_id not in range(0, 15):
+                raise ValueError('State id must be in 0-14 according to '
+                                 'IPMI 2.0 specification')
+            if state_bit not in range(0, 2):
+                raise ValueError('Bit to set must be 0 or 1')
+            if state_bit:
+                set_mask |= 1 << state_id
+                clear_mask &= ~(1 << state_id)
+            else:
+                clear_mask |= 1 << state_id
+                set_mask &= ~(1 << state_id)
+
+        # read, modify and write the states under the lock, so that
+        # writes of one sensor reach ipmi_sim in the order they are made
+        self.lock_sensor_write.acquire()
+        try:
+            self.write_states((self.states | set_mask) & ~clear_mask,
+                              batch)
+        finally:
+            self.lock_sensor_write.release()
+
+    def set_state(self, state_id, state_bit, batch=None):
         """
         Set disrete sensor's state in id to a certain bit
         :param state_id: 0-14, according to IPMI spec 2.0
         :param state_bit: 1 or 0
+        :param batch: an IPMI_SIM_Batch to queue the write in, if None
+            the write is sent right away
         """
-        if state_id not in range(0, 15):
-            raise ValueError('State id must be in 0-14 according to '
-                             'IPMI 2.0 specification')
-        if state_bit not in range(0, 2):
-            raise ValueError('Bit to set must be 0 or 1')
-
-        value_in_int = int(self.value[4:6]+self.value[2:4], 16)
-
-        if state_bit:
-            mask = 1 << state_id
-            value_in_int = value_in_int | mask
-        else:
-            mask = ~(1 << state_id)
-            value_in_int = value_in_int & mask
+        self.set_states([(state_id, state_bit)], batch)
 
-        value_in_hex = hex(value_in_int)[2:].zfill(4)
+    def write_states(self, states, batch=None):
+        """
+        Take states as the new bitmask and write the bits that changed.
+        Must be called with lock_sensor_write held.
+        """
+        old, self.states = self.states, states
+        own_batch = batch is None
+        if own_batch:
+            batch = IPMI_SIM_Batch()
+        for state_id, state_bit in changed_states(old, states):
+            batch.sensor_set_bit(self.mc, self.lun, self.ID,
+                                 state_id, state_bit,
+                                 callback=lambda result, state_id=state_id,
+                                 state_bit=state_bit:
+                                 self.acknowledge_state(state_id, state_bit,
+                                                        result))
+        if own_batch:
+            batch.submit()
+
+    def acknowledge_state(self, state_id, state_bit, result):
+        """
+        Check the response of ipmi_sim to a write of state bit state_id
+        """
+        if not is_acknowledged(result):
+            logger.error("sensor {0}: fail to set state {1} to {2}: {3}".
+                         format(hex(self.ID), state_id, state_bit, result))
 
-        self.lock_sensor_write.acquire()
-        self.value = "0x"+value_in_hex[2:4]+value_in_hex[0:2]
-        command = "sensor_set_bit " + hex(self.mc) + " " + hex(self.lun) \
-                  + " " + hex(self.ID) + " " + str(state_id) + " " \
-                  + str(state_bit) + " 0x01\n"
-        send_ipmi_sim_command(command)
-        self.lock_sensor_write.release()
+    def get_states(self):
+        return self.states
 
     def set_raw_value(self, raw_value):
         self.value = raw_value
+        if isinstance(raw_value, str):
+            self.states = parse_discrete_value(raw_value)
 
     def get_value(self):
+        """
+        Raw reading of a threshold sensor, or states of a discrete
+        sensor in format of 2 byte little endian, e.g. 0xca10
+        """
+        if self.get_event_type() == "discrete":
+            return format_discrete_value(self.states)
         return self.value
 
     def set_cap(self, cap):
@@ -292,6 +580,8 @@ class Sensor:
     # 11b = Does not return analog (numeric) reading
     def set_su1(self, su1):
         self.su1 = su1
+        self.analog_table = None
+        auto_engine.refresh(self)
 
     # set sensor unit 2
     def set_su2(self, su2):
@@ -300,27 +590,49 @@ class Sensor:
     # set M low 8 bits
     def set_m_lb(self, m_lb):
         self.m_lb = m_lb
+        self.analog_table = None
 
     # set M high 2 bits
     def set_m_ub(self, m_ub):
         self.m_ub = m_ub
+        self.analog_table = None
 
     # set B low 8 bits
     def set_b_lb(self, b_lb):
         self.b_lb = b_lb
+        self.analog_table = None
 
     # set B high 2 bits
     def set_b_ub(self, b_ub):
         self.b_ub = b_ub
+        self.analog_table = None
 
     def set_accuracy(self, accuracy):
         self.accuracy = accuracy
 
     def set_exp(self, exp):
         self.exp = exp
-
-    # the function will return the lambda of the linearization
-    def get_reading_factor(self):
+        self.analog_table = None
+
+    # raw reading byte to the number in analog data format of sensor unit 1
+    def get_signed_raw(self, raw):
+        raw &= 0xff
+        data_format = (getattr(self, 'su1', 0) >> 6) & 0x3
+        if data_format == 1 and raw & 0x80:
+            return raw - 0xff
+        if data_format == 2 and raw & 0x80:
+            return raw - 0x100
+        return raw
+
+    def build_analog_table(self):
+        """
+        Build the conversion tables of the linearization. There are only
+        256 raw readings, so every analog value is computed once:
+        - analog_table: analog value indexed by raw reading byte
+        - analog_keys, analog_raws: analog values in order and the raw
+          reading of each, for lookup by binary search
+        Tables are dropped when M, B, exponents or sensor unit 1 change.
+        """
         M = ((self.m_ub & 0xc0) << 2) + self.m_lb
         b_sig = (self.b_ub >> 7) & 0x1
         if b_sig == 1:
@@ -337,10 +649,41 @@ class Sensor:
         Bexpo = self.exp & 0x0f
 
         # formula: convert RAW value to human readable value
-        formula_1 = lambda x: (M*x+B*10**Bexpo)*10**Rexpo
-        # formula: convert human readable value to RAW value
-        formula_2 = lambda x: (x / (10**Rexpo) - B*10**Bexpo) / M
-        return (formula_1, formula_2)
+        analog_table = [(M*self.get_signed_raw(raw)+B*10**Bexpo)*10**Rexpo
+                        for raw in range(256)]
+        pairs = sorted(zip(analog_table, range(256)))
+        self.analog_keys = [pair[0] for pair in pairs]
+        self.analog_raws = [pair[1] for pair in pairs]
+        self.analog_table = analog_table
+
+    def get_analog_value(self, raw):
+        """
+        Convert raw reading to human readable value
+        :param raw: raw reading, byte or signed number
+        """
+        if self.analog_table is None:
+            self.build_analog_table()
+        return self.analog_table[raw & 0xff]
+
+    def get_raw_value(self, analog):
+        """
+        Convert human readable value to the raw reading byte with the
+        nearest analog value
+        """
+        if self.analog_table is None:
+            self.build_analog_table()
+        keys = self.analog_keys
+        i = bisect.bisect_left(keys, analog)
+        if i == len(keys):
+            i -= 1
+        elif i > 0 and analog - keys[i-1] <= keys[i] - analog:
+            i -= 1
+        return self.analog_raws[i]
+
+    # the function will return the conversions of the linearization
+    def get_reading_factor(self):
+        # convert RAW value to human readable value and the reverse
+        return (self.get_analog_value, self.get_raw_value)
 
     #settable threshold mask
     def set_stm(self, stm):
@@ -352,10 +695,18 @@ class Sensor:
     #readable threshold mask
     def set_rtm(self, rtm):
         self.rtm = rtm
+        auto_engine.refresh(self)
 
     def get_rtm(self):
         return self.rtm
 
+    def has_threshold(self, level):
+        """
+        Check if threshold level, e.g. 'lnc', is readable
+        """
+        return self.get_event_type() == 'threshold' and \
+            self.rtm & threshold_mask[level] != 0
+
     def get_thres_ac_supp(self):
         value = (self.cap >> 2) & 0x3
         if value == 0x0:
@@ -370,6 +721,7 @@ class Sensor:
     # set lower non cirtical threshold
     def set_lnc(self, lnc):
         self.lnc = lnc
+        auto_engine.refresh(self)
 
     def get_lnc(self):
         return self.lnc
@@ -377,6 +729,7 @@ class Sensor:
     # set lower cirtical threshold
     def set_lc(self, lc):
         self.lc = lc
+        auto_engine.refresh(self)
 
     def get_lc(self):
         return self.lc
@@ -384,6 +737,7 @@ class Sensor:
     # set lower non-recoverable threshold
     def set_lnr(self, lnr):
         self.lnr = lnr
+        auto_engine.refresh(self)
 
     def get_lnr(self):
         return self.lnr
@@ -391,6 +745,7 @@ class Sensor:
     #set upper non-critical threshold
     def set_unc(self,unc):
         self.unc = unc
+        auto_engine.refresh(self)
 
     def get_unc(self):
         return self.unc
@@ -398,6 +753,7 @@ class Sensor:
     #set upper cirtical threshold
     def set_uc(self,uc):
         self.uc = uc
+        auto_engine.refresh(self)
 
     def get_uc(self):
         return self.uc
@@ -405,6 +761,7 @@ class Sensor:
     #set upper non-recoverable threshold
     def set_unr(self,unr):
         self.unr = unr
+        auto_engine.refresh(self)
 
     def get_unr(self):
         return self.unr
@@ -419,61 +776,56 @@ class Sensor:
         else:
             return 'discrete'
 
-    def output_info(self):
-        # Sensor Name
-        info = "{0:<20}".format(self.name)
-        # Sensor ID
-        info += "| {0:<10}".format(hex(self.ID))
-        # sensor value
-        if self.get_event_type() == 'threshold':
-            value = "%.3f" % self.get_reading_factor()[0](self.value)
+    def get_info(self):
+        """
+        What output_info shows, as a dict. Value and readable thresholds
+        are in units, thresholds not readable are None.
+        """
+        threshold = self.get_event_type() == 'threshold'
+        if threshold:
+            value = self.get_analog_value(self.value)
         elif self.get_event_type() == 'discrete':
-            value = self.value
-        info += "| {0:<10}".format(value)
-
-        # Sensor Unit
-        su = self.get_unit()
-        info += "| {0:<20}".format(su)
-
-        # lower non-recoverable
-        lnr = 'NA'
-        if self.get_event_type() == 'threshold' and self.rtm & 0x04 != 0:
-            lnr = "%.3f" % self.get_reading_factor()[0](self.lnr)
-        info += "| {0:<10}".format(lnr)
-
-        # lowr critical
-        lc = 'NA'
-        if self.get_event_type() == 'threshold' and self.rtm & 0x02 != 0:
-            lc = "%.3f" % self.get_reading_factor()[0](self.lc)
-        info += "| {0:<10}".format(lc)
-
-        # lower non-critical
-        lnc = 'NA'
-        if self.get_event_type() == 'threshold' and self.rtm & 0x01 != 0:
-            lnc = "%.3f" % self.get_reading_factor()[0](self.lnc)
-        info += "| {0:<10}".format(lnc)
-
-        # upper non-critical
-        unc = 'NA'
-        if self.get_event_type() == 'threshold' and self.rtm & 0x08 != 0:
-            unc = "%.3f" % self.get_reading_factor()[0](self.unc)
-        info += "| {0:<10}".format(unc)
-
-        # upper critical
-        uc = 'NA'
-        if self.get_event_type() == 'threshold' and self.rtm & 0x10 != 0:
-            uc = "%.3f" % self.get_reading_factor()[0](self.uc)
-        info += "| {0:<10}".format(uc)
-
-        # upper non-recoverable
-        unr = 'NA'
-        if self.get_event_type() == 'threshold' and self.rtm & 0x20 != 0:
-            unr = "%.3f" % self.get_reading_factor()[0](self.unr)
-        info += "| {0}".format(unr)
-
+            value = self.get_value()
+        else:
+            value = None
+        info = {"name": self.name,
+                "id": hex(self.ID),
+                "mc": hex(self.mc),
+                "lun": self.lun,
+                "type": hex(self.tp),
+                "event_type": self.get_event_type(),
+                "mode": self.mode,
+                "value": value,
+                "unit": self.get_unit()}
+        for name, mask in READABLE_THRESHOLDS:
+            info[name] = None
+            if threshold and self.rtm & mask != 0:
+                info[name] = self.get_analog_value(getattr(self, name))
         return info
 
-    def get_random_value(self):
+    def output_info(self):
+        info = self.get_info()
+        # Sensor Name, Sensor ID
+        line = "{0:<20}| {1:<10}".format(info["name"], info["id"])
+        # sensor value, Sensor Unit
+        value = info["value"]
+        if info["event_type"] == 'threshold':
+            value = "%.3f" % value
+        line += "| {0:<10}| {1:<20}".format(value, info["unit"])
+        # thresholds, NA if not readable
+        thresholds = ['NA' if info[name] is None else "%.3f" % info[name]
+                      for name, mask in READABLE_THRESHOLDS]
+        for threshold in thresholds[:-1]:
+            line += "| {0:<10}".format(threshold)
+        line += "| {0}".format(thresholds[-1])
+        return line
+
+    def get_auto_range(self):
+        """
+        Range of raw values an auto mode reading is drawn from, between
+        the innermost readable thresholds
+        :return: (low, high), both included
+        """
         s_lnr_mask = self.rtm & 0x04
         s_lcr_mask = self.rtm & 0x02
         s_lnc_mask = self.rtm & 0x01
@@ -505,6 +857,10 @@ class Sensor:
         else:
             high_value = 255
 
+        return low_value, max(low_value, high_value)
+
+    def get_random_value(self):
+        low_value, high_value = self.get_auto_range()
         return random.randint(low_value, high_value)
 
     def get_fault_value(self):
@@ -528,7 +884,7 @@ class Sensor:
             if s_lnc_mask == 0:
                 info = "WARN: Sensor " + str(self.name) + " did not cross " \
                     + str(self.fault_level) + " threshold since it does not exist\n"
-                msg_queue.put(info)
+                logger.warning(info)
             else:
                 # Cause lnc fault - use lc as lower limit if it exists. Otherwise use 0
                 if s_lcr_mask == 0:
@@ -540,7 +896,7 @@ class Sensor:
             if s_lcr_mask == 0:
                 info = "WARN: Sensor " + str(self.name) + " did not cross " \
                      + str(self.fault_level) + " threshold since it does not exist\n"
-                msg_queue.put(info)
+                logger.warning(info)
             else:
                 # Cause lcr fault - use lnr as lower limit if it exists. Otherwise use 0
                 if s_lnr_mask == 0:
@@ -552,7 +908,7 @@ class Sensor:
             if s_lnr_mask == 0:
                 info = "WARN: Sensor " + str(self.name) + " did not cross " \
                     + str(self.fault_level) + " threshold since it does not exist\n"
-                msg_queue.put(info)
+                logger.warning(info)
             else:
                 # Cause lnr fault - use 0 as lower limit
                 s_value = random.randint(0, self.lnr)
@@ -560,7 +916,7 @@ class Sensor:
             if s_unc_mask == 0:
                 info = "WARN: Sensor " + str(self.name) + " did not cross " \
                     + str(self.fault_level) + " threshold since it does not exist\n"
-                msg_queue.put(info)
+                logger.warning(info)
             else:
                 # Cause unc fault - use ucr as upper limit if it exists. Otherwise use 255
                 if s_ucr_mask == 0:
@@ -572,7 +928,7 @@ class Sensor:
             if s_ucr_mask == 0:
                 info = "WARN: Sensor " + str(self.name) + " did not cross " \
                      + str(self.fault_level) + " threshold since it does not exist\n"
-                msg_queue.put(info)
+                logger.warning(info)
             else:
                 # Cause ucr fault - user unr as upper limit if it exists. Otherwise use 255
                 if s_unr_mask == 0:
@@ -584,42 +940,32 @@ class Sensor:
             if s_unr_mask == 0:
                 info = "WARN: Sensor " + str(self.name) + " did not cross " \
                         + str(self.fault_level) + " threshold since it does not exist\n"
-                msg_queue.put(info)
+                logger.warning(info)
             else:
                 # Cause unr fault - use 255 as upper limit
                 s_value = random.randint(self.unr, MAX)
         return s_value
 
-    def execute(self):
-        while not self.quit:
-            self.condition.acquire()
-            try:
-                if self.mode == "user": # user mode
-                    self.condition.wait()
-                    if self.quit == True:
-                        return
-                else:
-                    #(lnc, unc) = self.get_lnc_unc()
-                    if self.mode == "auto": # auto mode
-                        s_value = self.get_random_value()
-                    else: # fault mode
-                        s_value = self.get_fault_value()
-                        self.mode = "user"
-
-                    if s_value == None:
-                        continue
-
-                    self.value = s_value
-
-                    command = "sensor_set_value " + hex(self.mc) + " " \
-                        + hex(self.lun) + " " + hex(self.ID) + " " + hex(s_value) + " 0x01\n"
-                    send_ipmi_sim_command(command)
-
-                    if self.mode == "auto": # auto mode
-                        self.condition.wait(5)
-                        if self.quit == True:
-                            return
-            # we release the lock so that master thread could join us
-            # and release the thread resource
-            finally:
-                self.condition.release()
+    def update(self):
+        """
+        Run one auto or fault mode step, called by the sensor scheduler
+        :return: seconds till next update, None if no more update
+        """
+        self.lock.acquire()
+        try:
+            if self.mode == "auto":
+                s_value = self.get_random_value()
+                interval = self.interval
+            elif self.mode == "fault":
+                # fault value is set once, then back to user mode
+                s_value = self.get_fault_value()
+                self.mode = "user"
+                interval = None
+            else:
+                return None
+
+            if s_value is not None:
+                self.set_threshold_value(s_value, background=True)
+            return interval
+        finally:
+            self.lock.release()
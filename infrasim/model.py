@@ -21,13 +21,18 @@ For each element class, they need to implement methods:
         Compose all options in list to a command line string;
 """
 
-import fcntl
+import ctypes
+import errno
 import time
+import threading
+import Queue
 import shlex
 import subprocess
 import os
+import select
 import uuid
 import signal
+import socket
 import jinja2
 import netifaces
 import math
@@ -35,39 +40,224 @@ import yaml
 import shutil
 import stat
 from . import logger, run_command, CommandRunFailed, ArgsNotCorrect, CommandNotFound, has_option
+from . import host
+from .inventory import inventory
 
 TEMPLATE_ROOT = "/usr/local/etc/infrasim"
 
 
+# time a task started by another one has to write its pid file, in seconds
+START_TIMEOUT = 5
+# time a task has to get ready after it is started, in seconds
+READY_TIMEOUT = 10
+# time a task has to exit after SIGTERM, in seconds
+STOP_TIMEOUT = 5
+# readiness probes are repeated at intervals doubling up to the max
+PROBE_INTERVAL = 0.01
+PROBE_INTERVAL_MAX = 0.1
+# time a single probe of a port may take, in seconds
+PROBE_TIMEOUT = 1
+
+
+# inotify of libc, to wait for files without polling
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+try:
+    libc = ctypes.CDLL(None, use_errno=True)
+    inotify_init1 = libc.inotify_init1
+    inotify_init1.argtypes = [ctypes.c_int]
+    inotify_add_watch = libc.inotify_add_watch
+    inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                  ctypes.c_uint32]
+    syscall = libc.syscall
+except (OSError, AttributeError):
+    inotify_init1 = None
+    syscall = None
+# pidfd_open(2) of linux 5.3, a fd that gets readable when the process exits
+NR_PIDFD_OPEN = 434
+
+
 class Utility(object):
     @staticmethod
-    def execute_command(command, log_path=""):
+    def execute_command(command, log_path="", ready=None,
+                        timeout=READY_TIMEOUT):
+        """
+        Start command in background and return its pid once it is ready
+        :param log_path: file the output of the command is appended to,
+            as long as it runs; without one the output is dropped
+        :param ready: readiness probe, a function of the pid of the command
+            returning True once it serves; without one the command is
+            ready once started
+        Raise CommandRunFailed as soon as the command exits, or if it is
+        not ready in timeout, then it is killed.
+        """
         args = shlex.split(command)
-        proc = subprocess.Popen(args, stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                shell=False)
+        # a pipe nobody drains fills up, or breaks once we exit, so a
+        # daemon writes to a file of its own
+        with open(os.devnull, "r") as stdin, \
+                open(log_path or os.devnull, "a") as log:
+            log.seek(0, os.SEEK_END)
+            offset = log.tell()
+            proc = subprocess.Popen(args, stdin=stdin, stdout=log,
+                                    stderr=subprocess.STDOUT,
+                                    close_fds=True, shell=False)
+
+        is_ready = Utility.wait_for(lambda: proc.poll() is not None or
+                                    ready is None or ready(proc.pid),
+                                    timeout)
+
+        if proc.poll() is not None:
+            errout = "exited with {}".format(proc.returncode)
+            if log_path:
+                with open(log_path, "r") as log:
+                    log.seek(offset)
+                    errout = log.read() or errout
+            raise CommandRunFailed(command, errout)
+
+        if not is_ready:
+            proc.kill()
+            proc.wait()
+            raise CommandRunFailed(command, "not ready in {}s".
+                                   format(timeout))
+
+        return proc.pid
+
+    @staticmethod
+    def wait_for(condition, timeout, interval=PROBE_INTERVAL):
+        """
+        Call condition till it returns True, at doubling intervals
+        :return: True, or False if timeout passed first
+        """
+        deadline = time.time() + timeout
+        while True:
+            if condition():
+                return True
+            now = time.time()
+            if now >= deadline:
+                return False
+            time.sleep(min(interval, deadline - now))
+            interval = min(interval * 2, PROBE_INTERVAL_MAX)
 
-        flags = fcntl.fcntl(proc.stderr, fcntl.F_GETFL)
-        fcntl.fcntl(proc.stderr, fcntl.F_SETFL, flags | os.O_NONBLOCK)
-        time.sleep(1)
+    @staticmethod
+    def wait_for_file(directory, condition, timeout, wakeup=None):
+        """
+        Block till condition returns True, checking it whenever a file in
+        directory is created, written or moved there. Where inotify is
+        not there, fall back to probing at intervals.
+        :param wakeup: a fd that gets readable to end the wait early
+        :return: True, or False if timeout passed first or woken up
+        """
+        fd = -1
+        if inotify_init1 is not None:
+            fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return Utility.wait_for(condition, timeout)
+        try:
+            if inotify_add_watch(fd, directory, IN_CREATE | IN_CLOSE_WRITE |
+                                 IN_MOVED_TO) < 0:
+                return Utility.wait_for(condition, timeout)
+            deadline = time.time() + timeout
+            # check after the watch is set, so no change is missed
+            while not condition():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                try:
+                    readable = select.select(
+                        [fd] + ([wakeup] if wakeup is not None else []),
+                        [], [], remaining)[0]
+                except select.error:
+                    continue
+                if wakeup is not None and wakeup in readable:
+                    return condition()
+                if readable:
+                    try:
+                        os.read(fd, 4096)
+                    except OSError:
+                        pass
+            return True
+        finally:
+            os.close(fd)
 
-        errout = None
+    @staticmethod
+    def is_process_alive(pid):
+        """
+        True if process pid runs, a zombie has exited already
+        """
         try:
-            errout = proc.stderr.read()
+            with open("/proc/{}/stat".format(pid), "r") as f:
+                stat_line = f.read()
         except IOError:
-            pass
-        if errout is not None:
-            if log_path:
-                with open(log_path, 'w') as fp:
-                    fp.write(errout)
-            else:
-                logger.error(errout)
+            return False
+        # state is the field after the command name in parentheses
+        return stat_line.rsplit(")", 1)[-1].split()[0] != "Z"
 
-        if not os.path.isdir("/proc/{}".format(proc.pid)):
-            raise CommandRunFailed(command)
+    @staticmethod
+    def wait_for_exit(pid, timeout=None, wakeup=None):
+        """
+        Block till process pid exits. A pidfd refers to the process
+        itself, so a pid reused meanwhile is not mistaken for it; where
+        there is no pidfd, fall back to probing /proc at intervals.
+        Only for processes that are not children, a child is waited for
+        with waitpid.
+        :param timeout: seconds, None to wait as long as it runs
+        :param wakeup: a fd that gets readable to end the wait early
+        :return: True, or False if timeout passed first or woken up
+        """
+        fd = -1
+        if syscall is not None:
+            fd = syscall(NR_PIDFD_OPEN, int(pid), 0)
+        if fd < 0:
+            if ctypes.get_errno() == errno.ESRCH:
+                return True
+            if timeout is None:
+                timeout = float("inf")
+            Utility.wait_for(
+                lambda: not Utility.is_process_alive(pid) or
+                (wakeup is not None and
+                 select.select([wakeup], [], [], 0)[0]), timeout)
+            return not Utility.is_process_alive(pid)
+        try:
+            while True:
+                try:
+                    readable = select.select(
+                        [fd] + ([wakeup] if wakeup is not None else []),
+                        [], [], timeout)[0]
+                    return fd in readable
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+        finally:
+            os.close(fd)
 
-        return proc.pid
+    @staticmethod
+    def probe_port(port, host="127.0.0.1", banner=None,
+                   timeout=PROBE_TIMEOUT):
+        """
+        Readiness probe of a TCP server
+        :param banner: what the server greets with, if it has to
+        :return: True if the port accepts connections, and greets with
+            banner if one is given
+        """
+        try:
+            sock = socket.create_connection((host, port), timeout)
+        except socket.error:
+            return False
+        try:
+            greeting = ""
+            while banner is not None and len(greeting) < len(banner):
+                data = sock.recv(len(banner) - len(greeting))
+                if not data:
+                    break
+                greeting += data
+            return banner is None or greeting == banner
+        except socket.error:
+            return False
+        finally:
+            sock.close()
 
     @staticmethod
     def run_command(command):
@@ -621,6 +811,8 @@ class Task(object):
         # this task shall only be maintained with information
         # no actual run shall be taken
         self.__run_mask = False
+        # time a masked task has to be started by another one
+        self.__start_timeout = START_TIMEOUT
 
     def set_priority(self, priority):
         self.__task_priority = priority
@@ -646,9 +838,26 @@ class Task(object):
     def set_log_path(self, log_path):
         self.__log_path = log_path
 
+    def get_log_path(self):
+        return self.__log_path
+
+    def get_run_mask(self):
+        return self.__run_mask
+
     def set_run_mask(self, run_mask):
         self.__run_mask = run_mask
 
+    def set_start_timeout(self, timeout):
+        self.__start_timeout = timeout
+
+    def is_ready(self, pid=None):
+        """
+        Readiness probe, True once the task serves what depends on it.
+        A task that has nothing to probe is ready once it runs.
+        :param pid: process of the task, read from its pid file if None
+        """
+        return True
+
     def get_task_pid(self):
         pid_file = "{}/.{}".format(self.__workspace, self.__task_name)
         try:
@@ -660,16 +869,20 @@ class Task(object):
 
     def run(self):
         if self.__run_mask:
-            start = time.time()
-            while True:
+            # the task is started by another one, which writes its pid
+            # file when it runs
+            pid = None
+            if Utility.wait_for_file(self.__workspace or "/",
+                                     self.get_task_pid,
+                                     self.__start_timeout):
                 pid = self.get_task_pid()
-                if pid is not None:
-                    break
-                if time.time()-start > 5:
-                    break
             if pid is None:
                 print "[ {:<6} ] {} fail to start".\
                     format(pid, self.__task_name)
+            elif not Utility.wait_for(lambda: self.is_ready(pid),
+                                      READY_TIMEOUT):
+                print "[ {:<6} ] {} not ready in {}s".\
+                    format(pid, self.__task_name, READY_TIMEOUT)
             else:
                 print "[ {:<6} ] {} run".format(pid, self.__task_name)
             return
@@ -688,9 +901,20 @@ class Task(object):
                 os.remove("{}/.{}".format(self.__workspace, self.__task_name))
 
         pid = Utility.execute_command(self.get_commandline(),
-                                      log_path=self.__log_path)
+                                      log_path=self.__log_path,
+                                      ready=self.is_ready)
         print "[ {:<6} ] {} start to run".format(pid, self.__task_name)
+        self.set_task_pid(pid)
+
+    def set_task_pid(self, pid):
+        """
+        Write the pid file of the task, remove it if pid is None
+        """
         pid_file = "{}/.{}".format(self.__workspace, self.__task_name)
+        if pid is None:
+            if os.path.exists(pid_file):
+                os.remove(pid_file)
+            return
         with open(pid_file, "w") as f:
             f.write("{}".format(pid))
 
@@ -701,9 +925,14 @@ class Task(object):
             if task_pid:
                 print "[ {:<6} ] {} stop".format(task_pid, self.__task_name)
                 os.kill(int(task_pid), signal.SIGTERM)
-                time.sleep(1)
+                stopped = Utility.wait_for(
+                    lambda: not Utility.is_process_alive(task_pid),
+                    STOP_TIMEOUT)
                 if os.path.exists(pid_file):
                     os.remove(pid_file)
+                if not stopped:
+                    print("[ {:<6} ] {} stop failed.".
+                          format(task_pid, self.__task_name))
         except OSError:
             if os.path.exists(pid_file):
                 os.remove(pid_file)
@@ -748,6 +977,7 @@ class CCompute(Task, CElement):
         # Node wise attributes
         self.__port_qemu_ipmi = 9002
         self.__port_serial = 9003
+        self.__port_monitor = 2345
 
     def set_numactl(self, numactl_obj):
         self.__numactl_obj = numactl_obj
@@ -761,6 +991,19 @@ class CCompute(Task, CElement):
     def set_port_serial(self, port):
         self.__port_serial = port
 
+    def set_port_monitor(self, port):
+        self.__port_monitor = port
+
+    def is_ready(self, pid=None):
+        # qemu greets on its monitor once it is up; the monitor has to be
+        # its own, in a chassis another node's qemu may answer on a port
+        # configured twice
+        if pid is None:
+            pid = self.get_task_pid()
+        if not pid or not host.listens_on(pid, self.__port_monitor):
+            return False
+        return Utility.probe_port(self.__port_monitor, banner="QEMU")
+
     def set_smbios(self, smbios):
         self.__smbios = smbios
 
@@ -769,9 +1012,7 @@ class CCompute(Task, CElement):
 
     def precheck(self):
         # check if qemu-system-x86_64 exists
-        try:
-            run_command("which {}".format(self.__qemu_bin))
-        except CommandRunFailed:
+        if inventory.which(self.__qemu_bin) is None:
             raise CommandNotFound(self.__qemu_bin)
 
         # check if smbios exists
@@ -787,7 +1028,7 @@ class CCompute(Task, CElement):
 
         if 'kvm_enabled' in self.__compute:
             if self.__compute['kvm_enabled']:
-                if os.path.exists("/dev/kvm"):
+                if inventory.has_kvm():
                     self.__enable_kvm = True
                     logger.info('[model:compute] infrasim has enabled kvm')
                 else:
@@ -818,15 +1059,22 @@ class CCompute(Task, CElement):
         if 'cdrom' in self.__compute:
             self.__cdrom_file = self.__compute['cdrom']
 
+        if 'start_timeout' in self.__compute:
+            self.set_start_timeout(self.__compute['start_timeout'])
+
         if 'numa_control' in self.__compute \
                 and self.__compute['numa_control']:
             if os.path.exists("/usr/bin/numactl"):
-                self.set_numactl(NumaCtl())
+                # nodes of a chassis share the NumaCtl of the chassis
+                if self.__numactl_obj is None:
+                    self.set_numactl(NumaCtl())
                 logger.info('[model:compute] infrasim has '
                            'enabled numa control')
             else:
                 logger.info('[model:compute] infrasim can\'t '
                            'find numactl in this environment')
+        else:
+            self.set_numactl(None)
 
         cpu_obj = CCPU(self.__compute['cpu'])
         self.__element_list.append(cpu_obj)
@@ -903,7 +1151,7 @@ class CCompute(Task, CElement):
             self.add_option("-cdrom {}".format(self.__cdrom_file))
 
         self.add_option("-chardev socket,id=mon,host=127.0.0.1,"
-                        "port=2345,server,nowait ")
+                        "port={},server,nowait ".format(self.__port_monitor))
 
         self.add_option("-mon chardev=mon,id=monitor")
 
@@ -993,9 +1241,7 @@ class CBMC(Task):
 
     def precheck(self):
         # check if ipmi_sim exists
-        try:
-            run_command("which {}".format(self.__bin))
-        except CommandRunFailed:
+        if inventory.which(self.__bin) is None:
             raise CommandNotFound(self.__bin)
 
         # check script exits
@@ -1181,6 +1427,10 @@ class CBMC(Task):
         else:
             self.__sol_device = "/etc/infrasim/pty0"
 
+    def is_ready(self, pid=None):
+        # ipmi_sim serves its console once the emulation is loaded
+        return Utility.probe_port(self.__port_ipmi_console)
+
     def get_commandline(self):
         ipmi_cmd_str = "{0} -c {1} -f {2} -n -s /var/tmp".\
             format(self.__bin, self.__config_file, self.__emu_file)
@@ -1204,13 +1454,18 @@ class CSocat(Task):
     def set_sol_device(self, device):
         self.__sol_device = device
 
+    def get_sol_device(self):
+        return self.__sol_device
+
+    def is_ready(self, pid=None):
+        # socat links the pty it opens to the sol device
+        return os.path.exists(self.__sol_device)
+
     def precheck(self):
 
         # check if socat exists
-        try:
-            code, socat_cmd = run_command("which /usr/bin/socat")
-            self.__bin = socat_cmd.strip(os.linesep)
-        except CommandRunFailed:
+        self.__bin = inventory.which("/usr/bin/socat")
+        if self.__bin is None:
             raise CommandNotFound("/usr/bin/socat")
 
         # check ports are in use
@@ -1252,6 +1507,12 @@ class CNode(object):
     def set_node_name(self, name):
         self.__node_name = name
 
+    def get_tasks(self):
+        """
+        Tasks of the node in the order they start
+        """
+        return sorted(self.__tasks_list, key=lambda x: x.get_priority())
+
     def precheck(self):
         for task in self.__tasks_list:
             task.precheck()
@@ -1422,7 +1683,7 @@ class CNode(object):
         # Place holder to sync serial number
 
     def terminate_workspace(self):
-        os.system("rm -rf {}".format(self.workspace))
+        shutil.rmtree(self.workspace, ignore_errors=True)
 
     def init(self):
         if self.__node['compute'] is None:
@@ -1436,6 +1697,8 @@ class CNode(object):
         socat_obj = CSocat()
         socat_obj.set_priority(0)
         socat_obj.set_task_name("{}-socat".format(self.__node_name))
+        socat_obj.set_log_path("/var/log/infrasim/{}/socat.log".
+                               format(self.__node_name))
         self.__tasks_list.append(socat_obj)
 
         bmc_obj = CBMC(self.__node.get('bmc', {}))
@@ -1446,6 +1709,7 @@ class CNode(object):
         self.__tasks_list.append(bmc_obj)
 
         compute_obj = CCompute(self.__node['compute'])
+        compute_obj.set_numactl(self.__numactl_obj)
         compute_obj.set_run_mask(True)
         compute_obj.set_priority(2)
         compute_obj.set_task_name("{}-node".format(self.__node_name))
@@ -1476,6 +1740,9 @@ class CNode(object):
             bmc_obj.set_port_qemu_ipmi(self.__node["bmc_connection_port"])
             compute_obj.set_port_qemu_ipmi(self.__node["bmc_connection_port"])
 
+        if "monitor_port" in self.__node:
+            compute_obj.set_port_monitor(self.__node["monitor_port"])
+
         for task in self.__tasks_list:
             task.set_workspace(self.workspace)
             task.init()
@@ -1500,72 +1767,179 @@ class CNode(object):
             task.status()
 
 
-"""
+# nodes of a chassis handled at once at most, each on a worker of its own
+CHASSIS_WORKERS = 32
+
+# ports each node listens on, with their defaults, unique in a chassis
+NODE_PORTS = (("ipmi_console_port", 9000),
+              ("bmc_connection_port", 9002),
+              ("serial_port", 9003),
+              ("monitor_port", 2345))
+
+
 class CChassis(object):
-    def __init__(self, chassis_info):
+    """
+    A chassis of nodes, each one a CNode with a workspace of its own.
+
+    Nodes are independent of each other, so each step (init, precheck,
+    start, ...) runs on all nodes in parallel on a pool of workers, while
+    the tasks of a node still run one after the other. A node failing a
+    step does not stop the others, it is skipped by start and its error
+    is returned by the step.
+    """
+    def __init__(self, chassis_info, workers=CHASSIS_WORKERS):
         self.__chassis = chassis_info
-        self.__chassis_model = None
         self.__node_list = []
-        self.__numactl_obj = NumaCtl()
+        self.__workers = workers
+        self.__numactl_obj = None
+        # node name -> exception, of nodes failed in init or precheck
+        self.__failed = {}
 
-    def precheck(self):
-        # check total resources
-        for node in self.__node_list:
-            node.precheck()
+    def get_chassis_name(self):
+        return self.__chassis.get('name', 'chassis')
 
-    def init(self):
+    def get_node_list(self):
+        return self.__node_list
+
+    def get_failed_nodes(self):
+        return self.__failed
+
+    def check_nodes(self):
+        """
+        Every node needs a name and ports no other node in the chassis
+        uses, nodes without a name are named <chassis>-node-<index>
+        """
+        nodes = self.__chassis.get('nodes')
+        if not isinstance(nodes, list) or len(nodes) == 0:
+            raise ArgsNotCorrect("No nodes in chassis {}".
+                                 format(self.get_chassis_name()))
+
+        names = set()
+        ports = {}
+        for index, node in enumerate(nodes):
+            if not isinstance(node, dict):
+                raise ArgsNotCorrect("Node {} of chassis {} is not defined".
+                                     format(index, self.get_chassis_name()))
+            name = node.setdefault('name', "{}-node-{}".
+                                   format(self.get_chassis_name(), index))
+            if name in names:
+                raise ArgsNotCorrect("Node name {} is used twice".
+                                     format(name))
+            names.add(name)
+
+            for option, default in NODE_PORTS:
+                port = node.get(option, default)
+                if port in ports:
+                    raise ArgsNotCorrect("Port {} of node {} is used by "
+                                         "node {} already".
+                                         format(port, name, ports[port]))
+                ports[port] = name
+
+    def init(self, node_id=None):
+        self.check_nodes()
+
+        # nodes share the cpus of the host, so they bind from one table
+        if os.path.exists("/usr/bin/numactl") and \
+                [node for node in self.__chassis['nodes']
+                 if has_option(node, "compute", "numa_control")]:
+            self.__numactl_obj = NumaCtl()
+
+        self.__node_list = []
+        self.__failed = {}
         for node in self.__chassis['nodes']:
             node_obj = CNode(node)
-            node_obj.set_node_name(self.__chassis['name'])
+            node_obj.set_node_name(node['name'])
+            node_obj.set_numactl(self.__numactl_obj)
             self.__node_list.append(node_obj)
 
-        for node_obj in self.__node_list:
-            node_obj.init()
+        return self.run_step("init", node_id)
 
-    def start(self, node_id=None):
-        for node_obj in self.__node_list:
-            if node_id and node_obj.get_node_name() == node_id:
-                node_obj.start()
-                return
+    def precheck(self, node_id=None):
+        return self.run_step("precheck", node_id)
 
-        for node_obj in self.__node_list:
-            node_obj.start()
+    def start(self, node_id=None):
+        return self.run_step("start", node_id, skip_failed=True)
 
     def stop(self, node_id=None):
-        for node_obj in self.__node_list:
-            if node_id and node_obj.get_node_name() == node_id:
-                node_obj.stop()
-                return
+        return self.run_step("stop", node_id)
 
-        for node_obj in self.__node_list:
-            node_obj.stop()
+    def status(self, node_id=None):
+        return self.run_step("status", node_id)
+
+    def terminate_workspace(self, node_id=None):
+        return self.run_step("terminate_workspace", node_id)
+
+    def run_step(self, step, node_id=None, skip_failed=False):
+        """
+        Call a method of nodes in parallel and wait for all of them
+        :param step: name of the CNode method
+        :param node_id: name of the only node to call it of, all if None
+        :param skip_failed: skip nodes failed in init or precheck
+        :return: {node name: exception} of the nodes the step failed on
+        """
+        node_list = [node_obj for node_obj in self.__node_list
+                     if (node_id is None or
+                         node_obj.get_node_name() == node_id) and
+                     not (skip_failed and
+                          node_obj.get_node_name() in self.__failed)]
+        if node_id is not None and not node_list:
+            raise ArgsNotCorrect("No node {} in chassis {}".
+                                 format(node_id, self.get_chassis_name()))
+
+        pending = Queue.Queue()
+        for node_obj in node_list:
+            pending.put(node_obj)
+        failed = {}
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                try:
+                    node_obj = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    getattr(node_obj, step)()
+                except Exception as e:
+                    logger.exception("[model:chassis] {} of node {} "
+                                     "failed".format(step,
+                                                     node_obj.get_node_name()))
+                    with lock:
+                        failed[node_obj.get_node_name()] = e
+
+        workers = [threading.Thread(target=worker,
+                                    name="chassis-{}-{}".format(step, i))
+                   for i in range(0, min(self.__workers, len(node_list)))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        if step in ("init", "precheck"):
+            self.__failed.update(failed)
+        return failed
 
-    def status(self):
-        for node_obj in self.__node_list:
-            node_obj.status()
-"""
 
 class NumaCtl(object):
     def __init__(self):
         self.__cpu_list = []
         self.__node_list = []
         self.__numactl_table = {}
-        numactl_show_output = Utility.run_command("numactl --show")
-        for line in numactl_show_output.split(os.linesep):
-            if line.startswith("physcpubind:"):
-                self.__cpu_list = [int(x) for x in line.split(':')[1].strip().split()]
-
-            if line.startswith("nodebind:"):
-                self.__node_list = [int(x) for x in line.split(':')[1].strip().split()]
-
-        numactl_hardware_output = Utility.run_command("numactl --hardware")
-        for node_index in self.__node_list:
-            self.__numactl_table[node_index] = []
-            for line in numactl_hardware_output.split(os.linesep):
-                if line.startswith("node {} cpus:".format(node_index)):
-                    self.__numactl_table[node_index] = [int(x) for x in line.split(':')[1].strip().split()]
+        # nodes of a chassis take cpus at the same time
+        self.__lock = threading.Lock()
+        numa = inventory.get_numa()
+        if numa is None:
+            raise CommandNotFound("numactl")
+        self.__cpu_list = list(numa["cpus"])
+        self.__node_list = list(numa["nodes"])
+        for node_index, node_cpu_list in numa["node_cpus"]:
+            self.__numactl_table[node_index] = list(node_cpu_list)
 
     def get_cpu_list(self, num):
+        with self.__lock:
+            return self.__get_cpu_list(num)
+
+    def __get_cpu_list(self, num):
         for i in self.__node_list:
             if len(self.__numactl_table[i]) >= num:
                 return [self.__numactl_table[i].pop() for _ in range(0, num)]
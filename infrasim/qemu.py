@@ -3,44 +3,49 @@
 
 import os
 import yaml
-import socket
-import time
-from . import run_command, logger, CommandNotFound, CommandRunFailed, ArgsNotCorrect, has_option, VM_DEFAULT_CONFIG
-from model import CCompute
+from . import logger, host, CommandNotFound, CommandRunFailed, ArgsNotCorrect, has_option, VM_DEFAULT_CONFIG
+from model import CCompute, Utility, READY_TIMEOUT
+from inventory import inventory
 
 
 def get_qemu():
-    try:
-        code, qemu_cmd = run_command("which /usr/local/bin/qemu-system-x86_64")
-        return qemu_cmd.strip(os.linesep)
-    except CommandRunFailed as e:
+    qemu_cmd = inventory.which("/usr/local/bin/qemu-system-x86_64")
+    if qemu_cmd is None:
         raise CommandNotFound("/usr/local/bin/qemu-system-x86_64")
+    return qemu_cmd
 
 
 def status_qemu():
-    try:
-        run_command("pidof qemu-system-x86_64")
+    if host.pidof("qemu-system-x86_64"):
         print "Infrasim Qemu service is running"
-    except CommandRunFailed as e:
+    else:
         print "Inrasim Qemu service is stopped"
 
 
 def create_macvtap(idx, nic, mac):
+    name = "macvtap{}".format(idx)
     try:
-        run_command("ip link add link {} name macvtap{} type macvtap mode bridge".format(nic, idx))
-        run_command("ip link set macvtap{} address {} up".format(idx, mac))
-        run_command("ifconfig macvtap{} promisc".format(idx))
-        time.sleep(1)
-    except CommandRunFailed as e:
-        raise e
+        with host.Netlink() as netlink:
+            netlink.add_macvtap(name, nic, mode="bridge", address=mac)
+            netlink.set_link(name, up=True, promisc=True)
+        # qemu opens the tap device of the macvtap, once udev created it
+        tap_device = "/dev/tap{}".format(host.get_ifindex(name))
+    except OSError as e:
+        raise CommandRunFailed("create {} on {}".format(name, nic), str(e))
+    if not Utility.wait_for(lambda: os.path.exists(tap_device),
+                            READY_TIMEOUT):
+        raise CommandRunFailed("create {}".format(name),
+                               "{} not created in {}s".
+                               format(tap_device, READY_TIMEOUT))
 
 
 def stop_macvtap(eth):
     try:
-        run_command("ip link set {} down".format(eth))
-        run_command("ip link delete {}".format(eth))
-    except CommandRunFailed as e:
-        raise e
+        with host.Netlink() as netlink:
+            netlink.set_link(eth, up=False)
+            netlink.delete_link(eth)
+    except OSError as e:
+        raise CommandRunFailed("delete {}".format(eth), str(e))
 
 
 def start_qemu(conf_file=VM_DEFAULT_CONFIG):
@@ -76,6 +81,9 @@ def start_qemu(conf_file=VM_DEFAULT_CONFIG):
         if "bmc_connection_port" in conf:
             compute.set_port_qemu_ipmi(conf["bmc_connection_port"])
 
+        if "monitor_port" in conf:
+            compute.set_port_monitor(conf["monitor_port"])
+
         compute.init()
         compute.precheck()
         compute.run()
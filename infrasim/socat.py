@@ -2,28 +2,47 @@
 # -*- coding: utf-8 -*-
 
 import os
-import time
 import yaml
-from infrasim.model import CSocat, CNode
-from . import run_command, logger, CommandNotFound, CommandRunFailed, VM_DEFAULT_CONFIG
+from infrasim.model import CSocat, CNode, Utility
+from .inventory import inventory
+from . import logger, host, CommandNotFound, CommandRunFailed, VM_DEFAULT_CONFIG
 
 
 def get_socat():
-    try:
-        code, socat_cmd = run_command("which socat")
-        return socat_cmd.strip(os.linesep)
-    except CommandRunFailed as e:
+    socat_cmd = inventory.which("socat")
+    if socat_cmd is None:
         raise CommandNotFound("/usr/bin/socat")
+    return socat_cmd
 
 
 def status_socat():
-    try:
-        run_command("pidof socat")
+    if host.pidof("socat"):
         print "Infrasim Socat service is running"
-    except CommandRunFailed as e:
+    else:
         print "Inrasim Socat service is stopped"
 
 
+def build_socat(conf):
+    """
+    CSocat of the node of conf, as start_socat runs it
+    """
+    node_name = conf["name"] if "name" in conf else "node-0"
+    socat = CSocat()
+    socat.set_task_name("{}-socat".format(node_name))
+    socat.set_log_path("/var/log/infrasim/{}/socat.log".format(node_name))
+    # Read SOL device, serial port from conf
+    # and set to socat
+    if "sol_device" in conf:
+        socat.set_sol_device(conf["sol_device"])
+    if "serial_port" in conf:
+        socat.set_port_serial(conf["serial_port"])
+
+    socat.set_workspace("{}/.infrasim/{}".
+                        format(os.environ["HOME"], node_name))
+    socat.init()
+    return socat
+
+
 def start_socat(conf_file=VM_DEFAULT_CONFIG):
     try:
         with open(conf_file, 'r') as f_yml:
@@ -34,30 +53,37 @@ def start_socat(conf_file=VM_DEFAULT_CONFIG):
             node.set_node_name(conf["name"])
         node.init_workspace()
 
-        socat = CSocat()
-        # Read SOL device, serial port from conf
-        # and set to socat
-        if "sol_device" in conf:
-            socat.set_sol_device(conf["sol_device"])
-        if "serial_port" in conf:
-            socat.set_port_serial(conf["serial_port"])
-
-        socat.set_workspace(node.workspace)
-        socat.init()
+        socat = build_socat(conf)
         socat.precheck()
         cmd = socat.get_commandline()
 
-        run_command(cmd+" &", True, None, None)
-        time.sleep(3)
+        pid = Utility.execute_command(cmd, log_path=socat.get_log_path(),
+                                      ready=socat.is_ready)
+        socat.set_task_pid(pid)
         logger.info("socat start")
     except CommandRunFailed as e:
         raise e
 
 
 def stop_socat(conf_file=VM_DEFAULT_CONFIG):
-    socat_stop_cmd = "pkill socat"
+    """
+    Stop the socat of the node of conf_file only, the one linking its
+    sol device
+    """
     try:
-        run_command(socat_stop_cmd, True, None, None)
+        with open(conf_file, 'r') as f_yml:
+            conf = yaml.load(f_yml)
+    except IOError as e:
+        logger.error("socat stop failed: {}".format(e))
+        return
+    socat = build_socat(conf)
+    pid_file = os.path.join(socat.get_workspace(),
+                            ".{}".format(socat.get_task_name()))
+    pids = host.kill(host.find_task(pid_file, "socat",
+                                    ["link={},".format(
+                                        socat.get_sol_device())]))
+    socat.set_task_pid(None)
+    if pids:
         logger.info("socat stop")
-    except CommandRunFailed as e:
+    else:
         logger.error("socat stop failed")
@@ -1,10 +1,13 @@
 # encoding: utf8
 
 import codecs
+import collections
+import os
 import paramiko
 import threading
 import socket
 import select
+import time
 import traceback
 import errno
 import logging
@@ -82,8 +85,12 @@ class Handler(paramiko.server.ServerInterface):
         return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
 
     def check_channel_exec_request(self, channel, command):
-        logger.warning('Channel(%d) was denied an exec request', channel.chanid)
-        return False
+        if not hasattr(self.server.delegate, 'execute'):
+            logger.warning('Channel(%d) was denied an exec request', channel.chanid)
+            return False
+        logger.debug('Channel(%d) was granted an exec request', channel.chanid)
+        self.server.exec_work.put(Exec_Request(self, channel, command).run)
+        return True
 
     def check_auth_none(self, username):
         return paramiko.AUTH_SUCCESSFUL
@@ -100,7 +107,10 @@ class Handler(paramiko.server.ServerInterface):
     def check_channel_shell_request(self, channel):
         logger.debug('Channel(%d) was granted a shell request', channel.chanid)
         channel.setblocking(True)
-        Actor(self, channel).start()
+        if getattr(self.server.delegate, 'event_driven', False):
+            self.server.add_session(Session(self, channel))
+        else:
+            Actor(self, channel).start()
         return True
 
     def enable_auth_gssapi(self):
@@ -112,17 +122,43 @@ class Handler(paramiko.server.ServerInterface):
 
 class Server(threading.Thread):
     """
+        Accept SSH connections and run a delegate for each shell.
+
+        A delegate with ``event_driven`` set is not given a thread of its own. One
+        poll loop reads the input of all its sessions, and complete lines go to
+        ``delegate.handle_line`` on a small pool of worker threads. Lines of one
+        session are handled in order. Other delegates run in an ``Actor`` thread each.
+        Exec requests run on a pool of ``exec_workers`` threads of their own.
 
+        ``max_connections`` caps the connections served at a time, further ones are
+        closed right away. Event driven sessions with no input for ``idle_timeout``
+        seconds are closed.
     """
-    def __init__(self, delegate, address='', port=22, backlog=5, key=None, timeout=None, encoding='ascii', handler=Handler):
+    def __init__(self, delegate, address='', port=22, backlog=5, key=None, timeout=None, encoding='ascii',
+                 handler=Handler, max_connections=None, idle_timeout=None, workers=4,
+                 exec_workers=2):
         threading.Thread.__init__(self, name='sshim.Server')
         self.exceptions = queue.Queue()
 
         self.encoding = encoding
         self.timeout = timeout
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
 
         self.counter = Counter()
         self.handler = handler
+        self.handlers = []
+
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        # wakes the poll loop when sessions are added or closed
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        self.work = queue.Queue()
+        self.workers = [Worker(self.work) for i in range(workers)]
+        # exec batches may run long, they get workers of their own so that
+        # interactive sessions keep theirs
+        self.exec_work = queue.Queue()
+        self.workers += [Worker(self.exec_work, 'sshim.Exec_Worker') for i in range(exec_workers)]
 
         self.delegate = delegate
         self.daemon = True
@@ -156,8 +192,13 @@ class Server(threading.Thread):
         """
         logging.info('closing socket')
         self.socket.close()
+        self.wakeup()
         if self.is_alive():
             self.join()
+        for session in list(self.sessions.values()):
+            session.close()
+        for worker in self.workers:
+            worker.work.put(None)
         if not self.exceptions.empty():
             six.reraise(*self.exceptions.get())
 
@@ -165,19 +206,107 @@ class Server(threading.Thread):
         self.counter.join()
         threading.Thread.join(self)
 
+    def wakeup(self):
+        try:
+            os.write(self.wakeup_w, b'x')
+        except OSError:
+            pass
+
+    def add_session(self, session):
+        with self.sessions_lock:
+            self.sessions[session.channel] = session
+        # the delegate is started by a worker, not in the transport thread
+        session.busy = True
+        self.work.put(session.handle_lines)
+        self.wakeup()
+
+    def accept(self):
+        connection, address = self.socket.accept()
+        self.handlers = [h for h in self.handlers if h.transport.is_active()]
+        if self.max_connections is not None and len(self.handlers) >= self.max_connections:
+            logger.warning('sshim.Server refused connection from %s:%d, %d connections open',
+                           address[0], address[1], len(self.handlers))
+            connection.close()
+            return
+        logging.info('sshim.Server accepted connection from %s:%d', *address)
+        #if connection.recv(1, socket.MSG_PEEK):
+        self.handlers.append(self.handler(self, (connection, address)))
+
+    def expire_sessions(self, now):
+        """
+            Close idle sessions, return seconds until the next one may expire.
+        """
+        if self.idle_timeout is None:
+            return None
+        wait = self.idle_timeout
+        for session in list(self.sessions.values()):
+            idle = now - session.last_active
+            if session.busy:
+                continue
+            if idle >= self.idle_timeout:
+                logger.info('Channel(%d) idle for %ds, closing', session.channel.get_id(), idle)
+                session.writeline(u'Session idle timeout.')
+                session.close()
+            else:
+                wait = min(wait, self.idle_timeout - idle)
+        return wait
+
+    def poll_channels(self, poller, registered, channels):
+        """
+            Keep poller registered with the fds of channels, return the channel of
+            each fd. poll has no FD_SETSIZE limit, and each channel takes a pipe.
+        """
+        fds = dict((channel.fileno(), channel) for channel in channels)
+        for fd, channel in list(registered.items()):
+            if fds.get(fd) is not channel:
+                poller.unregister(fd)
+                del registered[fd]
+        for fd, channel in fds.items():
+            if fd not in registered:
+                poller.register(fd, select.POLLIN | select.POLLPRI)
+                registered[fd] = channel
+        return registered
+
     def run(self):
         """
             Synchronously start the server in the current thread, blocking indefinitely.
         """
+        for worker in self.workers:
+            worker.start()
+        poller = select.poll()
+        listen_fd = self.socket.fileno()
+        poller.register(listen_fd, select.POLLIN)
+        poller.register(self.wakeup_r, select.POLLIN)
+        registered = {}
         try:
             try:
                 while self.socket.fileno() > 0:
-                    r, w, x = select.select([self.socket], [], [], 1)
-                    if r:
-                        connection, address = self.socket.accept()
-                        logging.info('sshim.Server accepted connection from %s:%d', *address)
-                        #if connection.recv(1, socket.MSG_PEEK):
-                        self.handler(self, (connection, address))
+                    with self.sessions_lock:
+                        for channel in [c for c, s in self.sessions.items() if s.closed]:
+                            del self.sessions[channel]
+                        channels = list(self.sessions.keys())
+                    wait = self.expire_sessions(time.time())
+                    by_fd = self.poll_channels(poller, registered, channels)
+
+                    events = poller.poll(None if wait is None else wait * 1000)
+                    for fd, event in events:
+                        if fd == self.wakeup_r:
+                            os.read(self.wakeup_r, 4096)
+                        elif fd in by_fd:
+                            # a broken session must not take the others down
+                            session = self.sessions.get(by_fd[fd])
+                            if session is None or session.closed:
+                                continue
+                            try:
+                                session.receive()
+                            except Exception:
+                                logger.exception('Exception in session receive')
+                                session.close()
+                        elif fd == listen_fd:
+                            if event & select.POLLNVAL:
+                                # the listening socket is closed
+                                return
+                            self.accept()
             except (select.error, socket.error) as exception:
                 if hasattr(exception, 'errno'):
                     if exception.errno != errno.EBADF:
@@ -191,6 +320,26 @@ class Server(threading.Thread):
           raise
 
 
+class Worker(threading.Thread):
+    """
+        Run jobs of event driven sessions, or of exec requests, from a queue.
+    """
+    def __init__(self, work, name='sshim.Worker'):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.work = work
+
+    def run(self):
+        while True:
+            job = self.work.get()
+            if job is None:
+                return
+            try:
+                job()
+            except:
+                logger.exception('Exception in worker')
+
+
 class Actor(threading.Thread):
     def __init__(self, client, channel):
         threading.Thread.__init__(self, name='sshim.Actor(%s)' % channel.get_id())
@@ -244,6 +393,9 @@ class Script(object):
         self.transport = transport
         self.fileobj = fileobj
         self.values = {}
+        # input read ahead of the line being expected
+        self.editor = Line_Editor()
+        self.pending = collections.deque()
 
     @property
     def username(self):
@@ -272,6 +424,39 @@ class Script(object):
         """
         self.sendall((six.text_type(line) + u'\r\n').encode(self.encoding))
 
+    def read_chunk(self):
+        """
+            Read whatever input the client has sent, at least one byte unless the input ended.
+        """
+        channel = getattr(self.fileobj, 'channel', None)
+        if channel is not None:
+            return channel.recv(4096)
+        return self.fileobj.read(1)
+
+    def readline(self, echo=True):
+        """
+            Return the next line of input, reading and echoing it a chunk at a time.
+            Input after the line is kept for the next call. Echo of a chunk is up
+            to the call that reads it.
+        """
+        while not self.pending:
+            if self.editor.eof:
+                raise EOFError()
+            data = self.read_chunk()
+            if not data:
+                raise EOFError()
+            output, items = self.editor.feed(data)
+            if echo and output:
+                self.sendall(output)
+            for kind, value in items:
+                if kind == 'line':
+                    self.pending.append(value)
+                else:
+                    if hasattr(self.delegate, 'cursor'):
+                        self.delegate.cursor(value)
+                    logger.debug('cursor: %s', value)
+        return self.pending.popleft()
+
     def expect(self, line, echo=True):
         """
             Expect a line of input from the user. If this has the `match` method, it will call it on the input and return
@@ -281,45 +466,196 @@ class Script(object):
 
             If ``echo`` is set to False, the server will not echo the input back to the client.
         """
-        buffer = six.BytesIO()
-
         try:
-            while True:
-                byte = self.fileobj.read(1)
-
-                if not byte or byte == '\x04':
-                    raise EOFError()
-                elif byte == b'\t':
-                    pass
-                elif byte == b'\x7f':
-                    if buffer.len > 0:
-                        self.sendall('\b \b')
-                        buffer.truncate(buffer.len - 1)
-                elif byte == b'\x1b' and self.fileobj.read(1) == b'[':
-                    command = self.fileobj.read(1)
-                    if hasattr(self.delegate, 'cursor'):
-                        self.delegate.cursor(command)
-                    logger.debug('cursor: %s', command)
-                elif byte in (b'\r', b'\n'):
-                    break
-                else:
-                    logger.debug(repr(byte))
-                    buffer.write(byte)
-                    if echo:
-                        self.sendall(byte)
-
-            if echo:
-                self.sendall('\r\n')
+            value = codecs.decode(self.readline(echo), self.encoding)
 
             if hasattr(line, 'match'):
-                match = line.match(codecs.decode(buffer.getvalue(), self.encoding))
+                match = line.match(value)
                 if match is not None:
                     return match
             else:
-                if line == codecs.decode(buffer.getvalue(), self.encoding):
+                if line == value:
                     return line
         except:
             logger.exception('Exception in actor')
             raise
 
-        raise AssertionError('failed to match %r against %r' % (line, codecs.decode(buffer.getvalue(), self.encoding)))
+        raise AssertionError('failed to match %r against %r' % (line, value))
+
+
+class Line_Editor(object):
+    """
+        Turn raw input into lines the way a terminal would: backspace removes the
+        last character, tab is dropped, ``ESC [ x`` is a cursor key and Ctrl-D
+        ends the input. Input may be split anywhere, state is kept between feeds.
+    """
+    def __init__(self):
+        self.buffer = []
+        self.escape = b''
+        self.eof = False
+
+    def feed(self, data):
+        """
+            Process a chunk of input in one pass.
+            Return (echo, items), where echo is what to write back to the client
+            and items is a list of ('line', bytes) and ('cursor', key) in order.
+            Echo of a line stops where the line ends.
+        """
+        echo = []
+        items = []
+        for byte in (data[i:i + 1] for i in range(len(data))):
+            if self.eof:
+                break
+            if self.escape:
+                self.escape += byte
+                if self.escape == b'\x1b[':
+                    continue
+                if len(self.escape) == 3:
+                    items.append(('cursor', self.escape[2:]))
+                # a lone escape is dropped along with the byte after it
+                self.escape = b''
+            elif byte == b'\x1b':
+                self.escape = byte
+            elif byte == b'\x04':
+                self.eof = True
+            elif byte == b'\t':
+                pass
+            elif byte == b'\x7f':
+                if self.buffer:
+                    echo.append(b'\b \b')
+                    self.buffer.pop()
+            elif byte in (b'\r', b'\n'):
+                echo.append(b'\r\n')
+                items.append(('line', b''.join(self.buffer)))
+                self.buffer = []
+            else:
+                echo.append(byte)
+                self.buffer.append(byte)
+        return b''.join(echo), items
+
+
+class Session(Script):
+    """
+        A shell of an event driven delegate. The server's poll loop calls
+        ``receive`` when the channel has input, complete lines are queued and
+        handed to the delegate by a worker thread.
+    """
+    def __init__(self, client, channel):
+        self.client = client
+        self.server = client.server
+        self.channel = channel
+        self.lines = collections.deque()
+        self.lock = threading.Lock()
+        self.busy = False
+        self.started = False
+        self.closed = False
+        self.last_active = time.time()
+        Script.__init__(self, self.server.delegate, None, client.transport, encoding=self.server.encoding)
+
+    def start(self):
+        self.started = True
+        try:
+            self.delegate = self.server.delegate(self)
+        except:
+            logger.exception('Exception in session')
+            self.close()
+
+    def sendall(self, bytes):
+        try:
+            self.channel.sendall(bytes)
+        except socket.error:
+            pass
+        except EOFError:
+            pass
+
+    def receive(self):
+        """
+            Read what the channel has and queue complete lines.
+        """
+        try:
+            data = self.channel.recv(4096)
+        except (socket.error, EOFError):
+            data = b''
+        if not data:
+            self.close()
+            return
+        self.last_active = time.time()
+
+        echo, items = self.editor.feed(data)
+        if echo:
+            self.sendall(echo)
+        with self.lock:
+            for kind, value in items:
+                if kind == 'line':
+                    self.lines.append(codecs.decode(value, self.encoding, 'replace'))
+                elif self.started and hasattr(self.delegate, 'cursor'):
+                    self.delegate.cursor(value)
+            if self.editor.eof:
+                self.lines.append(None)
+            if self.lines and not self.busy:
+                self.busy = True
+                self.server.work.put(self.handle_lines)
+
+    def handle_lines(self):
+        """
+            Hand queued lines to the delegate, in a worker thread.
+            A None line or a False return closes the session.
+        """
+        if not self.started:
+            self.start()
+        while True:
+            with self.lock:
+                if not self.lines or self.closed:
+                    self.busy = False
+                    return
+                line = self.lines.popleft()
+            try:
+                keep = line is not None and self.delegate.handle_line(line) is not False
+            except:
+                logger.exception('Exception in session')
+                keep = False
+            self.last_active = time.time()
+            if not keep:
+                with self.lock:
+                    self.busy = False
+                self.close()
+                return
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.channel.close()
+        except EOFError:
+            logger.debug('Channel already closed')
+        self.server.wakeup()
+
+
+class Exec_Request(object):
+    """
+        A command run with ``ssh host <command>``. ``delegate.execute(command)``
+        returns the whole output and an exit status, which are sent back followed
+        by EOF. The client closes the channel once it has read them; closing it
+        from here could overtake the reply to the exec request, which the
+        transport thread sends only after the request is handed over.
+    """
+    def __init__(self, client, channel, command):
+        self.client = client
+        self.server = client.server
+        self.channel = channel
+        self.command = command
+
+    def run(self):
+        try:
+            output, status = self.server.delegate.execute(codecs.decode(self.command, self.server.encoding, 'replace'))
+            output = six.text_type(output).encode(self.server.encoding)
+        except:
+            logger.exception('Exception in exec request')
+            output, status = b'', 1
+        try:
+            self.channel.sendall(output)
+            self.channel.send_exit_status(status)
+            self.channel.shutdown_write()
+        except (socket.error, EOFError):
+            logger.debug('Channel already closed')
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Resident supervisor of the nodes of infrasim.yml, one node or a chassis.
+
+The supervisor starts socat and ipmi_sim of each node as its own children
+and waits for them with waitpid, so it knows the moment one exits, and
+restarts it as the restart policy of the node says:
+
+    always        restart whenever it exits
+    on-failure    restart if it exits with an error or a signal (default)
+    never         leave it stopped
+
+Restarts back off from RESTART_BACKOFF, doubling up to
+RESTART_BACKOFF_MAX; a task that ran for RESTART_STABLE_TIME starts over.
+
+qemu is started by ipmi_sim when the vBMC powers the node on, and stopped
+when it powers it off, so the supervisor only follows it: through its pid
+file, and a pidfd once it runs.
+
+Pid files are still written, for tools that read them, but state is kept
+in memory and served on a unix socket, one JSON line per request line:
+
+    status [<node>]    state of the tasks of all nodes, or of one
+    stop               stop all tasks and the supervisor
+"""
+
+import json
+import os
+import shlex
+import signal
+import socket
+import SocketServer
+import subprocess
+import threading
+import time
+from . import logger, has_option, ArgsNotCorrect, InfraSimError
+from .model import CNode, CChassis, Utility, READY_TIMEOUT, STOP_TIMEOUT
+
+RESTART_ALWAYS = "always"
+RESTART_ON_FAILURE = "on-failure"
+RESTART_NEVER = "never"
+RESTART_POLICIES = (RESTART_ALWAYS, RESTART_ON_FAILURE, RESTART_NEVER)
+# seconds to wait before a restart, doubled for each restart in a row
+RESTART_BACKOFF = 1
+RESTART_BACKOFF_MAX = 60
+# seconds a task has to run to count as stable again
+RESTART_STABLE_TIME = 30
+# seconds a pid file of qemu is waited for at once, before checking for
+# stop again
+FOLLOW_TIMEOUT = 60
+# seconds the pid file of a qemu that exited is given to go: a power off
+# removes it, a crash leaves it behind
+POWER_OFF_TIMEOUT = 1
+# seconds a control request may take
+CONTROL_TIMEOUT = 5
+
+
+def get_socket_path():
+    return os.path.join(os.environ["HOME"], ".infrasim", "supervisor.sock")
+
+
+class Supervised_Task(threading.Thread):
+    """
+    One task of a node, kept running in a thread of its own. The thread
+    starts the task once the task before it in the node is up.
+    """
+
+    def __init__(self, node_name, task, policy, changed, after=None):
+        threading.Thread.__init__(self, name="supervisor.{}".
+                                  format(task.get_task_name()))
+        self.daemon = True
+        self.node_name = node_name
+        self.task = task
+        self.policy = policy
+        # notified on any change of state, shared by all tasks
+        self.changed = changed
+        self.after = after
+        self.up = False
+        self.stopped = False
+        # pipe written on stop, to wake a follow blocked in select
+        self.wakeup = None
+        self.proc = None
+        self.state = "waiting"
+        self.pid = None
+        self.restarts = 0
+        self.exit_code = None
+        self.since = time.time()
+        self.backoff = RESTART_BACKOFF
+
+    def set_state(self, state, pid=None):
+        with self.changed:
+            self.state = state
+            self.pid = pid
+            self.since = time.time()
+            if state == "running":
+                self.up = True
+            self.changed.notify_all()
+
+    def get_status(self):
+        with self.changed:
+            return {"state": self.state,
+                    "pid": self.pid,
+                    "restarts": self.restarts,
+                    "exit_code": self.exit_code,
+                    "since": self.since}
+
+    def stop(self):
+        """
+        Stop the task and wait for it to exit
+        """
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+            if self.wakeup is not None:
+                os.write(self.wakeup[1], "x")
+        if self.task.get_run_mask():
+            self.task.terminate()
+            self.join(STOP_TIMEOUT)
+            return
+        # SIGTERM, then SIGKILL if it does not exit in time
+        for signum in (signal.SIGTERM, signal.SIGKILL):
+            proc = self.proc
+            if proc is not None and proc.returncode is None:
+                try:
+                    os.kill(proc.pid, signum)
+                except OSError:
+                    pass
+            self.join(STOP_TIMEOUT)
+            if not self.is_alive():
+                return
+
+    def run(self):
+        with self.changed:
+            while not self.stopped and \
+                    not (self.after is None or self.after.up):
+                self.changed.wait()
+        try:
+            if self.task.get_run_mask():
+                self.follow()
+            else:
+                self.supervise()
+        except Exception:
+            logger.exception("[supervisor] {} failed".
+                             format(self.task.get_task_name()))
+            self.set_state("failed")
+
+    def spawn(self):
+        """
+        Start the task as a child, wait till it is ready. A task not
+        ready in time is killed.
+        """
+        self.set_state("starting")
+        log_path = self.task.get_log_path() or os.devnull
+        with open(os.devnull, "r") as stdin, open(log_path, "a") as log:
+            self.proc = subprocess.Popen(
+                shlex.split(self.task.get_commandline()), stdin=stdin,
+                stdout=log, stderr=subprocess.STDOUT, close_fds=True)
+        proc = self.proc
+        self.task.set_task_pid(proc.pid)
+        if Utility.wait_for(lambda: proc.poll() is not None or
+                            self.stopped or self.task.is_ready(proc.pid),
+                            READY_TIMEOUT):
+            if proc.poll() is None:
+                self.set_state("running", proc.pid)
+        else:
+            logger.error("[supervisor] {} not ready in {}s".
+                         format(self.task.get_task_name(), READY_TIMEOUT))
+            proc.kill()
+
+    def supervise(self):
+        while not self.stopped:
+            start = time.time()
+            try:
+                self.spawn()
+            except (OSError, IOError) as e:
+                logger.error("[supervisor] fail to start {}: {}".
+                             format(self.task.get_task_name(), e))
+                exit_code = None
+            else:
+                exit_code = self.proc.wait()
+                self.task.set_task_pid(None)
+            with self.changed:
+                self.exit_code = exit_code
+            if self.stopped:
+                break
+
+            if exit_code == 0 and self.policy != RESTART_ALWAYS or \
+                    self.policy == RESTART_NEVER:
+                self.set_state("exited")
+                return
+            logger.error("[supervisor] {} exited with {}".
+                         format(self.task.get_task_name(), exit_code))
+            if time.time() - start >= RESTART_STABLE_TIME:
+                self.backoff = RESTART_BACKOFF
+            self.set_state("backoff")
+            deadline = time.time() + self.backoff
+            with self.changed:
+                # other tasks notify too, so wait out the deadline
+                while not self.stopped and time.time() < deadline:
+                    self.changed.wait(deadline - time.time())
+                self.restarts += 1
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+        self.set_state("stopped")
+
+    def follow(self):
+        """
+        Follow a task another one runs: running while its pid file
+        names a process, powered off otherwise. Only a run that exits
+        without a power off counts as a restart.
+        """
+        workspace = self.task.get_workspace() or "/"
+        last_pid = None
+        with self.changed:
+            if self.stopped:
+                return
+            self.wakeup = os.pipe()
+        self.set_state("off")
+        try:
+            while not self.stopped:
+                pid = self.task.get_task_pid()
+                if not pid or pid == last_pid:
+                    # a pid file left by a crash is not the next run
+                    Utility.wait_for_file(
+                        workspace,
+                        lambda: self.stopped or
+                        self.task.get_task_pid() not in ("", None, last_pid),
+                        FOLLOW_TIMEOUT, self.wakeup[0])
+                    continue
+                last_pid = pid
+                if not Utility.is_process_alive(pid):
+                    continue
+                self.set_state("running", int(pid))
+                if not Utility.wait_for_exit(pid, wakeup=self.wakeup[0]) or \
+                        self.stopped:
+                    break
+                if not Utility.wait_for(
+                        lambda: self.task.get_task_pid() != pid,
+                        POWER_OFF_TIMEOUT):
+                    logger.error("[supervisor] {} {} exited without a power "
+                                 "off".format(self.task.get_task_name(), pid))
+                    with self.changed:
+                        self.restarts += 1
+                self.set_state("off")
+        finally:
+            with self.changed:
+                for fd in self.wakeup:
+                    os.close(fd)
+                self.wakeup = None
+        self.set_state("stopped")
+
+
+class Control_Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        self.request.settimeout(CONTROL_TIMEOUT)
+        try:
+            for line in self.rfile:
+                response = self.server.supervisor.handle_request(line)
+                self.wfile.write(json.dumps(response) + "\n")
+                self.wfile.flush()
+        except socket.error:
+            pass
+
+
+class Control_Server(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class Supervisor(object):
+    def __init__(self, conf, socket_path=None):
+        self.__conf = conf
+        self.__socket_path = socket_path or get_socket_path()
+        # tasks of all nodes, each node in start order
+        self.__tasks = []
+        self.__server = None
+        self.__changed = threading.Condition()
+
+    def get_policy(self, node_info):
+        policy = node_info.get("restart", RESTART_ON_FAILURE)
+        if policy not in RESTART_POLICIES:
+            raise ArgsNotCorrect("Restart policy {} of node {} is not one "
+                                 "of {}".format(policy, node_info.get("name"),
+                                                ", ".join(RESTART_POLICIES)))
+        return policy
+
+    def load_nodes(self):
+        """
+        Initialize and check the nodes of the configure file
+        :return: [(node, restart policy)] of nodes that passed
+        """
+        if not has_option(self.__conf, "nodes"):
+            node_obj = CNode(self.__conf)
+            policy = self.get_policy(self.__conf)
+            node_obj.init()
+            node_obj.precheck()
+            return [(node_obj, policy)]
+
+        chassis = CChassis(self.__conf)
+        chassis.check_nodes()
+        policies = dict([(node_info["name"], self.get_policy(node_info))
+                         for node_info in self.__conf["nodes"]])
+        chassis.init()
+        chassis.precheck()
+        for name, e in chassis.get_failed_nodes().items():
+            logger.error("[supervisor] node {} is not started: {}".
+                         format(name, e))
+        return [(node_obj, policies[node_obj.get_node_name()])
+                for node_obj in chassis.get_node_list()
+                if node_obj.get_node_name() not in
+                chassis.get_failed_nodes()]
+
+    def start(self):
+        """
+        Take over the control socket, start all nodes and return; nodes
+        start in parallel, their tasks one after the other
+        """
+        try:
+            query("status", self.__socket_path)
+        except (socket.error, ValueError):
+            pass
+        else:
+            raise InfraSimError("A supervisor runs on {} already".
+                                format(self.__socket_path))
+        if os.path.exists(self.__socket_path):
+            os.remove(self.__socket_path)
+        self.__server = Control_Server(self.__socket_path, Control_Handler)
+        self.__server.supervisor = self
+
+        started = False
+        try:
+            for node_obj, policy in self.load_nodes():
+                after = None
+                for task in node_obj.get_tasks():
+                    supervised = Supervised_Task(node_obj.get_node_name(),
+                                                 task, policy,
+                                                 self.__changed, after)
+                    self.__tasks.append(supervised)
+                    after = supervised
+            started = True
+        finally:
+            # leave no socket behind for the next supervisor to trip on
+            if not started:
+                self.__server.server_close()
+                self.__server = None
+                if os.path.exists(self.__socket_path):
+                    os.remove(self.__socket_path)
+        for supervised in self.__tasks:
+            supervised.start()
+        logger.info("[supervisor] supervising {} tasks".
+                    format(len(self.__tasks)))
+
+    def serve(self):
+        """
+        Answer control requests till stopped
+        """
+        self.__server.serve_forever()
+
+    def stop(self):
+        """
+        Stop all tasks, the last to start first, and stop serving
+        """
+        for supervised in reversed(self.__tasks):
+            supervised.stop()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            if os.path.exists(self.__socket_path):
+                os.remove(self.__socket_path)
+        logger.info("[supervisor] stopped")
+
+    def get_status(self, node_name=None):
+        """
+        :return: {node: {task: status}}, of one node if node_name
+        """
+        nodes = {}
+        for supervised in self.__tasks:
+            if node_name is None or supervised.node_name == node_name:
+                nodes.setdefault(supervised.node_name, {})[
+                    supervised.task.get_task_name()] = \
+                    supervised.get_status()
+        return nodes
+
+    def handle_request(self, line):
+        words = line.split()
+        if not words:
+            return {"error": "empty request"}
+        if words[0] == "status" and len(words) <= 2:
+            node_name = words[1] if len(words) == 2 else None
+            nodes = self.get_status(node_name)
+            if node_name is not None and not nodes:
+                return {"error": "no node {}".format(node_name)}
+            return {"nodes": nodes}
+        if words == ["stop"]:
+            # the server can't shut down from one of its own requests
+            t = threading.Thread(target=self.stop,
+                                 name="supervisor.stop")
+            t.daemon = True
+            t.start()
+            return {"result": "stopping"}
+        return {"error": "unknown request {}".format(line.strip())}
+
+
+def query(request, socket_path=None, timeout=CONTROL_TIMEOUT):
+    """
+    Send a request to the supervisor running
+    Raise socket.error if none runs
+    :return: the response
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path or get_socket_path())
+        sock.sendall(request + "\n")
+        response = ""
+        while not response.endswith("\n"):
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+    finally:
+        sock.close()
+    return json.loads(response)
+
+
+def run(conf, socket_path=None):
+    """
+    Supervise the nodes of conf till SIGTERM, SIGINT or a stop request
+    """
+    supervisor = Supervisor(conf, socket_path)
+    supervisor.start()
+
+    def handle_signal(signum, frame):
+        t = threading.Thread(target=supervisor.stop, name="supervisor.stop")
+        t.daemon = True
+        t.start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    supervisor.serve()
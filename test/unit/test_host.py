@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import errno
+import os
+import socket
+import struct
+import subprocess
+import tempfile
+import unittest
+from infrasim import host, model
+
+
+class test_host(unittest.TestCase):
+
+    def setUp(self):
+        self.processes = []
+
+    def tearDown(self):
+        for proc in self.processes:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+    def spawn(self, *args):
+        proc = subprocess.Popen(list(args))
+        self.processes.append(proc)
+        # till exec, the child still runs python
+        assert model.Utility.wait_for(
+            lambda: host.read_cmdline(proc.pid) == list(args), 2)
+        return proc
+
+    def test_which(self):
+        assert host.which("sh") == \
+            subprocess.check_output("which sh", shell=True).strip()
+        assert host.which("/bin/sh") == "/bin/sh"
+        assert host.which("no-such-command") is None
+        assert host.which("/etc/passwd") is None
+
+    def test_uname(self):
+        assert host.uname() == \
+            subprocess.check_output(["uname", "-sr"]).strip()
+
+    def test_find_processes(self):
+        # two nodes, told apart by their command line
+        node_0 = self.spawn("sleep", "30.0001")
+        node_1 = self.spawn("sleep", "30.0002")
+        assert node_0.pid in host.pidof("sleep")
+        assert host.find_processes("sleep", ["30.0001"]) == [node_0.pid]
+        assert host.find_processes("true", ["30.0001"]) == []
+
+        # stopping one node leaves the other alone
+        assert host.pkill("sleep", ["30.0002"]) == [node_1.pid]
+        node_1.wait()
+        assert node_0.poll() is None
+
+    def test_find_task(self):
+        node_0 = self.spawn("sleep", "30.0003")
+        fd, pid_file = tempfile.mkstemp()
+        try:
+            os.write(fd, "{}\n".format(node_0.pid))
+            os.close(fd)
+            assert host.find_task(pid_file, "sleep", ["30.0003"]) == \
+                [node_0.pid]
+            # a pid reused by another process is not the task
+            with open(pid_file, "w") as f:
+                f.write(str(os.getppid()))
+            assert host.find_task(pid_file, "sleep", ["30.0003"]) == \
+                [node_0.pid]
+            os.remove(pid_file)
+            assert host.find_task(pid_file, "sleep", ["30.0003"]) == \
+                [node_0.pid]
+        finally:
+            if os.path.exists(pid_file):
+                os.remove(pid_file)
+
+    def test_listens_on(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        try:
+            # bound is not listening yet
+            assert not host.listens_on(os.getpid(), port)
+            sock.listen(1)
+            assert host.listens_on(os.getpid(), port)
+            assert not host.listens_on(os.getppid(), port)
+        finally:
+            sock.close()
+        assert not host.listens_on(os.getpid(), port)
+
+    def test_pack_link(self):
+        message = host.Netlink.pack_link(name="macvtap0", link=2,
+                                         kind="macvtap",
+                                         address="52:54:be:ef:00:01")
+        header = struct.pack("=BxHiII", 0, 0, 0, 0, 0)
+        assert message.startswith(header)
+        attrs = message[len(header):]
+        # IFLA_IFNAME, padded to 4 bytes
+        assert attrs[:16] == struct.pack("=HH", 13, 3) + "macvtap0\0" + \
+            "\0" * 3
+        assert attrs[16:24] == struct.pack("=HHI", 8, 5, 2)
+        assert attrs[24:36] == struct.pack("=HH", 10, 1) + \
+            "\x52\x54\xbe\xef\x00\x01" + "\0" * 2
+        assert attrs[36:] == struct.pack("=HH", 16, 18) + \
+            struct.pack("=HH", 11, 1) + "macvtap" + "\0"
+
+    def test_netlink(self):
+        try:
+            netlink = host.Netlink()
+            netlink.add_link("infrasimbr0", "bridge")
+        except (OSError, IOError) as e:
+            if e.errno in (errno.EPERM, errno.EOPNOTSUPP, errno.EACCES):
+                self.skipTest("no permission to manage links")
+            raise
+        try:
+            netlink.add_macvtap("infrasimtap0", "infrasimbr0",
+                                address="52:54:be:ef:00:01")
+            netlink.set_link("infrasimtap0", up=True, promisc=True)
+            with open("/sys/class/net/infrasimtap0/address") as f:
+                assert f.read().strip() == "52:54:be:ef:00:01"
+            with open("/sys/class/net/infrasimtap0/flags") as f:
+                flags = int(f.read(), 16)
+            assert flags & (host.Netlink.IFF_UP | host.Netlink.IFF_PROMISC) \
+                == host.Netlink.IFF_UP | host.Netlink.IFF_PROMISC
+            try:
+                netlink.add_link("infrasimbr0", "bridge")
+            except OSError as e:
+                assert e.errno == errno.EEXIST
+            else:
+                assert False
+            netlink.delete_link("infrasimtap0")
+            assert not os.path.exists("/sys/class/net/infrasimtap0")
+        finally:
+            if os.path.exists("/sys/class/net/infrasimtap0"):
+                netlink.delete_link("infrasimtap0")
+            netlink.delete_link("infrasimbr0")
+            netlink.close()
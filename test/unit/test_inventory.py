@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from infrasim import inventory, model
+
+
+class test_inventory(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.boot_id_file = inventory.BOOT_ID_FILE
+        inventory.BOOT_ID_FILE = os.path.join(self.workspace, "boot_id")
+        with open(inventory.BOOT_ID_FILE, "w") as f:
+            f.write("boot-0\n")
+        self.path = os.path.join(self.workspace, "cache", "inventory.json")
+        self.log = os.path.join(self.workspace, "runs")
+        self.path_env = os.environ["PATH"]
+        os.environ["PATH"] = "{}:{}".format(self.workspace, self.path_env)
+
+    def tearDown(self):
+        inventory.BOOT_ID_FILE = self.boot_id_file
+        os.environ["PATH"] = self.path_env
+        shutil.rmtree(self.workspace)
+
+    def add_command(self, name, output):
+        """
+        A command that logs each run and prints output
+        """
+        path = os.path.join(self.workspace, name)
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\necho \"$@\" >> {}\nprintf '{}'\n".
+                    format(self.log, output))
+        os.chmod(path, 0755)
+        return path
+
+    def get_runs(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log, "r") as f:
+            return f.read().splitlines()
+
+    def test_version(self):
+        path = self.add_command("socat", "socat by Gerhard\\nsocat version 1.7.3.1")
+        assert inventory.Inventory(self.path).which("socat") == path
+        assert inventory.Inventory(self.path).get_version("socat") == \
+            "socat by Gerhard\nsocat version 1.7.3.1"
+        # a new command reads the cache, and runs nothing
+        assert inventory.Inventory(self.path).get_version("socat") == \
+            "socat by Gerhard\nsocat version 1.7.3.1"
+        assert self.get_runs() == ["-V"]
+
+        # an upgrade is a new inode, a rebuild a new mtime
+        os.remove(path)
+        self.add_command("socat", "socat version 1.7.3.2")
+        assert inventory.Inventory(self.path).get_version("socat") == \
+            "socat version 1.7.3.2"
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+        assert inventory.Inventory(self.path).get_version("socat") == \
+            "socat version 1.7.3.2"
+        assert self.get_runs() == ["-V", "-V", "-V"]
+
+        os.remove(path)
+        assert inventory.Inventory(self.path).which("socat") is None
+
+    def test_numa(self):
+        self.add_command("numactl",
+                         "policy: default\\n"
+                         "physcpubind: 0 1 2 3\\n"
+                         "nodebind: 0 1\\n"
+                         "node 0 cpus: 0 1\\n"
+                         "node 1 cpus: 2 3\\n")
+        numa = inventory.Inventory(self.path).get_numa()
+        assert numa["cpus"] == [0, 1, 2, 3]
+        assert numa["nodes"] == [0, 1]
+        assert numa["node_cpus"] == [[0, [0, 1]], [1, [2, 3]]]
+        assert self.get_runs() == ["--show", "--hardware"]
+
+        assert inventory.Inventory(self.path).get_numa() == numa
+        assert len(self.get_runs()) == 2
+
+        # a reboot drops all facts
+        with open(inventory.BOOT_ID_FILE, "w") as f:
+            f.write("boot-1\n")
+        assert inventory.Inventory(self.path).get_numa() == numa
+        assert len(self.get_runs()) == 4
+
+    def test_numactl(self):
+        self.add_command("numactl",
+                         "physcpubind: 0 1 2\\n"
+                         "nodebind: 0\\n"
+                         "node 0 cpus: 0 1 2\\n")
+        shared = inventory.inventory
+        inventory.inventory = inventory.Inventory(self.path)
+        model.inventory = inventory.inventory
+        try:
+            numactl_obj = model.NumaCtl()
+            assert sorted(numactl_obj.get_cpu_list(2) +
+                          numactl_obj.get_cpu_list(1)) == [0, 1, 2]
+            assert numactl_obj.get_cpu_list(1) == []
+            # cpus taken by one NumaCtl are not taken from the cache
+            assert model.NumaCtl().get_cpu_list(3) == [2, 1, 0]
+        finally:
+            inventory.inventory = shared
+            model.inventory = shared
+
+    def test_kvm(self):
+        kvm = os.path.exists(inventory.KVM_DEVICE)
+        assert inventory.Inventory(self.path).has_kvm() == kvm
+        assert inventory.Inventory(self.path).get_facts()["kvm"] == kvm
+
+    def test_cache_hit(self):
+        self.add_command("socat", "socat version 1.7.3.1")
+        inventory.Inventory(self.path).get_version("socat")
+        start = time.time()
+        for _ in range(0, 100):
+            inventory.Inventory(self.path).get_version("socat")
+        assert time.time() - start < 1
+        assert len(self.get_runs()) == 1
+
+    def test_broken_cache(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write("{")
+        path = self.add_command("socat", "socat version 1.7.3.1")
+        assert inventory.Inventory(self.path).which("socat") == path
@@ -3,7 +3,9 @@
 
 from infrasim.ipmicons import sdr
 from infrasim.ipmicons.command import Command_Handler
-from infrasim.ipmicons.common import msg_queue
+import json
+import os
+import tempfile
 import unittest
 
 ch = Command_Handler()
@@ -23,19 +25,19 @@ class test_ipmi_console(unittest.TestCase):
                                      ID=0x10,
                                      mc=32,
                                      value="0xca10",
-                                     tp=0x00)
-        sensor_d.set_event_type(0x6f)
+                                     tp=0x00,
+                                     event_type=0x6f)
 
-        ch.get_sensor_value(["0x10"])
-        assert "0xca10" in msg_queue.get()
+        response = ch.handle_command("sensor value get 0x10")
+        assert "0xca10" in response.getvalue()
 
     def test_sensor_value_get_analog(self):
         sensor_a = sdr.build_sensors(name="analog_sample",
                                      ID=0x11,
                                      mc=32,
                                      value=0x63,
-                                     tp=0x00)
-        sensor_a.set_event_type(0x01)
+                                     tp=0x00,
+                                     event_type=0x01)
         sensor_a.set_m_lb(0x58)
         sensor_a.set_m_ub(0x00)
         sensor_a.set_b_lb(0x00)
@@ -43,5 +45,211 @@ class test_ipmi_console(unittest.TestCase):
         sensor_a.set_exp(0x00)
         sensor_a.set_su2(18)
 
-        ch.get_sensor_value(["0x11"])
-        assert "analog_sample : 8712.000 RPM" in msg_queue.get()
+        response = ch.handle_command("sensor value get 0x11")
+        assert "analog_sample : 8712.000 RPM" in response.getvalue()
+
+    def test_sensor_mode_set_discrete(self):
+        sdr.build_sensors(name="discrete_mode_sample",
+                          ID=0x13,
+                          mc=32,
+                          value="0x0100",
+                          tp=0x00,
+                          event_type=0x6f)
+
+        for mode in ("auto", "fault lnc"):
+            response = ch.handle_command("sensor mode set 0x13 " + mode)
+            assert "only supports user mode" in response.getvalue()
+        response = ch.handle_command("sensor mode get 0x13")
+        assert "mode: user" in response.getvalue()
+
+    def test_response_per_session(self):
+        sensor_d = sdr.build_sensors(name="session_sample",
+                                     ID=0x12,
+                                     mc=32,
+                                     value="0x0100",
+                                     tp=0x00,
+                                     event_type=0x6f)
+        sensor_d.set_mc(32)
+        sensor_d.set_lun(0)
+        sensor_d.initialize_sel()
+
+        ch_other = Command_Handler()
+        response = ch.handle_command("sensor value get 0x12")
+        response_other = ch_other.handle_command("sel get 0x12")
+        response_bad = ch.handle_command("unknown")
+
+        assert response.getvalue() == "session_sample : 0x0100\n"
+        assert "sensor type 0x0 not exist" in response_other.getvalue()
+        assert "session_sample" not in response_other.getvalue()
+        assert response_bad.getvalue() == "illegal command\n"
+
+    def test_sensor_query(self):
+        for ID, name in [(0x60, "query_PSU1"), (0x61, "query_PSU2")]:
+            sdr.build_sensors(name=name,
+                              ID=ID,
+                              mc=32,
+                              value="0x0100",
+                              tp=0x08,
+                              event_type=0x6f)
+
+        response = ch.handle_command("sensor value get name=query_PSU*")
+        assert response.getvalue() == "query_PSU1 : 0x0100\n" \
+            "query_PSU2 : 0x0100\n"
+        response = ch.handle_command("sensor mode get name=query_PSU2&id=61")
+        assert response.getvalue() == "Sensor query_PSU2 mode: user\n"
+        response = ch.handle_command("sensor info name=query_none")
+        assert response.getvalue() == "no sensor matches name=query_none\n"
+        response = ch.handle_command("sensor info size=1")
+        assert response.getvalue() == "illegal sensor query: size=1\n"
+
+    def test_sensor_suppress(self):
+        sensor_obj = sdr.build_sensors(name="suppress_sample",
+                                       ID=0x14,
+                                       mc=32,
+                                       value=0x10,
+                                       tp=0x01,
+                                       event_type=0x01)
+
+        output = ch.handle_command("sensor suppress set 0x14 2 1 0.5").\
+            getvalue()
+        assert output == "Sensor suppress_sample suppression: min delta 2, " \
+            "hysteresis 1, max rate 0.5\n"
+        assert sensor_obj.get_suppression() == (2, 1, 0.5)
+        sensor_obj.suppressed = 3
+        output = ch.handle_command("sensor suppress get 0x14").getvalue()
+        assert output.endswith("suppressed writes: 3\n")
+        output = ch.handle_command("sensor suppress get").getvalue()
+        assert output.startswith("Suppressed writes: ")
+        output = ch.handle_command("sensor suppress set 0x14 2 -1 0").\
+            getvalue()
+        assert "Available 'sensor suppress' commands" in output
+
+    def test_batch_output_is_framed(self):
+        sensor_d = sdr.build_sensors(name="batch_sample",
+                                     ID=0x13,
+                                     mc=32,
+                                     value="0x0200",
+                                     tp=0x00,
+                                     event_type=0x6f)
+
+        response = ch.handle_batch(["# comment",
+                                    "sensor value get 0x13",
+                                    "",
+                                    "unknown",
+                                    "quit",
+                                    "sensor value get 0x13"])
+        assert response.getvalue() == \
+            "=== [1] sensor value get 0x13\n" \
+            "batch_sample : 0x0200\n" \
+            "=== [2] unknown\n" \
+            "illegal command\n" \
+            "=== 2 commands\n"
+
+    def test_run_script(self):
+        fd, script = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as fp:
+            fp.write("help\nrun {0}\nhistory\n".format(script))
+        try:
+            response = ch.handle_command("run " + script)
+        finally:
+            os.remove(script)
+        output = response.getvalue()
+        assert output.startswith("=== [1] help\n")
+        assert "=== [2] run {0}\nrun is not allowed".format(script) in output
+        assert "=== [3] history\n" in output
+        assert output.endswith("=== 3 commands\n")
+
+        response = ch.handle_command("run /nonexistent/script")
+        assert "fail to read script /nonexistent/script" in \
+            response.getvalue()
+
+
+    def test_pipeline(self):
+        sdr.build_sensors(name="pipeline_sample",
+                          ID=0x14,
+                          mc=32,
+                          value="0x0400",
+                          tp=0x00,
+                          event_type=0x6f)
+
+        response = ch.handle_command("sensor value get 0x14;unknown ; "
+                                     "quit; sensor value get 0x14")
+        assert response.getvalue() == \
+            "=== [1] sensor value get 0x14\n" \
+            "pipeline_sample : 0x0400\n" \
+            "=== [2] unknown\n" \
+            "illegal command\n" \
+            "=== 2 commands\n"
+        assert ch.quit_requested is True
+
+        # a ';' in a script line is a pipeline too, quit ends the script
+        response = ch.handle_batch(["help; sensor value get 0x14"])
+        assert "=== [2] sensor value get 0x14\npipeline_sample" in \
+            response.getvalue()
+        assert ch.quit_requested is False
+
+    def test_json_output(self):
+        sensor_a = sdr.build_sensors(name="json_analog",
+                                     ID=0x15,
+                                     mc=32,
+                                     value=0x63,
+                                     tp=0x04,
+                                     event_type=0x01)
+        sensor_a.set_m_lb(0x58)
+        sensor_a.set_m_ub(0x00)
+        sensor_a.set_b_lb(0x00)
+        sensor_a.set_b_ub(0x00)
+        sensor_a.set_exp(0x00)
+        sensor_a.set_su2(18)
+        sensor_a.set_rtm(0x08)
+        sensor_a.set_unc(0x80)
+        sensor_d = sdr.build_sensors(name="json_discrete",
+                                     ID=0x16,
+                                     mc=32,
+                                     value="0x0500",
+                                     tp=0x05,
+                                     event_type=0x6f)
+        sensor_d.initialize_sel()
+
+        ch_json = Command_Handler()
+        ch_json.handle_command("output json")
+        assert ch_json.handle_command("output").getvalue() == \
+            '{"output": "json\\n", "result": null}\n'
+
+        output = json.loads(ch_json.handle_command(
+            "sensor info 0x15").getvalue())
+        info = output["result"][0]
+        assert (info["name"], info["id"], info["unit"]) == \
+            ("json_analog", "0x15", "RPM")
+        assert info["value"] == 8712.0
+        assert info["unc"] == 11264.0
+        assert info["lnr"] is None
+        assert output["output"] == ""
+
+        output = json.loads(ch_json.handle_command(
+            "sensor value get 0x16").getvalue())
+        assert output["result"] == [{"name": "json_discrete", "id": "0x16",
+                                     "mc": "0x20", "event_type": "discrete",
+                                     "value": "0x0500", "unit": "discrete",
+                                     "states": [0, 2]}]
+
+        output = json.loads(ch_json.handle_command("sel get 0x16").
+                            getvalue())
+        events = output["result"][0]["events"]
+        assert len(events) == 7
+        assert events[4] == {"id": 4, "description":
+                             "LAN Leash Lost (system is unplugged from LAN)"}
+
+        output = json.loads(ch_json.handle_command("unknown").getvalue())
+        assert output == {"result": None, "output": "illegal command\n"}
+
+        # each command of a pipeline answers a line of its own
+        lines = ch_json.handle_command("sensor value get 0x16; unknown").\
+            getvalue().splitlines()
+        assert lines[0] == "=== [1] sensor value get 0x16"
+        assert json.loads(lines[1])["result"][0]["states"] == [0, 2]
+        assert json.loads(lines[3])["output"] == "illegal command\n"
+
+        # other sessions stay in text format
+        assert ch.handle_command("sensor value get 0x16").getvalue() == \
+            "json_discrete : 0x0500\n"
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from infrasim.ipmicons import engine
+from infrasim.ipmicons.common import IPMI_SIM_Batch
+from infrasim.ipmicons.sensor import Sensor
+
+
+def build_threshold_sensor(ID, value, lnc=0x10, unc=0x20, interval=1):
+    sensor_obj = Sensor("auto_sample_{0}".format(ID), ID, value, 0x01)
+    sensor_obj.set_event_type(0x01)
+    sensor_obj.set_mc(0x20)
+    sensor_obj.set_lun(0x00)
+    sensor_obj.set_su1(0x00)
+    # lnc and unc readable
+    sensor_obj.set_rtm(0x09)
+    sensor_obj.set_lnc(lnc)
+    sensor_obj.set_unc(unc)
+    sensor_obj.set_interval(interval)
+    return sensor_obj
+
+
+class test_ipmi_console_engine(unittest.TestCase):
+
+    def setUp(self):
+        self.numpy = engine.numpy
+
+    def tearDown(self):
+        engine.numpy = self.numpy
+
+    def check_tick(self):
+        auto_engine = engine.Auto_Engine()
+        sensors = [build_threshold_sensor(i, 0x00, interval=i)
+                   for i in range(1, 65)]
+        for sensor_obj in sensors:
+            auto_engine.add(sensor_obj)
+        now = max(auto_engine.due)
+
+        batch = IPMI_SIM_Batch()
+        delay = auto_engine.tick(now, batch)
+        # every reading is off 0x00, so all are written
+        assert len(batch) == 64
+        for sensor_obj in sensors:
+            assert 0x11 <= sensor_obj.get_value() <= 0x1f
+        assert abs(delay - 1) < 0.1
+
+        # only the sensor with 1 second interval is due again
+        batch = IPMI_SIM_Batch()
+        auto_engine.tick(now + 1, batch)
+        assert len(batch) <= 1
+
+        # readings equal to the last one sent are skipped
+        sensors[0].set_lnc(0x29)
+        sensors[0].set_unc(0x2b)
+        auto_engine.refresh(sensors[0])
+        batch = IPMI_SIM_Batch()
+        auto_engine.tick(now + 2, batch)
+        auto_engine.tick(now + 3, batch)
+        commands = [c for c in batch.commands
+                    if c.startswith("sensor_set_value 0x20 0x0 0x1 ")]
+        assert commands == ["sensor_set_value 0x20 0x0 0x1 0x2a 0x1\n"]
+
+    def test_tick(self):
+        if engine.numpy is None:
+            raise unittest.SkipTest("numpy is not installed")
+        self.check_tick()
+
+    def test_tick_without_numpy(self):
+        engine.numpy = None
+        self.check_tick()
+
+    def test_remove(self):
+        engine.numpy = None
+        auto_engine = engine.Auto_Engine()
+        sensors = [build_threshold_sensor(i, 0x00) for i in range(1, 4)]
+        for sensor_obj in sensors:
+            auto_engine.add(sensor_obj)
+        sensors[2].set_unc(0x30)
+        auto_engine.refresh(sensors[2])
+
+        auto_engine.remove(sensors[0])
+        assert len(auto_engine) == 2
+        assert sensors[0] not in auto_engine
+        # the last slot moved into the hole
+        assert auto_engine.slots[sensors[2]] == 0
+        assert auto_engine.high[0] == 0x2f
+        auto_engine.remove(sensors[0])
+        assert len(auto_engine) == 2
+
+    def test_sensor_mode(self):
+        sensor_obj = build_threshold_sensor(0x70, 0x00)
+        sensor_obj.set_mode("auto")
+        assert sensor_obj in engine.auto_engine
+        sensor_obj.set_mode("user")
+        assert sensor_obj not in engine.auto_engine
+
+    def test_submit_outside_lock(self):
+        engine.numpy = None
+        auto_engine = engine.Auto_Engine()
+        auto_engine.add(build_threshold_sensor(0x71, 0x00))
+        submitted = []
+
+        class checked_batch(IPMI_SIM_Batch):
+            def submit(self, background=False):
+                # sensors can still be added while ipmi_sim answers
+                assert auto_engine.lock.acquire(False)
+                auto_engine.lock.release()
+                submitted.append(len(self))
+                return [None] * len(self)
+
+        batch_class = engine.IPMI_SIM_Batch
+        engine.IPMI_SIM_Batch = checked_batch
+        try:
+            auto_engine.update()
+        finally:
+            engine.IPMI_SIM_Batch = batch_class
+        assert submitted == [1]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from infrasim.ipmicons import common, flood, sdr, sel
+from infrasim.ipmicons.command import Command_Handler
+from test_ipmi_sim_connection import fake_ipmi_sim
+
+
+class test_ipmi_console_flood(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fake_ipmi_sim()
+        self.server.start()
+        self.pool = common.ipmi_sim_pool
+        common.ipmi_sim_pool = common.IPMI_SIM_Pool(port=self.server.port,
+                                                    timeout=2)
+        self.capacity = dict(sel.sel_capacity)
+        sel.sel_capacity.clear()
+        self.sensor_obj = sdr.build_sensors(name="flood_sample",
+                                            ID=0x74,
+                                            mc=0x20,
+                                            value="0x0000",
+                                            tp=0x05,
+                                            event_type=0x6f)
+        self.sensor_obj.initialize_sel()
+
+    def tearDown(self):
+        flood.stop_flood()
+        common.ipmi_sim_pool.close()
+        common.ipmi_sim_pool = self.pool
+        sel.sel_capacity.update(self.capacity)
+        self.server.sock.close()
+
+    def test_build_sensor_events(self):
+        events = flood.build_sensor_events([self.sensor_obj])
+        # physical security has events 0 - 6
+        assert len(events) == 7
+        template, event_dir, event_data = events[4]
+        assert template is self.sensor_obj.get_sel_template()
+        assert (event_dir, event_data) == (0, (0x04, 0x00, 0x00))
+        assert template.encode(event_dir, event_data) == \
+            "sel_add 0x20 0x2 0x0 0x0 0x0 0x0 0x20 0x0 0x4 " \
+            "0x5 0x74 0x6f 0x4 0x0 0x0"
+
+    def test_paced_flood(self):
+        events = flood.build_sensor_events([self.sensor_obj])
+        sel_flood = flood.SEL_Flood(events, 40, 200)
+        start = time.time()
+        sel_flood.start()
+        sel_flood.join()
+        elapsed = time.time() - start
+        status = sel_flood.get_status()
+        assert status["state"] == "done"
+        assert status["sent"] == status["accepted"] == 40
+        assert 0.15 < elapsed < 0.5
+        assert 150 < status["rate"] < 250
+        assert len([l for l in self.server.lines
+                    if l.startswith("sel_add 0x20 0x2 ")]) == 40
+
+    def test_overflow(self):
+        events = flood.build_sensor_events([self.sensor_obj])
+        sel_flood = flood.SEL_Flood(events, 20, 10000, capacity=10,
+                                    entries=2)
+        sel_flood.start()
+        sel_flood.join()
+        status = sel_flood.get_status()
+        assert status["sent"] == 8
+        assert status["dropped"] == 12
+        assert status["entries"] == 10
+        assert status["overflow"] is True
+        # SEL almost full at 75%, SEL full in the last entry
+        log_events = [l.split()[-3] for l in self.server.lines
+                      if l.split()[10] == "0x10"]
+        assert log_events == ["0x5", "0x4"]
+        assert self.server.lines[-1].split()[-3] == "0x4"
+
+    def test_flood_command(self):
+        ch = Command_Handler()
+        output = ch.handle_command("sel flood 10 1000 template 0x74 2").\
+            getvalue()
+        assert output.startswith("SEL flood running: ")
+        output = ch.handle_command("sel flood 10 1000 template 0x74 2").\
+            getvalue()
+        assert output == "A SEL flood is running already\n"
+        flood.sel_flood.join()
+        output = ch.handle_command("sel flood status").getvalue()
+        assert output.startswith("SEL flood done: sent 10/10, rejected 0, "
+                                 "dropped 0, rate ")
+        output = ch.handle_command("sel flood 10 1000 template 0x74 99").\
+            getvalue()
+        assert output == "sensor 0x74 has no event 99\n"
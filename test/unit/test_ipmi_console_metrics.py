@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from infrasim.ipmicons import common
+from infrasim.ipmicons.command import Command_Handler
+from infrasim.ipmicons.metrics import Histogram, metrics
+from test_ipmi_sim_connection import fake_ipmi_sim
+
+
+class test_ipmi_console_metrics(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fake_ipmi_sim()
+        self.server.start()
+        self.pool = common.ipmi_sim_pool
+        common.ipmi_sim_pool = common.IPMI_SIM_Pool(size=1, reserved=0,
+                                                    port=self.server.port,
+                                                    timeout=2)
+        self.tmp_dir = tempfile.mkdtemp()
+        metrics.reset()
+
+    def tearDown(self):
+        common.ipmi_sim_pool.close()
+        common.ipmi_sim_pool = self.pool
+        self.server.sock.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for i in range(0, 98):
+            histogram.record(0.0003)
+        histogram.record(0.03)
+        histogram.record(7.0)
+        stats = histogram.get_stats()
+        assert stats["count"] == 100
+        assert stats["p50"] == 0.0005
+        assert stats["p99"] == 0.05
+        assert stats["max"] == 7.0
+        assert stats["buckets"][2] == [0.0005, 98]
+        assert stats["buckets"][-1] == [None, 1]
+        assert Histogram().get_percentile(0.5) == 0.0
+
+    def test_command_metrics(self):
+        common.send_ipmi_sim_command("sensor_set_value 0x20 0x0 0x1 0x1 0x1")
+        common.send_ipmi_sim_command("bad_command")
+        common.send_ipmi_sim_commands(["sel_add 0x20 0x2", "bad_too",
+                                       "sel_add 0x20 0x2"])
+        stats = metrics.get_stats()
+        commands = stats["commands"]
+        assert commands["sensor_set_value"]["count"] == 1
+        assert commands["sensor_set_value"]["errors"] == 0
+        assert commands["bad_command"]["error_rate"] == 1.0
+        assert commands["sel_add"]["count"] == 2
+        assert commands["bad_too"]["errors"] == 1
+        assert stats["lock_wait"]["ipmi_sim session"]["count"] == 3
+        # the batch is done, only its peak is kept
+        assert stats["queues"]["ipmi_sim batch"] == {"depth": 0, "max": 3}
+
+    def test_session_waiters(self):
+        # one session, so the second slow command has to wait for it
+        threads = [threading.Thread(target=common.send_ipmi_sim_command,
+                                    args=("slow",)) for i in range(0, 2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = metrics.get_stats()
+        assert stats["queues"]["ipmi_sim session waiters"] == \
+            {"depth": 0, "max": 1}
+        assert stats["lock_wait"]["ipmi_sim session"]["max"] > 0.2
+
+    def test_stats_command(self):
+        ch = Command_Handler()
+        common.send_ipmi_sim_command("sensor_set_value 0x20 0x0 0x1 0x1 0x1")
+        ch.handle_command("help")
+        output = ch.handle_command("stats").getvalue()
+        lines = output.splitlines()
+        assert lines[0].startswith("command ")
+        assert [l for l in lines if l.startswith("sensor_set_value ")]
+        assert [l for l in lines if l.startswith("console help ")]
+        assert [l for l in lines if l.startswith("ipmi_sim session ")]
+
+        path = os.path.join(self.tmp_dir, "stats.json")
+        output = ch.handle_command("stats dump " + path).getvalue()
+        assert output == "stats written to {0}\n".format(path)
+        with open(path) as fd:
+            stats = json.load(fd)
+        assert stats["commands"]["sensor_set_value"]["count"] == 1
+        assert stats["commands"]["console stats"]["count"] == 1
+
+        output = ch.handle_command("stats dump /nonexistent/stats.json").\
+            getvalue()
+        assert output.startswith("fail to write /nonexistent/stats.json")
+
+        ch.handle_command("stats reset")
+        # only the reset itself is left
+        assert metrics.get_stats()["commands"].keys() == ["console stats"]
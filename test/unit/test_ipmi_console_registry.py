@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from infrasim.ipmicons.registry import Sensor_Registry, parse_query
+from infrasim.ipmicons.sensor import Sensor
+
+
+def build_sensor(name, ID, tp, event_type=0x01, mc=0x20, lun=0x00,
+                 entity=(0x07, 0x01)):
+    sensor_obj = Sensor(name, ID, 0x00, tp)
+    sensor_obj.set_mc(mc)
+    sensor_obj.set_lun(lun)
+    sensor_obj.set_event_type(event_type)
+    sensor_obj.set_entity(*entity)
+    return sensor_obj
+
+
+class test_ipmi_console_registry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Sensor_Registry()
+        self.fan1 = build_sensor("Fan1 RPM", 0x30, 0x04,
+                                 entity=(0x1d, 0x01))
+        self.fan2 = build_sensor("Fan2 RPM", 0x31, 0x04,
+                                 entity=(0x1d, 0x02))
+        self.psu1 = build_sensor("PSU1 Status", 0x50, 0x08,
+                                 event_type=0x6f, entity=(0x0a, 0x01))
+        self.psu2 = build_sensor("PSU2 Status", 0x51, 0x08,
+                                 event_type=0x6f, entity=(0x0a, 0x02))
+        self.remote = build_sensor("Fan1 RPM", 0x30, 0x04, mc=0x2c, lun=0x01)
+        self.registry.rebuild([self.psu2, self.fan2, self.fan1, self.psu1,
+                               self.remote])
+
+    def test_get(self):
+        assert self.registry.get(0x30) is self.fan1
+        assert self.registry.get(0x30, mc=0x2c) is self.remote
+        assert self.registry.get(0x30, mc=0x2c, lun=0x00) is None
+        assert self.registry.get(0x40) is None
+        assert self.registry.get_by_name("PSU1 Status") is self.psu1
+
+    def test_query(self):
+        assert self.registry.query("type=fan") == [self.fan1, self.fan2,
+                                                   self.remote]
+        assert self.registry.query("type=0x08") == [self.psu1, self.psu2]
+        assert self.registry.query("name=PSU*") == [self.psu1, self.psu2]
+        assert self.registry.query("name=fan1 rpm&mc=0x20") == [self.fan1]
+        assert self.registry.query("entity=0x1d") == [self.fan1, self.fan2]
+        assert self.registry.query("entity=10.2") == [self.psu2]
+        assert self.registry.query("event=discrete") == [self.psu1,
+                                                         self.psu2]
+        assert self.registry.query("id=30&lun=1") == [self.remote]
+        assert self.registry.query("type=fan&name=PSU*") == []
+
+    def test_illegal_query(self):
+        for query in ["fan", "color=red", "name="]:
+            self.assertRaises(ValueError, parse_query, query)
+
+    def test_rebuild_keeps_snapshot(self):
+        index = self.registry.index
+        old = self.registry.rebuild([self.fan1])
+        assert len(old) == 5
+        assert len(self.registry) == 1
+        # a query running on the old index still sees all sensors
+        assert len(index.query({"type": "fan"})) == 3
+
+    def test_add_replaces_same_id(self):
+        fan1 = build_sensor("Fan1 RPM", 0x30, 0x04)
+        index = self.registry.index
+        self.registry.add(fan1)
+        assert self.registry.get(0x30) is fan1
+        assert self.registry.query("type=fan") == [fan1, self.fan2,
+                                                   self.remote]
+        assert index.by_id[(0x20, 0x00, 0x30)] is self.fan1
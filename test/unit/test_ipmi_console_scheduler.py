@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from infrasim.ipmicons.scheduler import Sensor_Scheduler
+
+
+class fake_sensor:
+    def __init__(self, name, interval=0.01, steps=None):
+        self.name = name
+        self.interval = interval
+        self.steps = steps
+        self.count = 0
+        self.updated = threading.Event()
+
+    def get_name(self):
+        return self.name
+
+    def update(self):
+        self.count += 1
+        self.updated.set()
+        if self.steps is not None and self.count >= self.steps:
+            return None
+        return self.interval
+
+
+class test_ipmi_console_scheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Sensor_Scheduler()
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_sensor_updated_periodically(self):
+        sensor_obj = fake_sensor("Fan1", interval=0.01)
+        self.scheduler.schedule(sensor_obj)
+        time.sleep(0.2)
+        self.scheduler.cancel(sensor_obj)
+        assert sensor_obj.count >= 5
+
+    def test_sensor_with_own_interval(self):
+        fast = fake_sensor("Fan1", interval=0.01)
+        slow = fake_sensor("Fan2", interval=10)
+        self.scheduler.schedule(fast)
+        self.scheduler.schedule(slow)
+        time.sleep(0.2)
+        assert fast.count >= 5
+        assert slow.count == 1
+
+    def test_one_shot_update(self):
+        sensor_obj = fake_sensor("Temp1", steps=1)
+        self.scheduler.schedule(sensor_obj)
+        assert sensor_obj.updated.wait(1)
+        time.sleep(0.1)
+        assert sensor_obj.count == 1
+        assert not self.scheduler.is_scheduled(sensor_obj)
+
+    def test_cancel_stops_update(self):
+        sensor_obj = fake_sensor("Fan1", interval=0.05)
+        self.scheduler.schedule(sensor_obj, delay=0.1)
+        self.scheduler.cancel(sensor_obj)
+        time.sleep(0.3)
+        assert sensor_obj.count == 0
+
+    def test_reschedule_replaces_pending_update(self):
+        sensor_obj = fake_sensor("Fan1", interval=10)
+        self.scheduler.schedule(sensor_obj)
+        assert sensor_obj.updated.wait(1)
+        sensor_obj.updated.clear()
+        self.scheduler.schedule(sensor_obj)
+        assert sensor_obj.updated.wait(1)
+        assert sensor_obj.count == 2
+
+    def test_stop_is_fast(self):
+        for i in range(200):
+            self.scheduler.schedule(fake_sensor("Fan{}".format(i),
+                                                interval=5))
+        time.sleep(0.1)
+        start = time.time()
+        self.scheduler.stop()
+        assert time.time() - start < 0.5
+        assert not self.scheduler.is_alive()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from infrasim.ipmicons import sdr
+from infrasim.ipmicons.registry import sensor_registry
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "..", "..", "data")
+
+EMU_SAMPLE = """
+mc_setbmc 0x20
+mc_add 0x20 32 no-device-sdrs 0x1 2 30 0xdf 0x2a2 0x100 dynsens
+
+# Add sensor 48(Fan1 RPM)
+sensor_add 0x20 0x0 0x30 0x04 0x01
+main_sdr_add 0x20 \\
+0x0e 0x00 0x51 0x01 0x33 \\
+0x20 0x00 0x30 0x07 0x01 0x7f 0xd4 0x04 0x01 0x05 0x30 0x05 0x00 0x03 0x00 0x00 \\
+0x12 0x00 0x00 0x78 0x02 0x00 0x02 0x30 0x00 0x07 0x54 0xc5 0x8b 0xff 0x00 0xff \\
+0xff 0xff 0x00 0x03 0x05 0x01 0x01 0x00 0x00 0x00 0xc8 0x46 0x61 0x6e 0x31 0x20 \\
+0x52 0x50 0x4d 
+sensor_set_value 0x20 0x0 0x30 0x28 0x1
+sensor_set_threshold 0x20 0x0 0x30 readable 000011 0x00 0x00 0x00 0x00 0x04 0x06
+
+# Add sensor 115(Intrusion)
+sensor_add 0x20 0x0 0x73 0x05 0x6f
+main_sdr_add 0x20 \\
+0x02 0x00 0x51 0x02 0x24 \\
+0x20 0x00 0x73 0x07 0x01 0x67 0xc0 0x05 0x6f 0x01 0x00 0x01 0x00 0x01 0x00 0xc0 \\
+0x00 0x00 0x01 0x00 0x00 0x00 0x00 0x00 0x00 0x00 0xc9 0x49 0x6e 0x74 0x72 0x75 \\
+0x73 0x69 0x6f 0x6e 
+sensor_set_value 0x20 0x0 0x73 0x00 0x1
+sensor_set_bit 0x20 0x0 0x73 0 1 1
+sensor_set_bit 0x20 0x0 0x73 9 1 1
+sensor_set_bit 0x20 0x0 0x73 1 1 1
+sensor_set_bit 0x20 0x0 0x73 1 0 1
+
+main_sdr_add 0x20 \\
+0x03 0x00 0x51 0x12 0x11 \\
+0x20 0x00 0x00 0xdf 0x00 0x00 0x00 0x07 0x01 0x00 0xc6 0x69 0x44 0x52 0x41 0x43 \\
+0x38 
+"""
+
+
+class test_ipmi_console_sdr(unittest.TestCase):
+
+    def setUp(self):
+        sensor_registry.clear()
+        fd, self.emu_file = tempfile.mkstemp(suffix=".emu")
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(EMU_SAMPLE)
+
+    def tearDown(self):
+        os.remove(self.emu_file)
+
+    def test_parse_emu_threshold_sensor(self):
+        sdr.parse_sdrs(self.emu_file)
+        assert len(sensor_registry) == 2
+        fan = sensor_registry.get(0x30, 0x20)
+        assert fan.get_name() == "Fan1 RPM"
+        assert fan.get_event_type() == "threshold"
+        assert fan.get_value() == 0x28
+        assert fan.get_unit() == "RPM"
+        # live threshold levels from sensor_set_threshold
+        assert fan.get_lc() == 0x04
+        assert fan.get_lnc() == 0x06
+        # threshold levels not enabled there are kept from the SDR
+        assert fan.get_unr() == 0xff
+        assert "4800.000" in fan.output_info()
+
+    def test_parse_emu_discrete_sensor(self):
+        sdr.parse_sdrs(self.emu_file)
+        intrusion = sensor_registry.get(0x73, 0x20)
+        assert intrusion.get_name() == "Intrusion"
+        assert intrusion.get_event_type() == "discrete"
+        # state 0 and 9 asserted, state 1 set then cleared
+        assert intrusion.get_value() == "0x0102"
+
+    def test_parse_shipped_emu_files(self):
+        for node_type in ["quanta_d51", "dell_r730xd", "s2600wtt"]:
+            emu_file = os.path.join(DATA_DIR, node_type,
+                                    "{}.emu".format(node_type))
+            sdr.parse_sdrs(emu_file)
+            with open(emu_file, 'r') as fp:
+                sensor_count = len([l for l in fp
+                                    if l.startswith("sensor_add ")])
+            assert len(sensor_registry) <= sensor_count
+            assert len(sensor_registry) > sensor_count * 0.8
+
+    def test_rebuild_replaces_sensors(self):
+        sdr.parse_sdrs(self.emu_file)
+        fan = sensor_registry.get(0x30, 0x20)
+        assert sensor_registry.query("type=fan") == [fan]
+        assert sensor_registry.query("entity=7.1&event=threshold") == [fan]
+        sdr.parse_sdrs(self.emu_file)
+        assert len(sensor_registry) == 2
+        assert sensor_registry.get(0x30, 0x20) is not fan
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from infrasim.ipmicons import sdr_decoder
+
+
+def to_bytes(text):
+    return bytearray([int(x, 16) for x in text.split()])
+
+# Fan1 RPM, full sensor record
+FULL_SDR = to_bytes("""
+0x0e 0x00 0x51 0x01 0x33
+0x20 0x00 0x30 0x07 0x01 0x7f 0xd4 0x04 0x01 0x05 0x30 0x05 0x00 0x03 0x00 0x00
+0x12 0x00 0x00 0x78 0x02 0x00 0x02 0x30 0x00 0x07 0x54 0xc5 0x8b 0xff 0x00 0xff
+0xff 0xff 0x00 0x03 0x05 0x01 0x01 0x00 0x00 0x00 0xc8 0x46 0x61 0x6e 0x31 0x20
+0x52 0x50 0x4d
+""")
+
+# Intrusion, compact sensor record
+COMPACT_SDR = to_bytes("""
+0x02 0x00 0x51 0x02 0x24
+0x20 0x00 0x73 0x07 0x01 0x67 0xc0 0x05 0x6f 0x01 0x00 0x01 0x00 0x01 0x00 0xc0
+0x00 0x00 0x01 0x00 0x00 0x00 0x00 0x00 0x00 0x00 0xc9 0x49 0x6e 0x74 0x72 0x75
+0x73 0x69 0x6f 0x6e
+""")
+
+# PSU Event, event-only record
+EVENT_ONLY_SDR = to_bytes("""
+0x04 0x00 0x51 0x03 0x15
+0x20 0x00 0x90 0x0a 0x01 0x08 0x6f 0x00 0x00 0x00 0x00 0xc9
+0x50 0x53 0x55 0x20 0x45 0x76 0x65 0x6e 0x74
+""")
+
+# FRU locator of device 1
+FRU_LOCATOR_SDR = to_bytes("""
+0x05 0x00 0x51 0x11 0x0e
+0x20 0x01 0x80 0x00 0x00 0x10 0x00 0x0a 0x01 0x00 0xc3
+0x50 0x53 0x31
+""")
+
+# iDRAC8, MC device locator record
+MC_LOCATOR_SDR = to_bytes("""
+0x03 0x00 0x51 0x12 0x11
+0x20 0x00 0x00 0xdf 0x00 0x00 0x00 0x07 0x01 0x00 0xc6 0x69 0x44 0x52 0x41 0x43
+0x38
+""")
+
+
+class test_ipmi_console_sdr_decoder(unittest.TestCase):
+
+    def test_decode_full_sensor_record(self):
+        records = list(sdr_decoder.decode_records(FULL_SDR))
+        assert len(records) == 1
+        record = records[0]
+        assert isinstance(record, sdr_decoder.Full_Sensor_Record)
+        assert record.record_id == 0x0e
+        assert record.name == "Fan1 RPM"
+        assert record.get_mc() == 0x20
+        assert record.get_num() == 0x30
+        assert record.sensor_type == 0x04
+        assert record.event_type == 0x01
+        assert record.rtm == 0x03
+        assert record.su2 == 0x12
+        assert record.m_lb == 0x78
+        assert record.lc == 0x03
+        assert record.lnc == 0x05
+
+    def test_decode_all_record_types(self):
+        data = FULL_SDR + COMPACT_SDR + EVENT_ONLY_SDR + \
+            FRU_LOCATOR_SDR + MC_LOCATOR_SDR
+        records = list(sdr_decoder.decode_records(data))
+        assert [r.record_type for r in records] == \
+            [0x01, 0x02, 0x03, 0x11, 0x12]
+        assert [r.name for r in records] == \
+            ["Fan1 RPM", "Intrusion", "PSU Event", "PS1", "iDRAC8"]
+
+        compact = records[1]
+        assert isinstance(compact, sdr_decoder.Compact_Sensor_Record)
+        assert compact.event_type == 0x6f
+
+        event_only = records[2]
+        assert event_only.sensor_num == 0x90
+        assert event_only.sensor_type == 0x08
+
+        fru = records[3]
+        assert fru.fru_device_id == 0x01
+        assert fru.entity_id == 0x0a
+
+        mc = records[4]
+        assert mc.slave_address == 0x20
+        assert mc.device_cap == 0xdf
+
+    def test_decode_broken_records(self):
+        # unknown type, too short for its type and truncated tail
+        data = to_bytes("0x10 0x00 0x51 0xc0 0x02 0x57 0x01") + \
+            to_bytes("0x11 0x00 0x51 0x01 0x03 0x20 0x00 0x30") + \
+            FULL_SDR[:20]
+        records = list(sdr_decoder.decode_records(data))
+        assert len(records) == 2
+        assert records[0].record_type == 0xc0
+        assert records[1].record_type == 0x01
+        assert not isinstance(records[1], sdr_decoder.Full_Sensor_Record)
+
+    def test_load_sdr_file(self):
+        fd, sdr_file = tempfile.mkstemp(suffix=".sdr")
+        try:
+            os.write(fd, bytes(FULL_SDR + MC_LOCATOR_SDR))
+            os.close(fd)
+            records = sdr_decoder.load_sdr_file(sdr_file)
+            assert [r.name for r in records] == ["Fan1 RPM", "iDRAC8"]
+
+            open(sdr_file, 'w').close()
+            assert sdr_decoder.load_sdr_file(sdr_file) == []
+        finally:
+            os.remove(sdr_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
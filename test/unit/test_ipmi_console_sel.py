@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from infrasim.ipmicons import common, sel
+from infrasim.ipmicons.command import Command_Handler
+from test_ipmi_sim_connection import fake_ipmi_sim
+
+
+def build_sel():
+    sel_obj = sel.SEL()
+    sel_obj.set_mc(0x20)
+    sel_obj.set_gid_1(0x20)
+    sel_obj.set_sensor_type(0x05)
+    sel_obj.set_sensor_num(0x74)
+    sel_obj.set_event_type(0x6f)
+    sel_obj.set_event_data(4)
+    return sel_obj
+
+
+def concat_encode(sel_obj):
+    # how sel_add lines were built before the encoder
+    return 'sel_add ' + hex(sel_obj.mc) + ' ' + \
+        hex(sel_obj.record_type) + ' ' + \
+        hex(sel_obj.ts_1) + ' ' + hex(sel_obj.ts_2) + ' ' + \
+        hex(sel_obj.ts_3) + ' ' + hex(sel_obj.ts_4) + ' ' + \
+        hex(sel_obj.gid_1) + ' ' + hex(sel_obj.gid_2) + ' ' + \
+        hex(sel_obj.evm_rev) + ' ' + hex(sel_obj.sensor_type) + ' ' + \
+        hex(sel_obj.sensor_num) + ' ' + \
+        hex((sel_obj.event_dir << 7) | sel_obj.event_type) + ' ' + \
+        hex(sel_obj.event_data_1) + ' ' + hex(sel_obj.event_data_2) + \
+        ' ' + hex(sel_obj.event_data_3)
+
+
+class test_ipmi_console_sel(unittest.TestCase):
+
+    def test_pack_standard_record(self):
+        record = build_sel().pack()
+        assert len(record) == sel.SEL_RECORD_LENGTH
+        assert list(record) == [0x00, 0x00, 0x02, 0x00, 0x00, 0x00, 0x00,
+                                0x20, 0x00, 0x04, 0x05, 0x74, 0x6f,
+                                0x04, 0x00, 0x00]
+
+    def test_template_patches_event(self):
+        sel_obj = build_sel()
+        template = sel_obj.get_template()
+        sel_obj.set_event_dir(1)
+        sel_obj.set_event_data(6)
+        assert template.encode(1, sel_obj.get_event_data()) == \
+            concat_encode(sel_obj)
+        assert template.pack(1, sel_obj.get_event_data()) == sel_obj.pack()
+        # the template itself does not change
+        assert template.encode(0, (4, 0, 0)) == \
+            concat_encode(build_sel())
+
+    def test_template_timestamp(self):
+        template = build_sel().get_template()
+        record = template.pack(timestamp=0x12345678)
+        assert list(record[3:7]) == [0x78, 0x56, 0x34, 0x12]
+        assert template.encode(0, (4, 0, 0), 0x12345678).\
+            startswith("sel_add 0x20 0x2 0x78 0x56 0x34 0x12 0x20 ")
+
+    def test_encode_events(self):
+        template = build_sel().get_template()
+        lines = sel.encode_events([(template, 0, (1, 0, 0)),
+                                   (template, 1, (2, 0, 0))])
+        assert lines == [template.head + " 0x6f 0x1 0x0 0x0",
+                         template.head + " 0xef 0x2 0x0 0x0"]
+
+    def test_pack_oem_records(self):
+        oem = sel.OEM_SEL_C0_DF()
+        oem.set_record_type(0xc1)
+        oem.set_mfg_id(0x001c4c)
+        oem.set_oem_defined_bytes([1, 2, 3])
+        assert list(oem.pack()) == [0, 0, 0xc1, 0, 0, 0, 0, 0x4c, 0x1c, 0,
+                                    1, 2, 3, 0, 0, 0]
+        oem = sel.OEM_SEL_E0_FF()
+        oem.set_record_type(0xe0)
+        oem.set_oem_defined_bytes(range(1, 14))
+        assert list(oem.pack()) == [0, 0, 0xe0] + range(1, 14)
+
+    def test_oem_sel_command(self):
+        server = fake_ipmi_sim()
+        server.start()
+        pool = common.ipmi_sim_pool
+        common.ipmi_sim_pool = common.IPMI_SIM_Pool(port=server.port,
+                                                    timeout=2)
+        try:
+            ch = Command_Handler()
+            ch.handle_command("sel set oem 0xc0 1 2 3 4 5 6")
+            ch.handle_command("sel set oem 0xe1 1 2 3 4 5 6 7 8 9 a b c d")
+            ch.handle_command("sel set oem 0x02 0x20 0 0x05 0x74 0x6f 4 0 0")
+        finally:
+            common.ipmi_sim_pool.close()
+            common.ipmi_sim_pool = pool
+            server.sock.close()
+        assert server.lines == [
+            "sel_add 0x20 0xc0 0x0 0x0 0x0 0x0 0x0 0x0 0x0 "
+            "0x1 0x2 0x3 0x4 0x5 0x6",
+            "sel_add 0x20 0xe1 0x1 0x2 0x3 0x4 0x5 0x6 0x7 0x8 0x9 "
+            "0xa 0xb 0xc 0xd",
+            concat_encode(build_sel())]
+
+    def test_oem_encoder(self):
+        for oem in (sel.OEM_SEL_C0_DF(), sel.OEM_SEL_E0_FF()):
+            oem.set_oem_defined_bytes(range(1, 14))
+            record = oem.pack()
+            line = sel.encode_record(0x20, record)
+            assert len(line.split()) == 16
+            oem_template = sel.SEL_Template(0x20, record)
+            assert oem_template.encode() == line
+
+    def test_oem_byte_out_of_range(self):
+        response = Command_Handler().handle_command(
+            "sel set oem 0xc0 0x1 0x2 0x3 0x4 0x5 0x100")
+        assert "illegal sel byte: 0x100" in response.getvalue()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from infrasim.ipmicons.common import IPMI_SIM_Batch
+from infrasim.ipmicons.sensor import Sensor, changed_states, \
+    parse_discrete_value, format_discrete_value
+
+
+def build_threshold_sensor(value, m_lb, b_lb=0x00, exp=0x00, su1=0x00):
+    sensor_obj = Sensor("analog_sample", 0x11, value, 0x01)
+    sensor_obj.set_event_type(0x01)
+    sensor_obj.set_su1(su1)
+    sensor_obj.set_m_lb(m_lb)
+    sensor_obj.set_m_ub(0x00)
+    sensor_obj.set_b_lb(b_lb)
+    sensor_obj.set_b_ub(0x00)
+    sensor_obj.set_exp(exp)
+    return sensor_obj
+
+
+def write(sensor_obj, value, throttle=False, result=""):
+    """
+    Write value through a batch answered with result, return the count
+    of commands sent
+    """
+    batch = IPMI_SIM_Batch()
+    sensor_obj.set_threshold_value(value, batch=batch, throttle=throttle)
+    for callback in batch.callbacks:
+        callback(result)
+    return len(batch)
+
+
+class test_ipmi_console_sensor(unittest.TestCase):
+
+    def test_unsigned_conversion(self):
+        # M = 88, RPM fan
+        sensor_obj = build_threshold_sensor(0x63, 0x58)
+        assert sensor_obj.get_analog_value(0x63) == 8712
+        assert sensor_obj.get_analog_value(0xff) == 22440
+        assert sensor_obj.get_raw_value(8712) == 0x63
+        # nearest raw reading
+        assert sensor_obj.get_raw_value(8750) == 0x63
+        assert sensor_obj.get_raw_value(8790) == 0x64
+        # out of range values stick to the ends
+        assert sensor_obj.get_raw_value(-100) == 0x00
+        assert sensor_obj.get_raw_value(100000) == 0xff
+
+    def test_exponent_conversion(self):
+        # M = 1, B = 2, B exp = 1, R exp = -2: (x + 20) / 100
+        sensor_obj = build_threshold_sensor(0x00, 0x01, b_lb=0x02, exp=0xe1)
+        assert abs(sensor_obj.get_analog_value(0x50) - 1.0) < 1e-9
+        assert sensor_obj.get_raw_value(1.0) == 0x50
+        assert sensor_obj.get_raw_value(1.004) == 0x50
+
+    def test_twos_complement_conversion(self):
+        sensor_obj = build_threshold_sensor(0xc5, 0x01, su1=0x80)
+        assert sensor_obj.get_analog_value(0xc5) == -59
+        assert sensor_obj.get_analog_value(-59) == -59
+        assert sensor_obj.get_analog_value(0x7f) == 127
+        assert sensor_obj.get_analog_value(0x80) == -128
+        assert sensor_obj.get_raw_value(-59) == 0xc5
+        assert sensor_obj.get_raw_value(-500) == 0x80
+
+    def test_ones_complement_conversion(self):
+        sensor_obj = build_threshold_sensor(0x00, 0x01, su1=0x40)
+        assert sensor_obj.get_analog_value(0x80) == -127
+        assert sensor_obj.get_analog_value(0xfe) == -1
+        assert sensor_obj.get_analog_value(0xff) == 0
+        assert sensor_obj.get_raw_value(-1) == 0xfe
+        assert sensor_obj.get_raw_value(0) == 0x00
+
+    def test_table_rebuilt_on_factor_change(self):
+        sensor_obj = build_threshold_sensor(0x10, 0x02)
+        assert sensor_obj.get_analog_value(0x10) == 32
+        table = sensor_obj.analog_table
+        sensor_obj.get_analog_value(0x20)
+        assert sensor_obj.analog_table is table
+
+        sensor_obj.set_m_lb(0x03)
+        assert sensor_obj.get_analog_value(0x10) == 48
+        sensor_obj.set_su1(0x80)
+        assert sensor_obj.get_analog_value(0xf0) == -48
+
+    def test_output_info(self):
+        sensor_obj = build_threshold_sensor(0x63, 0x58)
+        sensor_obj.set_su2(18)
+        sensor_obj.set_rtm(0x09)
+        sensor_obj.set_lnc(0x05)
+        sensor_obj.set_unc(0xf0)
+        fields = [f.strip() for f in sensor_obj.output_info().split('|')]
+        assert fields[2] == "8712.000"
+        assert fields[3] == "RPM"
+        assert fields[6] == "440.000"
+        assert fields[7] == "21120.000"
+
+    def test_unchanged_value_suppressed(self):
+        sensor_obj = build_threshold_sensor(0x00, 0x01)
+        sensor_obj.set_mc(0x20)
+        sensor_obj.set_lun(0x00)
+        sensor_obj.set_rtm(0x00)
+        assert write(sensor_obj, 0x10) == 1
+        assert write(sensor_obj, 0x10) == 0
+        assert sensor_obj.get_suppressed() == 1
+        # not taken by ipmi_sim, so sent again
+        assert write(sensor_obj, 0x11, result="**Invalid sensor") == 1
+        # the value ipmi_sim did not take is not shown
+        assert sensor_obj.get_value() == 0x10
+        assert write(sensor_obj, 0x11, result=None) == 1
+        assert sensor_obj.get_value() == 0x10
+        assert write(sensor_obj, 0x11) == 1
+        assert sensor_obj.get_value() == 0x11
+        # without throttle, any change is sent
+        sensor_obj.set_suppression(min_delta=4)
+        assert write(sensor_obj, 0x12) == 1
+
+    def test_throttled_writes(self):
+        sensor_obj = build_threshold_sensor(0x00, 0x01)
+        sensor_obj.set_mc(0x20)
+        sensor_obj.set_lun(0x00)
+        # unc readable at 0x40
+        sensor_obj.set_rtm(0x08)
+        sensor_obj.set_unc(0x40)
+        sensor_obj.set_suppression(min_delta=4, hysteresis=2)
+        assert write(sensor_obj, 0x30, True) == 1
+        assert write(sensor_obj, 0x33, True) == 0
+        assert write(sensor_obj, 0x34, True) == 1
+        # crossing unc by less than hysteresis is held back
+        assert write(sensor_obj, 0x41, True) == 0
+        # a held back reading is not shown either
+        assert sensor_obj.get_value() == 0x34
+        # crossing by hysteresis is sent, below min delta or not
+        assert write(sensor_obj, 0x42, True) == 1
+        assert write(sensor_obj, 0x44, True) == 0
+        assert sensor_obj.get_value() == 0x42
+        assert sensor_obj.get_suppressed() == 3
+
+        sensor_obj.set_suppression(max_rate=0.001)
+        assert write(sensor_obj, 0x20, True) == 0
+        assert write(sensor_obj, 0x20) == 1
+
+    def test_discrete_value_format(self):
+        assert parse_discrete_value("0xca10") == 0x10ca
+        assert format_discrete_value(0x10ca) == "0xca10"
+        self.assertRaises(ValueError, parse_discrete_value, "0xca1")
+        assert list(changed_states(0x10ca, 0x10ca)) == []
+        # state 15 is reserved
+        assert list(changed_states(0x0003, 0x8106)) == \
+            [(0, 0), (2, 1), (8, 1)]
+
+    def test_discrete_states_in_one_batch(self):
+        sensor_obj = Sensor("discrete_sample", 0x72, "0x0100", 0x05)
+        sensor_obj.set_event_type(0x6f)
+        sensor_obj.set_mc(0x20)
+        sensor_obj.set_lun(0x00)
+        assert sensor_obj.get_states() == 0x0001
+
+        batch = IPMI_SIM_Batch()
+        sensor_obj.set_states([(0, 1), (4, 1), (9, 1), (14, 0)], batch)
+        assert batch.commands == ["sensor_set_bit 0x20 0x0 0x72 4 1 0x1\n",
+                                  "sensor_set_bit 0x20 0x0 0x72 9 1 0x1\n"]
+        assert sensor_obj.get_value() == "0x1102"
+
+        batch = IPMI_SIM_Batch()
+        sensor_obj.set_discrete_value("0x1002", batch)
+        assert batch.commands == ["sensor_set_bit 0x20 0x0 0x72 0 0 0x1\n"]
+        self.assertRaises(ValueError, sensor_obj.set_states, [(15, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+import unittest
+import paramiko
+from infrasim import sshim
+from infrasim.console import IPMI_CONSOLE
+
+
+def read_until(channel, text, timeout=5):
+    output = ''
+    end = time.time() + timeout
+    while text not in output and time.time() < end:
+        if channel.recv_ready():
+            output += channel.recv(4096)
+        elif channel.exit_status_ready() or channel.closed:
+            break
+        else:
+            time.sleep(0.01)
+    return output
+
+
+class slow_console(IPMI_CONSOLE):
+    release = threading.Event()
+
+    @classmethod
+    def execute(cls, command):
+        cls.release.wait(10)
+        return IPMI_CONSOLE.execute(command)
+
+
+class test_ipmi_console_server(unittest.TestCase):
+
+    def setUp(self):
+        self.server = sshim.Server(IPMI_CONSOLE, address='127.0.0.1', port=0,
+                                   backlog=64, max_connections=4,
+                                   idle_timeout=1)
+        self.server.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.stop()
+
+    def open_shell(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect('127.0.0.1', port=self.server.port, username='',
+                       password='', look_for_keys=False, allow_agent=False)
+        self.clients.append(client)
+        channel = client.invoke_shell()
+        assert IPMI_CONSOLE.PROMPT in read_until(channel, IPMI_CONSOLE.PROMPT)
+        return channel
+
+    def test_command_and_quit(self):
+        channel = self.open_shell()
+        channel.send('help\r')
+        output = read_until(channel, 'quit/exit')
+        assert output.startswith('help\r\n')
+        assert 'Available commands:' in output
+        channel.send('quit\r')
+        assert 'Quit!' in read_until(channel, 'Quit!')
+
+    def test_pipeline_and_quit(self):
+        channel = self.open_shell()
+        channel.send('unknown; history; quit\r')
+        output = read_until(channel, 'Quit!')
+        assert '=== [1] unknown\r\nillegal command\r\n' in output
+        assert '=== 2 commands' in output
+        assert 'Quit!' in output
+
+    def test_sessions_are_independent(self):
+        channels = [self.open_shell() for i in range(3)]
+        for i, channel in enumerate(channels):
+            channel.send('unknown{}\r'.format(i))
+        for channel in channels:
+            output = read_until(channel, IPMI_CONSOLE.PROMPT)
+            assert output.count('illegal command') == 1
+        assert len(self.server.sessions) == 3
+
+    def test_non_ascii_input(self):
+        channel = self.open_shell()
+        other = self.open_shell()
+        channel.send('unknown\xff\r')
+        assert 'illegal command' in read_until(channel, 'illegal command')
+        # the server keeps serving every session
+        assert self.server.is_alive()
+        other.send('unknown\r')
+        assert 'illegal command' in read_until(other, 'illegal command')
+        channel.send('quit\r')
+        assert 'Quit!' in read_until(channel, 'Quit!')
+
+        stdin, stdout, stderr = self.clients[0].exec_command('unknown\xff')
+        assert 'illegal command' in stdout.read()
+
+    def test_fds_above_fd_setsize(self):
+        # sessions opened once over 1024 fds are taken still work
+        fds = []
+        try:
+            while len(fds) < 1100:
+                fds.append(os.open(os.devnull, os.O_RDONLY))
+        except OSError:
+            self.skipTest("not enough file descriptors")
+        try:
+            channel = self.open_shell()
+            channel.send('unknown\r')
+            assert 'illegal command' in read_until(channel, 'illegal command')
+            assert max(c.fileno() for c in self.server.sessions) >= 1024
+            assert self.server.is_alive()
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def test_exec_requests_leave_session_workers(self):
+        self.server.delegate = slow_console
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect('127.0.0.1', port=self.server.port, username='',
+                       password='', look_for_keys=False, allow_agent=False)
+        self.clients.append(client)
+        try:
+            # more long batches than there are workers
+            outputs = [client.exec_command('unknown')[1]
+                       for i in range(len(self.server.workers) + 1)]
+            channel = self.open_shell()
+            channel.send('unknown\r')
+            assert 'illegal command' in read_until(channel, 'illegal command')
+        finally:
+            slow_console.release.set()
+        for stdout in outputs:
+            assert 'illegal command' in stdout.read()
+
+    def test_exec_request(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect('127.0.0.1', port=self.server.port, username='',
+                       password='', look_for_keys=False, allow_agent=False)
+        self.clients.append(client)
+        stdin, stdout, stderr = client.exec_command('unknown\nhistory')
+        output = stdout.read()
+        assert output.startswith('=== [1] unknown\nillegal command\n')
+        assert output.endswith('=== 2 commands\n')
+        assert stdout.channel.recv_exit_status() == 0
+
+    def test_idle_session_closed(self):
+        channel = self.open_shell()
+        assert 'idle timeout' in read_until(channel, 'idle timeout', 3)
+
+    def test_connection_cap(self):
+        for i in range(4):
+            self.open_shell()
+        self.assertRaises(Exception, self.open_shell)
+
+
+class fake_channel(object):
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.recv_calls = 0
+
+    def recv(self, size):
+        self.recv_calls += 1
+        if not self.chunks:
+            return ''
+        return self.chunks.pop(0)
+
+
+class fake_channel_file(object):
+    def __init__(self, chunks):
+        self.channel = fake_channel(chunks)
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+class test_script_expect(unittest.TestCase):
+
+    def test_chunk_read_and_echoed_once(self):
+        fileobj = fake_channel_file(['sensor info 0x30\rsel g', 'et 0x30\r'])
+        script = sshim.Script(None, fileobj, None)
+        assert script.expect('sensor info 0x30') == 'sensor info 0x30'
+        assert fileobj.channel.recv_calls == 1
+        assert fileobj.writes == ['sensor info 0x30\r\nsel g']
+        assert script.expect('sel get 0x30') == 'sel get 0x30'
+        assert fileobj.channel.recv_calls == 2
+        assert fileobj.writes[1] == 'et 0x30\r\n'
+
+    def test_lines_read_ahead_are_kept(self):
+        fileobj = fake_channel_file(['help\rhistory\rquit\r'])
+        script = sshim.Script(None, fileobj, None)
+        for line in ['help', 'history', 'quit']:
+            assert script.expect(line) == line
+        assert fileobj.channel.recv_calls == 1
+        self.assertRaises(EOFError, script.expect, 'help')
+
+    def test_backspace_and_no_echo(self):
+        fileobj = fake_channel_file(['secrex\x7ft\r'])
+        script = sshim.Script(None, fileobj, None)
+        assert script.expect('secret', echo=False) == 'secret'
+        assert fileobj.writes == []
+
+
+class test_line_editor(unittest.TestCase):
+
+    def test_lines_and_echo(self):
+        editor = sshim.Line_Editor()
+        echo, items = editor.feed('sel\tx\x7f get 0x10\rhel')
+        assert echo == 'selx\b \b get 0x10\r\nhel'
+        assert items == [('line', 'sel get 0x10')]
+        echo, items = editor.feed('p\n')
+        assert items == [('line', 'help')]
+
+    def test_escape_split_across_chunks(self):
+        editor = sshim.Line_Editor()
+        assert editor.feed('ab\x1b') == ('ab', [])
+        assert editor.feed('[') == ('', [])
+        echo, items = editor.feed('Ac\r')
+        assert items == [('cursor', 'A'), ('line', 'abc')]
+
+    def test_end_of_input(self):
+        editor = sshim.Line_Editor()
+        echo, items = editor.feed('help\r\x04ignored')
+        assert items == [('line', 'help')]
+        assert editor.eof
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+import time
+import unittest
+from infrasim.ipmicons import common
+
+
+class fake_ipmi_sim(threading.Thread):
+    """
+    A minimal ipmi_sim console: print a prompt, answer each line,
+    print the prompt again. Lines starting with "bad" get an error,
+    lines starting with "slow" are answered after 0.3s.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.lines = []
+        self.connections = 0
+        self.drop_after = None
+
+    def serve(self, conn):
+        conn.sendall(common.IPMI_SIM_PROMPT)
+        buf = ''
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                break
+            buf += data
+            while '\n' in buf:
+                line, buf = buf.split('\n', 1)
+                self.lines.append(line)
+                if self.drop_after and len(self.lines) == self.drop_after:
+                    conn.close()
+                    return
+                if line.startswith('slow'):
+                    time.sleep(0.3)
+                if line.startswith('bad'):
+                    conn.sendall('**Invalid command: ' + line + '\n')
+                conn.sendall(common.IPMI_SIM_PROMPT)
+        conn.close()
+
+    def run(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            t = threading.Thread(target=self.serve, args=(conn,))
+            t.daemon = True
+            t.start()
+
+
+class test_ipmi_sim_connection(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fake_ipmi_sim()
+        self.server.start()
+        self.conn = common.IPMI_SIM_Connection(port=self.server.port,
+                                               timeout=2)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.sock.close()
+
+    def test_session_is_kept_open(self):
+        for i in range(0, 50):
+            assert self.conn.send("sensor_set_value 0x20 0x0 0x1 {} 0x01".
+                                  format(hex(i))) == ""
+        assert self.server.connections == 1
+        assert len(self.server.lines) == 50
+        assert self.conn.get_latency()["count"] == 50
+
+    def test_response_is_read_up_to_prompt(self):
+        result = self.conn.send("bad_command")
+        assert "**Invalid command: bad_command" in result
+
+    def test_reconnect_after_failure(self):
+        self.server.drop_after = 1
+        self.conn.send("sensor_set_value 0x20 0x0 0x1 0x1 0x01")
+        self.server.drop_after = None
+        assert self.conn.send("sensor_set_value 0x20 0x0 0x1 0x2 0x01") == ""
+        assert self.server.connections == 2
+        assert self.conn.get_latency()["reconnects"] == 1
+
+    def test_unreachable_console(self):
+        # a port bound but never listened on refuses connections; closing
+        # the server socket does not stop a blocked accept() in time
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        conn = common.IPMI_SIM_Connection(port=port, timeout=1)
+        assert conn.send("sensor_set_value 0x20 0x0 0x1 0x1 0x01") is None
+        assert conn.is_open() is False
+        # no latency of an earlier command is passed off as its own
+        pool = common.IPMI_SIM_Pool(size=1, port=port, timeout=1)
+        pool.acquire().last_latency = 0.5
+        pool.release(pool.connections[0])
+        assert pool.send("sensor_set_value 0x20 0x0 0x1 0x1 0x01") == \
+            (None, None)
+        pool.close()
+        sock.close()
+
+    def test_batch_one_result_per_command(self):
+        commands = ["sensor_set_value 0x20 0x0 {} 0x10 0x01".format(hex(i))
+                    for i in range(0, 600)]
+        commands[3] = "bad_command"
+        results = self.conn.send_batch(commands)
+        assert len(results) == 600
+        assert "**Invalid command" in results[3]
+        assert results[4] == ""
+        assert self.server.lines == [c.strip() for c in commands]
+        assert self.server.connections == 1
+
+    def test_batch_broken_session(self):
+        self.server.drop_after = 3
+        results = self.conn.send_batch(["sensor_set_bit 0x20 0x0 0x1 {} 1 0x1".
+                                        format(i) for i in range(0, 5)])
+        assert results[0:2] == ["", ""]
+        assert results[2:] == [None, None, None]
+
+    def test_batch_builder(self):
+        batch = common.IPMI_SIM_Batch()
+        batch.sensor_set_value(0x20, 0, 0x30, 0x28)
+        batch.sensor_set_bit(0x20, 0, 0x72, 4, 1)
+        batch.sel_add(0x20, 0x02, [0] * 13)
+        assert len(batch) == 3
+        assert batch.commands[0] == "sensor_set_value 0x20 0x0 0x30 0x28 0x1\n"
+        assert batch.commands[1] == "sensor_set_bit 0x20 0x0 0x72 4 1 0x1\n"
+        assert batch.commands[2].startswith("sel_add 0x20 0x2 0x0 0x0")
+
+    def test_batch_callbacks(self):
+        pool = common.ipmi_sim_pool
+        common.ipmi_sim_pool = common.IPMI_SIM_Pool(port=self.server.port,
+                                                    timeout=2)
+        try:
+            results = []
+            batch = common.IPMI_SIM_Batch()
+            batch.sensor_set_bit(0x20, 0, 0x72, 4, 1,
+                                 callback=results.append)
+            batch.add("bad", callback=results.append)
+            batch.submit()
+            assert results[0] == ""
+            assert "**Invalid command" in results[1]
+        finally:
+            common.ipmi_sim_pool.close()
+            common.ipmi_sim_pool = pool
+
+    def test_pool_runs_commands_in_parallel(self):
+        pool = common.IPMI_SIM_Pool(size=3, port=self.server.port, timeout=2)
+        threads = [threading.Thread(target=pool.send, args=("slow",))
+                   for i in range(0, 3)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert time.time() - start < 0.8
+        assert pool.get_latency()["sessions"] == 3
+        assert pool.get_latency()["count"] == 3
+        pool.close()
+
+    def test_pool_is_bounded(self):
+        pool = common.IPMI_SIM_Pool(size=2, port=self.server.port, timeout=2)
+        threads = [threading.Thread(target=pool.send, args=("slow",))
+                   for i in range(0, 4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert self.server.connections == 2
+        pool.close()
+
+    def test_pool_reserves_session_for_console(self):
+        pool = common.IPMI_SIM_Pool(size=2, reserved=1,
+                                    port=self.server.port, timeout=2)
+        background = [threading.Thread(target=pool.send,
+                                       args=("slow", True))
+                      for i in range(0, 3)]
+        for t in background:
+            t.start()
+        time.sleep(0.05)
+        # background updates hold at most one session
+        start = time.time()
+        result, latency = pool.send("sensor_set_value")
+        assert result == ""
+        assert time.time() - start < 0.2
+        for t in background:
+            t.join()
+        pool.close()
+
@@ -2,9 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
 import unittest
 import yaml
-from infrasim import ArgsNotCorrect
+from infrasim import ArgsNotCorrect, CommandRunFailed
 from infrasim import model
 from infrasim import socat
 from infrasim import VM_DEFAULT_CONFIG
@@ -699,3 +704,277 @@ class socat_configuration(unittest.TestCase):
 
         assert "pty,link=/etc/infrasim/pty0,waitslave" in cmd
         assert "udp-listen:9003,reuseaddr" in cmd
+
+
+class chassis_configuration(unittest.TestCase):
+
+    STEP_TIME = 0.2
+
+    def setUp(self):
+        # nodes that take STEP_TIME for each step, node-2 fails precheck
+        self.steps = []
+        self.methods = dict([(step, getattr(model.CNode, step)) for step in
+                             ("init", "precheck", "start", "stop")])
+        steps = self.steps
+
+        def fake_step(step):
+            def run(node_obj):
+                time.sleep(self.__class__.STEP_TIME)
+                if step == "precheck" and \
+                        node_obj.get_node_name() == "node-2":
+                    raise ArgsNotCorrect("no such port")
+                steps.append((step, node_obj.get_node_name()))
+            return run
+
+        for step in self.methods:
+            setattr(model.CNode, step, fake_step(step))
+
+    def tearDown(self):
+        for step, method in self.methods.items():
+            setattr(model.CNode, step, method)
+
+    def build_chassis(self, count):
+        nodes = [{"name": "node-{}".format(i),
+                  "type": "quanta_d51",
+                  "compute": {},
+                  "ipmi_console_port": 9000 + 10 * i,
+                  "bmc_connection_port": 9002 + 10 * i,
+                  "serial_port": 9003 + 10 * i,
+                  "monitor_port": 2345 + 10 * i} for i in range(0, count)]
+        return model.CChassis({"name": "chassis-0", "nodes": nodes})
+
+    def test_parallel_start(self):
+        chassis = self.build_chassis(20)
+        start = time.time()
+        assert chassis.init() == {}
+        failed = chassis.precheck()
+        assert failed.keys() == ["node-2"]
+        assert chassis.start() == {}
+        elapsed = time.time() - start
+        # three steps of 20 nodes take as long as three steps of one
+        assert elapsed < 4 * self.__class__.STEP_TIME
+        started = [name for step, name in self.steps if step == "start"]
+        assert len(started) == 19
+        assert "node-2" not in started
+        assert chassis.get_failed_nodes().keys() == ["node-2"]
+
+    def test_single_node(self):
+        chassis = self.build_chassis(3)
+        chassis.init()
+        assert chassis.stop("node-1") == {}
+        assert [s for s in self.steps if s[0] == "stop"] == \
+            [("stop", "node-1")]
+        try:
+            chassis.stop("node-9")
+        except ArgsNotCorrect, e:
+            assert "No node node-9" in str(e)
+        else:
+            assert False
+
+    def test_check_nodes(self):
+        chassis = model.CChassis({"name": "rack",
+                                  "nodes": [{"serial_port": 9013},
+                                            {"serial_port": 9023,
+                                             "ipmi_console_port": 9010,
+                                             "bmc_connection_port": 9012,
+                                             "monitor_port": 2355}]})
+        chassis.check_nodes()
+        chassis.init()
+        assert [n.get_node_name() for n in chassis.get_node_list()] == \
+            ["rack-node-0", "rack-node-1"]
+
+        for nodes, message in (
+                ([{"name": "a"}, {"name": "a", "serial_port": 9013}],
+                 "Node name a is used twice"),
+                ([{"name": "a"}, {"name": "b", "serial_port": 9013}],
+                 "Port 9000 of node b is used by node a already"),
+                # every qemu needs a monitor of its own
+                ([{"name": "a"}, {"name": "b", "ipmi_console_port": 9010,
+                                  "bmc_connection_port": 9012,
+                                  "serial_port": 9013}],
+                 "Port 2345 of node b is used by node a already"),
+                ([], "No nodes in chassis")):
+            chassis = model.CChassis({"nodes": nodes})
+            try:
+                chassis.init()
+            except ArgsNotCorrect, e:
+                assert message in str(e)
+            else:
+                assert False
+
+
+class readiness_probes(unittest.TestCase):
+
+    def test_wait_for(self):
+        start = time.time()
+        deadline = start + 0.2
+        assert model.Utility.wait_for(lambda: time.time() > deadline, 2)
+        # ready is noticed within the longest probe interval
+        assert time.time() - deadline < model.PROBE_INTERVAL_MAX + 0.05
+        start = time.time()
+        assert not model.Utility.wait_for(lambda: False, 0.2)
+        assert 0.2 <= time.time() - start < 0.3
+
+    def test_execute_command_ready(self):
+        path = os.path.join(tempfile.mkdtemp(), "ready")
+        start = time.time()
+        pid = model.Utility.execute_command(
+            "sh -c 'sleep 0.2; touch {}; sleep 5'".format(path),
+            ready=lambda pid: os.path.exists(path))
+        elapsed = time.time() - start
+        try:
+            assert model.Utility.is_process_alive(pid)
+            assert 0.2 <= elapsed < 0.5
+        finally:
+            os.kill(pid, 15)
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+
+    def test_execute_command_fails_fast(self):
+        log_path = os.path.join(tempfile.mkdtemp(), "task.log")
+        with open(log_path, "w") as f:
+            f.write("last run\n")
+        start = time.time()
+        try:
+            model.Utility.execute_command("sh -c 'echo no such device >&2; "
+                                          "exit 1'", log_path=log_path,
+                                          ready=lambda pid: False)
+        except CommandRunFailed, e:
+            assert e.output == "no such device\n"
+        else:
+            assert False
+        assert time.time() - start < 0.5
+        shutil.rmtree(os.path.dirname(log_path))
+
+        try:
+            model.Utility.execute_command("sh -c 'exit 2'",
+                                          ready=lambda pid: False)
+        except CommandRunFailed, e:
+            assert e.output == "exited with 2"
+        else:
+            assert False
+
+        try:
+            model.Utility.execute_command("sleep 5",
+                                          ready=lambda pid: False,
+                                          timeout=0.2)
+        except CommandRunFailed, e:
+            assert e.output == "not ready in 0.2s"
+        else:
+            assert False
+
+    def test_execute_command_output(self):
+        # more output than a pipe holds, long after the command started
+        log_path = os.path.join(tempfile.mkdtemp(), "task.log")
+        pid = model.Utility.execute_command(
+            "sh -c 'sleep 0.2; head -c 200000 /dev/zero; echo; "
+            "echo done; sleep 5'", log_path=log_path)
+        try:
+            assert model.Utility.wait_for(
+                lambda: open(log_path).read().endswith("done\n"), 2)
+            assert model.Utility.is_process_alive(pid)
+        finally:
+            os.kill(pid, 15)
+            shutil.rmtree(os.path.dirname(log_path))
+
+        # without a log, the output is dropped
+        path = os.path.join(tempfile.mkdtemp(), "done")
+        pid = model.Utility.execute_command(
+            "sh -c 'head -c 200000 /dev/zero; touch {}; sleep 5'".
+            format(path))
+        try:
+            assert model.Utility.wait_for(lambda: os.path.exists(path), 2)
+        finally:
+            os.kill(pid, 15)
+            shutil.rmtree(os.path.dirname(path))
+
+    def test_probe_port(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+
+        def greet():
+            conn, addr = server.accept()
+            conn.sendall("QEMU 2.6.0 monitor - type 'help'\r\n")
+            conn.close()
+
+        t = threading.Thread(target=greet)
+        t.start()
+        try:
+            assert model.Utility.probe_port(port, banner="QEMU")
+            t.join()
+            assert model.Utility.probe_port(port)
+        finally:
+            server.close()
+        assert not model.Utility.probe_port(port)
+
+    def test_compute_probes_own_monitor(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+
+        def greet():
+            conn, addr = server.accept()
+            conn.sendall("QEMU 2.6.0 monitor - type 'help'\r\n")
+            conn.close()
+
+        t = threading.Thread(target=greet)
+        t.daemon = True
+        t.start()
+        compute = model.CCompute({})
+        compute.set_port_monitor(port)
+        try:
+            # the monitor of another process is not this node's
+            assert not compute.is_ready(os.getppid())
+            assert not compute.is_ready("")
+            assert compute.is_ready(os.getpid())
+        finally:
+            server.close()
+
+    def test_terminate(self):
+        workspace = tempfile.mkdtemp()
+        task = model.CSocat()
+        task.set_task_name("probe-socat")
+        task.set_workspace(workspace)
+        pid = model.Utility.execute_command("sleep 5")
+        with open(os.path.join(workspace, ".probe-socat"), "w") as f:
+            f.write(str(pid))
+        start = time.time()
+        task.terminate()
+        assert time.time() - start < 0.5
+        assert not model.Utility.is_process_alive(pid)
+        assert task.get_task_pid() is None
+        os.rmdir(workspace)
+
+    def test_wait_for_file(self):
+        workspace = tempfile.mkdtemp()
+        task = model.Task()
+        task.set_task_name("probe-node")
+        task.set_workspace(workspace)
+        task.set_run_mask(True)
+        task.set_start_timeout(2)
+
+        def write_pid():
+            time.sleep(0.3)
+            with open(os.path.join(workspace, ".probe-node"), "w") as f:
+                f.write("1234\n")
+
+        t = threading.Thread(target=write_pid)
+        t.start()
+        start, cpu_start = time.time(), time.clock()
+        task.run()
+        elapsed, cpu = time.time() - start, time.clock() - cpu_start
+        t.join()
+        assert task.get_task_pid() == "1234"
+        # the pid is seen as soon as it is written, and blocking is free
+        assert 0.3 <= elapsed < 0.4
+        assert cpu < 0.05
+
+        os.remove(os.path.join(workspace, ".probe-node"))
+        start = time.time()
+        assert not model.Utility.wait_for_file(workspace, task.get_task_pid,
+                                               0.2)
+        assert 0.2 <= time.time() - start < 0.3
+        os.rmdir(workspace)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from infrasim import model, supervisor, ArgsNotCorrect
+
+
+class fake_task(model.Task):
+    def __init__(self, name, command, workspace):
+        super(fake_task, self).__init__()
+        self.set_task_name(name)
+        self.set_workspace(workspace)
+        self.command = command
+
+    def get_commandline(self):
+        return self.command
+
+
+class fake_node(object):
+    def __init__(self, name, tasks):
+        self.name = name
+        self.tasks = tasks
+
+    def get_node_name(self):
+        return self.name
+
+    def get_tasks(self):
+        return self.tasks
+
+
+def wait_for_state(node, task, state, old_pid=None):
+    def reached():
+        status = query_task(node, task)
+        return status["state"] == state and \
+            (old_pid is None or status["pid"] != old_pid)
+    return model.Utility.wait_for(reached, 3)
+
+
+def query_task(node, task):
+    return supervisor.query("status {}".format(node),
+                            test_supervisor.socket_path)["nodes"][node][task]
+
+
+class test_supervisor(unittest.TestCase):
+
+    socket_path = None
+
+    def setUp(self):
+        self.backoff = supervisor.RESTART_BACKOFF
+        supervisor.RESTART_BACKOFF = 0.05
+        self.workspace = tempfile.mkdtemp()
+        test_supervisor.socket_path = os.path.join(self.workspace, "sock")
+        self.processes = []
+
+    def tearDown(self):
+        supervisor.RESTART_BACKOFF = self.backoff
+        for proc in self.processes:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        shutil.rmtree(self.workspace)
+
+    def start_supervisor(self, nodes):
+        supervisor_obj = supervisor.Supervisor({}, self.socket_path)
+        supervisor_obj.load_nodes = lambda: nodes
+        supervisor_obj.start()
+        t = threading.Thread(target=supervisor_obj.serve)
+        t.daemon = True
+        t.start()
+        return supervisor_obj, t
+
+    def test_restart_and_status(self):
+        nodes = [(fake_node("node-{}".format(i),
+                            [fake_task("node-{}-socat".format(i), "sleep 30",
+                                       self.workspace),
+                             fake_task("node-{}-bmc".format(i), "sleep 30",
+                                       self.workspace)]),
+                  supervisor.RESTART_ON_FAILURE) for i in range(0, 3)]
+        supervisor_obj, t = self.start_supervisor(nodes)
+        try:
+            for i in range(0, 3):
+                assert wait_for_state("node-{}".format(i),
+                                      "node-{}-bmc".format(i), "running")
+            status = supervisor.query("status", self.socket_path)
+            assert sorted(status["nodes"].keys()) == \
+                ["node-0", "node-1", "node-2"]
+            socat = status["nodes"]["node-1"]["node-1-socat"]
+            bmc = status["nodes"]["node-1"]["node-1-bmc"]
+            # the bmc starts once socat runs
+            assert bmc["since"] >= socat["since"]
+            with open(os.path.join(self.workspace, ".node-1-bmc")) as f:
+                assert int(f.read()) == bmc["pid"]
+
+            # a crash is noticed and restarted at once
+            os.kill(bmc["pid"], signal.SIGKILL)
+            assert wait_for_state("node-1", "node-1-bmc", "running",
+                                  bmc["pid"])
+            bmc = query_task("node-1", "node-1-bmc")
+            assert bmc["restarts"] == 1
+            assert bmc["exit_code"] == -signal.SIGKILL
+            assert query_task("node-0", "node-0-bmc")["restarts"] == 0
+
+            assert supervisor.query("status node-9", self.socket_path) == \
+                {"error": "no node node-9"}
+            assert supervisor.query("bad", self.socket_path) == \
+                {"error": "unknown request bad"}
+            pids = [task["pid"] for node in
+                    supervisor.query("status", self.socket_path)["nodes"].
+                    values() for task in node.values()]
+        finally:
+            assert supervisor.query("stop", self.socket_path) == \
+                {"result": "stopping"}
+            t.join(5)
+        assert not t.is_alive()
+        assert not os.path.exists(self.socket_path)
+        assert [pid for pid in pids
+                if model.Utility.is_process_alive(pid)] == []
+
+    def test_restart_policy(self):
+        nodes = [(fake_node("node-0", [fake_task("node-0-ok", "true",
+                                                 self.workspace)]),
+                  supervisor.RESTART_ON_FAILURE),
+                 (fake_node("node-1", [fake_task("node-1-fail", "false",
+                                                 self.workspace)]),
+                  supervisor.RESTART_NEVER),
+                 (fake_node("node-2", [fake_task("node-2-fail", "false",
+                                                 self.workspace)]),
+                  supervisor.RESTART_ON_FAILURE)]
+        supervisor_obj, t = self.start_supervisor(nodes)
+        try:
+            assert wait_for_state("node-0", "node-0-ok", "exited")
+            assert wait_for_state("node-1", "node-1-fail", "exited")
+            assert query_task("node-1", "node-1-fail")["exit_code"] == 1
+            # restarts back off, 0.05, 0.1, 0.2, ... seconds
+            time.sleep(0.5)
+            restarts = query_task("node-2", "node-2-fail")["restarts"]
+            assert 2 <= restarts <= 4
+        finally:
+            supervisor_obj.stop()
+
+    def test_follow_masked_task(self):
+        qemu = fake_task("node-0-node", "", self.workspace)
+        qemu.set_run_mask(True)
+        nodes = [(fake_node("node-0", [qemu]), supervisor.RESTART_ON_FAILURE)]
+        supervisor_obj, t = self.start_supervisor(nodes)
+        try:
+            assert wait_for_state("node-0", "node-0-node", "off")
+            # started by someone else, as ipmi_sim starts qemu
+            proc = subprocess.Popen(["sleep", "30"])
+            self.processes.append(proc)
+            qemu.set_task_pid(proc.pid)
+            assert wait_for_state("node-0", "node-0-node", "running")
+            assert query_task("node-0", "node-0-node")["pid"] == proc.pid
+            # a crash leaves the pid file behind
+            proc.kill()
+            proc.wait()
+            assert wait_for_state("node-0", "node-0-node", "off")
+            assert query_task("node-0", "node-0-node")["restarts"] == 1
+
+            # a power off removes it, and is no restart
+            proc = subprocess.Popen(["sleep", "30"])
+            self.processes.append(proc)
+            qemu.set_task_pid(proc.pid)
+            assert wait_for_state("node-0", "node-0-node", "running")
+            qemu.set_task_pid(None)
+            proc.kill()
+            proc.wait()
+            assert wait_for_state("node-0", "node-0-node", "off")
+            assert query_task("node-0", "node-0-node")["restarts"] == 1
+        finally:
+            supervisor_obj.stop()
+
+    def test_stop_wakes_follow(self):
+        qemu = fake_task("node-0-node", "", self.workspace)
+        qemu.set_run_mask(True)
+        nodes = [(fake_node("node-0", [qemu]), supervisor.RESTART_ON_FAILURE)]
+        supervisor_obj, t = self.start_supervisor(nodes)
+        assert wait_for_state("node-0", "node-0-node", "off")
+        start = time.time()
+        supervisor_obj.stop()
+        assert time.time() - start < supervisor.FOLLOW_TIMEOUT / 10.0
+        assert supervisor_obj.get_status()["node-0"]["node-0-node"]\
+            ["state"] == "stopped"
+
+    def test_start_failure_leaves_no_socket(self):
+        def load_nodes():
+            raise ArgsNotCorrect("bad node")
+        supervisor_obj = supervisor.Supervisor({}, self.socket_path)
+        supervisor_obj.load_nodes = load_nodes
+        self.assertRaises(ArgsNotCorrect, supervisor_obj.start)
+        assert not os.path.exists(self.socket_path)